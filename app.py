@@ -1,18 +1,42 @@
 import json
 import requests
-from groq import Groq
 from datetime import datetime
 import os
-import speech_recognition as sr
-import edge_tts
-import asyncio
-import io
+import importlib
 # --- ADDED: Import session from Flask ---
-from flask import Flask, request, jsonify, render_template, Response, session, redirect, url_for
+from flask import Flask, request, jsonify, render_template, Response, session, redirect, url_for, g, make_response
 from dotenv import load_dotenv
 import functools # For async wrapper
-from pydub import AudioSegment
 import secrets # --- ADDED: For generating a default secret key ---
+import math
+import time
+import threading
+from weather_cache import WeatherCache, WeatherRefresher
+from http_client import OutboundClient
+from speech_pipeline import SentenceSplitter, pipelined_audio
+from async_runtime import AsyncRuntime
+from tts_cache import TTSCache
+from conversation_store import create_conversation_store
+from context_builder import ContextBuilder, count_tokens, MESSAGE_OVERHEAD_TOKENS
+from metrics import REGISTRY as METRICS_REGISTRY, StatsCollector
+from pipeline import TurnTrace
+from transcoder import TranscoderPool, TranscodeError, ffmpeg_available, TARGET_SAMPLE_RATE, TARGET_SAMPLE_WIDTH
+from voice_stream import VoiceStream, SilenceTrimmer
+from stt_engines import create_stt_router
+from movie_index import MovieIndex, tokenize
+from places import PlaceIndex, load_places
+from model_router import ModelRouter, first_chunk, close_stream
+from llm_scheduler import LLMScheduler, LLMOverloadedError, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND, per_worker_quota
+from turns import TurnRegistry, TurnCancelled
+from response_cache import ResponseCache
+
+try:
+    from flask_sock import Sock # --- ADDED: WebSocket support for streaming voice input ---
+except ImportError:
+    Sock = None
+
+# Load API keys and settings from the .env file once, before anything below reads them
+load_dotenv()
 
 # --- Flask App Setup ---
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -25,10 +49,33 @@ app = Flask(
     static_folder=STATIC_DIR
 )
 
-# --- ADDED: Secret Key for Sessions ---
-app.secret_key = os.getenv("FLASK_SECRET_KEY", secrets.token_hex(16))
-if app.secret_key == secrets.token_hex(16): # Check if using the generated default
-    print("Warning: Using a generated default FLASK_SECRET_KEY. Set a persistent secret key in your .env file for production.")
+# --- ADDED: Secret Key for Sessions (must be the same in every worker process) ---
+def load_secret_key():
+    """FLASK_SECRET_KEY, else a key generated once and kept in a file so every worker and restart agrees."""
+    secret = os.getenv("FLASK_SECRET_KEY")
+    if secret:
+        return secret
+    path = os.getenv("FLASK_SECRET_KEY_FILE", os.path.join(BASE_DIR, ".flask_secret_key"))
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        for _ in range(100): # Another worker may be writing it right now
+            with open(path) as f:
+                secret = f.read().strip()
+            if secret:
+                return secret
+            time.sleep(0.01)
+        raise RuntimeError(f"Secret key file {path} is empty; delete it or set FLASK_SECRET_KEY")
+    except OSError as e:
+        print(f"Warning: Could not create {path} ({e}); using a per-process FLASK_SECRET_KEY, so sessions won't survive across workers.")
+        return secrets.token_hex(32)
+    secret = secrets.token_hex(32)
+    with os.fdopen(fd, "w") as f:
+        f.write(secret)
+    print(f"Warning: FLASK_SECRET_KEY is not set; generated one in {path}. Set a persistent secret key in your .env file for production.")
+    return secret
+
+app.secret_key = load_secret_key()
 
 # --- Configuration and Constants ---
 # --- REMOVED: Global LATITUDE/LONGITUDE are no longer primary, defaults used instead ---
@@ -79,8 +126,7 @@ STATE_COORDINATES = {
 # --- END ADDED State Coordinates ---
 
 
-# Load API keys from .env file
-load_dotenv()
+# API keys (.env was loaded at the top)
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 TMDB_API_KEY = os.getenv("TMDB_API_KEY")
 
@@ -91,87 +137,280 @@ if not TMDB_API_KEY:
 if not GROQ_API_KEY:
     print("Error: GROQ_API_KEY not found in environment variables. AI functionality will fail.")
 
-# --- MODIFIED: get_weather now takes coordinates ---
-def get_weather(latitude, longitude):
-    """Fetches weather data for the given latitude and longitude."""
-    # Use the provided lat/lon in the API URL
-    url = f"https://api.open-meteo.com/v1/forecast?latitude={latitude}&longitude={longitude}&daily=temperature_2m_max,temperature_2m_min,precipitation_sum&current_weather=true&timezone=auto"
-    try:
-        response = requests.get(url)
-        response.raise_for_status() # Check for HTTP errors
-        data = response.json()
+WEATHER_API_URL = os.getenv("WEATHER_API_URL", "https://api.open-meteo.com/v1/forecast")
+TMDB_API_URL = os.getenv("TMDB_API_URL", "https://api.themoviedb.org/3")
+WEATHER_CONDITIONS = {
+     0: "Clear sky", 1: "Mainly clear", 2: "Partly cloudy", 3: "Overcast",
+     45: "Fog", 48: "Rime fog", 51: "Light drizzle", 53: "Moderate drizzle", 55: "Dense drizzle",
+     61: "Light rain", 63: "Moderate rain", 65: "Heavy rain", 71: "Light snow", 73: "Moderate snow",
+     75: "Heavy snow", 80: "Light showers", 81: "Moderate showers", 82: "Heavy showers",
+     95: "Thunderstorms", 96: "Thunderstorms with hail"
+}
+WEATHER_UNAVAILABLE = ("Unavailable", "Unavailable", "Unavailable", "Unavailable", "Unavailable")
+WEATHER_ERROR = ("Error", "Error", "Error", "Error", "Error")
+
+# --- ADDED: Shared outbound HTTP client (pooled sessions, timeouts, retries, circuit breaker) ---
+outbound = OutboundClient(
+    connect_timeout=float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05")),
+    read_timeout=float(os.getenv("HTTP_READ_TIMEOUT", "10")),
+    retries=int(os.getenv("HTTP_RETRIES", "2")),
+    pool_size=int(os.getenv("HTTP_POOL_SIZE", "10")),
+    failure_threshold=int(os.getenv("HTTP_BREAKER_FAILURES", "5")),
+    reset_timeout=float(os.getenv("HTTP_BREAKER_RESET", "30")),
+)
+
+# --- ADDED: Weather cache settings (seconds) ---
+WEATHER_CACHE_TTL = int(os.getenv("WEATHER_CACHE_TTL", "600"))
+WEATHER_CACHE_STALE_TTL = int(os.getenv("WEATHER_CACHE_STALE_TTL", "1800"))
+WEATHER_PREFETCH_ENABLED = os.getenv("WEATHER_PREFETCH", "1") != "0"
+# Open-Meteo bills every location of a bulk request as one call, and each worker prefetches for itself.
+# By default the refresh comes just before prefetched cells would expire, for the state centres only
+# ("all" adds every known city, "default" only the default location).
+WEATHER_PREFETCH_INTERVAL = int(os.getenv("WEATHER_PREFETCH_INTERVAL",
+                                          str(max(WEATHER_CACHE_TTL + WEATHER_CACHE_STALE_TTL - 60, 60))))
+WEATHER_PREFETCH_PLACES = os.getenv("WEATHER_PREFETCH_PLACES", "states")
+WEATHER_GRID_DEGREES = float(os.getenv("WEATHER_GRID_DEGREES", "0.1")) # ~11 km cells shared by nearby users
+
 
-        current_weather = data.get("current_weather", {})
-        daily_data = data.get("daily", {})
+def _weather_url(latitudes, longitudes):
+    return (f"{WEATHER_API_URL}?latitude={latitudes}&longitude={longitudes}"
+            "&daily=temperature_2m_max,temperature_2m_min,precipitation_sum&current_weather=true&timezone=auto")
 
-        temp = current_weather.get("temperature", "N/A")
-        weather_code = current_weather.get("weathercode", -1)
-         # Today's rain chance (assuming first value is today)
-        rain_chance = daily_data.get("precipitation_sum", [None])[0]
-        temp_max = daily_data.get("temperature_2m_max", [None])[0]
-        temp_min = daily_data.get("temperature_2m_min", [None])[0]
 
-        weather_conditions = {
-             0: "Clear sky", 1: "Mainly clear", 2: "Partly cloudy", 3: "Overcast",
-             45: "Fog", 48: "Rime fog", 51: "Light drizzle", 53: "Moderate drizzle", 55: "Dense drizzle",
-             61: "Light rain", 63: "Moderate rain", 65: "Heavy rain", 71: "Light snow", 73: "Moderate snow",
-             75: "Heavy snow", 80: "Light showers", 81: "Moderate showers", 82: "Heavy showers",
-             95: "Thunderstorms", 96: "Thunderstorms with hail"
-        }
-        weather = weather_conditions.get(weather_code, "Unknown")
+def _parse_weather(data):
+    """Turns one Open-Meteo location payload into the weather tuple used by the prompt."""
+    current_weather = data.get("current_weather", {})
+    daily_data = data.get("daily", {})
 
-        # Handle potential None values
-        rain_chance = rain_chance if rain_chance is not None else "N/A"
-        temp_max = temp_max if temp_max is not None else "N/A"
-        temp_min = temp_min if temp_min is not None else "N/A"
+    temp = current_weather.get("temperature", "N/A")
+    weather_code = current_weather.get("weathercode", -1)
+     # Today's rain chance (assuming first value is today)
+    rain_chance = daily_data.get("precipitation_sum", [None])[0]
+    temp_max = daily_data.get("temperature_2m_max", [None])[0]
+    temp_min = daily_data.get("temperature_2m_min", [None])[0]
 
-        return temp, weather, rain_chance, temp_max, temp_min
+    weather = WEATHER_CONDITIONS.get(weather_code, "Unknown")
+
+    # Handle potential None values
+    rain_chance = rain_chance if rain_chance is not None else "N/A"
+    temp_max = temp_max if temp_max is not None else "N/A"
+    temp_min = temp_min if temp_min is not None else "N/A"
+
+    return temp, weather, rain_chance, temp_max, temp_min
+
+
+# --- MODIFIED: fetch_weather always hits Open-Meteo; use get_weather for cached lookups ---
+def fetch_weather(latitude, longitude):
+    """Fetches weather data for the given latitude and longitude."""
+    # Use the provided lat/lon in the API URL
+    url = _weather_url(latitude, longitude)
+    try:
+        response = outbound.get(url)
+        response.raise_for_status() # Check for HTTP errors
+        return _parse_weather(response.json())
 
     except requests.exceptions.RequestException as e:
         print(f"Error fetching weather for {latitude},{longitude}: {e}")
-        return "Unavailable", "Unavailable", "Unavailable", "Unavailable", "Unavailable"
+        return WEATHER_UNAVAILABLE
     except Exception as e:
         print(f"Error processing weather data for {latitude},{longitude}: {e}")
-        return "Error", "Error", "Error", "Error", "Error"
-# --- END MODIFIED get_weather ---
+        return WEATHER_ERROR
 
-def get_movies(query, platform=None):
-    # ... (get_movies function remains the same) ...
-    if not TMDB_API_KEY:
-        return ["Error: TMDB API Key not configured"]
 
-    url = f"https://api.themoviedb.org/3/search/movie?api_key={TMDB_API_KEY}&query={query}&language=en-US"
+def fetch_weather_bulk(coordinates):
+    """Fetches weather for many (lat, lon) pairs in a single multi-location Open-Meteo call."""
+    if not coordinates:
+        return []
+    latitudes = ",".join(str(lat) for lat, _ in coordinates)
+    longitudes = ",".join(str(lon) for _, lon in coordinates)
     try:
-        response = requests.get(url)
+        response = outbound.get(_weather_url(latitudes, longitudes))
         response.raise_for_status()
         data = response.json()
-        movies_data = data.get("results", [])
+        # A single location comes back as an object, several as a list in request order
+        payloads = data if isinstance(data, list) else [data]
+        if len(payloads) != len(coordinates):
+            print(f"Weather bulk fetch returned {len(payloads)} results for {len(coordinates)} locations")
+            return [WEATHER_ERROR] * len(coordinates)
+        return [_parse_weather(payload) for payload in payloads]
 
-        if platform:
-            platform_lower = platform.lower()
-            movies = [m for m in movies_data if platform_lower in m.get("title", "").lower() or platform_lower in m.get("overview", "").lower()]
-        else:
-            movies = movies_data
+    except requests.exceptions.RequestException as e:
+        print(f"Error bulk fetching weather for {len(coordinates)} locations: {e}")
+        return [WEATHER_UNAVAILABLE] * len(coordinates)
+    except Exception as e:
+        print(f"Error processing bulk weather data: {e}")
+        return [WEATHER_ERROR] * len(coordinates)
 
-        return [m.get("title", "Unknown Title") for m in movies[:4]]
 
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching movies: {e}")
-        return ["Error fetching movie data"]
+weather_cache = WeatherCache(fetch_weather, ttl=WEATHER_CACHE_TTL, stale_ttl=WEATHER_CACHE_STALE_TTL,
+                             cell_degrees=WEATHER_GRID_DEGREES)
+
+# --- ADDED: Nearest known city/state for browser coordinates (KD-tree built once at startup) ---
+PLACE_NEAR_KM = float(os.getenv("PLACE_NEAR_KM", "50")) # Further than this, the prompt says "near <place>"
+place_index = PlaceIndex(load_places(STATE_COORDINATES, os.getenv("PLACES_FILE")))
+
+
+def get_weather(latitude, longitude):
+    """Returns weather for the coordinates from the shared cache (fetching on a miss)."""
+    return weather_cache.get(latitude, longitude)
+
+
+def weather_prefetch_places(which=WEATHER_PREFETCH_PLACES):
+    """Known places whose weather is prefetched: "states", "all" or "default" (none besides the default location)."""
+    if which == "all":
+        return list(place_index.places)
+    if which == "default":
+        return []
+    if which != "states":
+        print(f"Warning: Unknown WEATHER_PREFETCH_PLACES {which!r}; prefetching state centres.")
+    return [p for p in place_index.places if p.kind == "state"]
+
+
+def start_weather_prefetch():
+    """Fetches the default location and the prefetched places' cells now, then keeps them fresh in the background."""
+    coordinates = [weather_cache.key(DEFAULT_LATITUDE, DEFAULT_LONGITUDE),
+                   *(weather_cache.key(p.latitude, p.longitude) for p in weather_prefetch_places())]
+    refresher = WeatherRefresher(weather_cache, fetch_weather_bulk, coordinates, WEATHER_PREFETCH_INTERVAL)
+    daily_calls = len(refresher.coordinates) * 86400 // WEATHER_PREFETCH_INTERVAL
+    print(f"🌦️ Weather prefetch: {len(refresher.coordinates)} locations every {WEATHER_PREFETCH_INTERVAL}s, "
+          f"~{daily_calls} Open-Meteo calls/day for this worker")
+    try:
+        refresher.refresh_once()
+    except Exception as e:
+        print(f"Error during weather prefetch: {e}")
+    refresher.start()
+    return refresher
+# --- END MODIFIED weather ---
+
+# --- ADDED: Cached + indexed TMDB lookups, used to ground movie recommendations ---
+MOVIE_CACHE_TTL = int(os.getenv("MOVIE_CACHE_TTL", str(6 * 3600)))
+MOVIE_CACHE_QUERIES = int(os.getenv("MOVIE_CACHE_QUERIES", "512"))
+MOVIE_RECOMMENDATIONS = 4 # The persona gives exactly 4
+
+MOVIE_INTENT_WORDS = {"movie", "movies", "film", "films", "cinema", "flick", "flicks"}
+STREAMING_PLATFORMS = {"netflix", "prime", "hotstar", "disney", "zee5", "sonyliv", "jiocinema", "hulu"}
+WATCH_WORDS = {"watch", "dekhu", "dekhna", "dekhni", "dekhe", "suggest", "recommend", "binge"}
+MOVIE_GENRES = { # TMDB genre ids
+    "action": 28, "adventure": 12, "animated": 16, "animation": 16, "comedy": 35, "crime": 80,
+    "documentary": 99, "drama": 18, "family": 10751, "fantasy": 14, "horror": 27, "mystery": 9648,
+    "romance": 10749, "romantic": 10749, "scifi": 878, "thriller": 53, "war": 10752,
+}
+MOVIE_FILLER_WORDS = {
+    "a", "an", "the", "some", "any", "good", "best", "great", "new", "latest", "top", "me", "my", "i", "to",
+    "on", "in", "for", "of", "with", "like", "about", "watch", "see", "suggest", "recommend", "recommendation",
+    "recommendations", "please", "pls", "can", "you", "tell", "give", "show", "what", "which", "should",
+    "koi", "kuch", "acchi", "achhi", "achi", "badhiya", "batao", "bata", "bolo", "dekhu", "dekhni", "dekhna",
+    "dekhe", "hai", "hain", "ho", "kya", "konsi", "kaunsi", "ek", "do", "char", "pe", "par", "mein", "binge",
+    "na", "yaar", "bhai", "bro", "aaj", "tonight", "today", "video", "wali", "waali", "jaisi", "type",
+}
+
+
+def fetch_tmdb_movies(query):
+    """TMDB results for a title search, a genre ("genre:<id>") or the popular list ("popular")."""
+    if query == "popular":
+        url, params = f"{TMDB_API_URL}/movie/popular", {}
+    elif query.startswith("genre:"):
+        url, params = f"{TMDB_API_URL}/discover/movie", {"with_genres": query[6:], "sort_by": "popularity.desc"}
+    else:
+        url, params = f"{TMDB_API_URL}/search/movie", {"query": query}
+    params.update(api_key=TMDB_API_KEY, language="en-US")
+    response = outbound.get(url, params=params)
+    response.raise_for_status()
+    return response.json().get("results", [])
+
+movie_index = MovieIndex(fetch_tmdb_movies, ttl=MOVIE_CACHE_TTL, max_queries=MOVIE_CACHE_QUERIES)
+
+
+def parse_movie_request(user_text):
+    """Returns (query, platform) if the message asks about movies, else None."""
+    tokens = tokenize(user_text)
+    platform = next((t for t in tokens if t in STREAMING_PLATFORMS), None)
+    # A platform name alone ("prime minister") isn't enough; it needs a watch word with it
+    if not MOVIE_INTENT_WORDS.intersection(tokens) and not (platform and WATCH_WORDS.intersection(tokens)):
+        return None
+    genre = next((MOVIE_GENRES[t] for t in tokens if t in MOVIE_GENRES), None)
+    if genre:
+        return f"genre:{genre}", platform
+    remaining = [t for t in tokens if t not in MOVIE_INTENT_WORDS | STREAMING_PLATFORMS | MOVIE_FILLER_WORDS]
+    return (" ".join(remaining) if remaining else "popular"), platform
+
+
+def get_movie_context(user_text):
+    """TMDB picks to inject into the system prompt for movie requests (None otherwise)."""
+    movie_request = parse_movie_request(user_text)
+    if not movie_request or not TMDB_API_KEY:
+        return None
+    query, platform = movie_request
+    try:
+        movies = movie_index.search(query, platform, MOVIE_RECOMMENDATIONS)
+        if not movies and query != "popular": # Leftover words didn't match a title
+            movies = movie_index.search("popular", platform, MOVIE_RECOMMENDATIONS)
     except Exception as e:
-        print(f"Error processing movie data: {e}")
-        return ["Error processing movie data"]
+        print(f"Error fetching movie suggestions: {e}")
+        return None
+    if not movies:
+        return None
+    print(f"🎬 Movie picks for '{query}': {', '.join(m['title'] for m in movies)}")
+    lines = [f"- {m['title']} ({(m.get('release_date') or '')[:4] or 'n/a'}, rated {m.get('vote_average') or 0:.1f}/10)"
+             for m in movies]
+    note = f" Whether they are on {platform.title()} is not verified, so don't promise that." if platform else ""
+    return ("Movie picks from TMDB for this message — recommend these and don't invent other titles." + note + "\n"
+            + "\n".join(lines))
+
+
+# Upper bound on history messages sent verbatim per turn; older ones are folded into the summary
+HISTORY_LOAD_LIMIT = int(os.getenv("HISTORY_LOAD_LIMIT", "60"))
+
+# --- ADDED: Server-side conversation store; the cookie only carries a session id ---
+conversation_store = create_conversation_store(
+    backend=os.getenv("CONVERSATION_STORE", "sqlite"),
+    path=os.getenv("CONVERSATION_DB_PATH", os.path.join(BASE_DIR, "conversations.db")),
+    max_messages_per_session=int(os.getenv("CONVERSATION_MAX_MESSAGES", "200")),
+    cache_sessions=int(os.getenv("CONVERSATION_CACHE_SESSIONS", "1024")),
+)
+
 
+def get_session_id():
+    """Returns the current user's conversation id, creating one on first use."""
+    session_id = session.get('sid')
+    if not session_id:
+        session_id = secrets.token_urlsafe(16)
+        session['sid'] = session_id
+    # One-time migration of history left in an old cookie session
+    legacy_history = session.pop('conversation_history', None)
+    if legacy_history:
+        conversation_store.append(session_id, legacy_history)
+    return session_id
 
-# --- MODIFIED: Load history from Flask Session ---
+
+# --- MODIFIED: Load history from the conversation store ---
 def load_memory():
-    """Loads conversation history from the current user's session."""
-    return session.get('conversation_history', [])
+    """Loads the session's stored history (bounded by CONVERSATION_MAX_MESSAGES), so older turns can be folded."""
+    return conversation_store.load(get_session_id())
+
+# --- MODIFIED: Append one turn to the conversation store ---
+def save_turn(user_text, ai_response_text, session_id=None, generation=None):
+    """Appends a user/assistant exchange to the session's history (refused if ``generation`` is stale)."""
+    conversation_store.append(session_id or get_session_id(), [
+        {"role": "user", "content": user_text},
+        {"role": "assistant", "content": ai_response_text},
+    ], generation)
 
-# --- MODIFIED: Save history to Flask Session ---
-def save_memory(conversation_history):
-    """Saves conversation history to the current user's session."""
-    session['conversation_history'] = conversation_history
+
+# --- ADDED: One in-flight turn per session; a newer turn or a history clear cancels the older one ---
+turn_registry = TurnRegistry(conversation_store) # Generations in the store reach every worker
+CANCELLED_REPLY = "Superseded by a newer request."
+
+
+def begin_turn(kind):
+    """Registers this request as the session's in-flight turn, cancelling the one it supersedes."""
+    return turn_registry.begin(get_session_id(), kind)
+
+
+def cancelled_response(error, trace):
+    """409 for a turn that was cancelled: nothing was saved and no audio is synthesized."""
+    print(f"⏹️ Turn stopped: {error}")
+    return make_response(jsonify({"error": CANCELLED_REPLY, "cancelled": True, "reason": error.reason}), 409)
 
 
 def get_current_time():
@@ -179,70 +418,182 @@ def get_current_time():
 
 # --- Modified/New Functions for Web ---
 
+# --- ADDED: Single background event loop for all async work (edge-tts etc.) ---
+async_runtime = AsyncRuntime(blocking_workers=int(os.getenv("ASYNC_RUNTIME_BLOCKING_WORKERS", "32")))
+
 def run_async(func):
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        return asyncio.run(func(*args, **kwargs))
+        return async_runtime.run(func(*args, **kwargs))
     return wrapper
 
 # --- MODIFIED: Default gender set to male ---
-async def generate_speech_data(text, gender='male'): # Default set to male
-    voice = "en-IN-PrabhatNeural"   # Default to male voice
+TTS_RATE = "+12%" # You can adjust rate
+TTS_MAX_PARALLEL_SENTENCES = int(os.getenv("TTS_MAX_PARALLEL_SENTENCES", "3"))
+
+# --- ADDED: Canned replies (pre-synthesized into the TTS cache at startup) ---
+ERROR_REPLY = "Sorry, I encountered an error trying to respond."
+VOICE_ERROR_REPLY = "Sorry, I encountered an error."
+STT_FAILED_REPLY = "Sorry, I couldn't understand the audio."
+BUSY_REPLY = "Bhai, abhi bahut rush hai. Thodi der mein phir try kar!"
+CANNED_REPLIES = (ERROR_REPLY, VOICE_ERROR_REPLY, STT_FAILED_REPLY, BUSY_REPLY)
+
+# --- ADDED: TTS audio cache (memory LRU + optional disk tier) ---
+tts_cache = TTSCache(
+    max_bytes=int(os.getenv("TTS_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+    disk_dir=os.getenv("TTS_CACHE_DIR") or None,
+)
+
+# --- ADDED: Exact-match reply cache for opening turns (the audio is then a TTS cache hit) ---
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024")),
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL", "1800")),
+    variants=int(os.getenv("RESPONSE_CACHE_VARIANTS", "3")),
+    max_history_messages=int(os.getenv("RESPONSE_CACHE_MAX_HISTORY", "0")), # 0: only turns with no history
+    max_words=int(os.getenv("RESPONSE_CACHE_MAX_WORDS", "12")),
+    time_bucket_minutes=int(os.getenv("RESPONSE_CACHE_TIME_BUCKET_MINUTES", "60")),
+    enabled=os.getenv("RESPONSE_CACHE", "1") != "0",
+)
+
+
+def get_voice(gender='male'):
     if gender == 'female':          # Switch to female only if requested
-        voice = "en-IN-NeerjaNeural"
+        return "en-IN-NeerjaNeural"
+    return "en-IN-PrabhatNeural"   # Default to male voice
+
+
+async def stream_speech_chunks(text, gender='male'):
+    """Yields MP3 chunks for the text, from the TTS cache when possible, else as edge-tts produces them."""
+    voice = get_voice(gender)
+    cache_key = TTSCache.make_key(text, voice, TTS_RATE)
+    cached_audio = tts_cache.get(cache_key)
+    if cached_audio is not None:
+        yield cached_audio
+        return
+
+    import edge_tts # Deferred so text-only workers never load the TTS stack
+    audio_chunks = []
+    communicate = edge_tts.Communicate(text, voice, rate=TTS_RATE)
+    async for chunk in communicate.stream():
+        if chunk["type"] == "audio":
+            audio_chunks.append(chunk["data"])
+            yield chunk["data"]
+    # Only reached when the whole utterance was synthesized
+    tts_cache.put(cache_key, b"".join(audio_chunks))
 
-    communicate = edge_tts.Communicate(text, voice, rate="+12%") # You can adjust rate
-    audio_data = b""
+
+async def generate_speech_data(text, gender='male'): # Default set to male
+    audio_chunks = [] # Joined once at the end instead of re-copying on every chunk
     try:
-        async for chunk in communicate.stream():
-            if chunk["type"] == "audio":
-                audio_data += chunk["data"]
-        return audio_data
+        async for data in stream_speech_chunks(text, gender):
+            audio_chunks.append(data)
+        return b"".join(audio_chunks)
     except Exception as e:
         print(f"❌ Error in TTS generation: {e}")
         return None
 
-def recognize_audio_data(audio_data):
-    """Recognizes speech from audio data bytes. Handles WebM conversion."""
-    # ... (recognize_audio_data function remains the same) ...
-    recognizer = sr.Recognizer()
-    try:
-        # Convert WebM to WAV
-        audio_segment = AudioSegment.from_file(io.BytesIO(audio_data), format="webm")
-        wav_data = io.BytesIO()
-        audio_segment.export(wav_data, format="wav")
-        wav_data.seek(0)
-
-        with sr.AudioFile(wav_data) as source:
-            print("🎙️ Processing received audio...")
-            audio = recognizer.record(source)
-            user_text = recognizer.recognize_google(audio)
-            print(f"Recognized Text: {user_text}")
-            return user_text
-
-    except sr.UnknownValueError:
-        print("Could not understand audio.")
-        return None
-    except sr.RequestError as e:
-        print(f"Could not request results from Google Speech Recognition service; {e}")
+def prewarm_tts_cache():
+    """Pre-synthesizes the canned replies for both voices on the async runtime (non-blocking)."""
+    return [async_runtime.submit(generate_speech_data(text, gender))
+            for gender in ('male', 'female') for text in CANNED_REPLIES]
+
+# --- ADDED: Pooled decoder workers (WAV/PCM fast path, no pydub WAV round trip) ---
+transcoder = TranscoderPool(
+    workers=int(os.getenv("TRANSCODER_WORKERS", "2")),
+    timeout=float(os.getenv("TRANSCODER_TIMEOUT", "15")),
+)
+
+# --- ADDED: Pluggable STT engines, tried in STT_ENGINES order (e.g. "local,google") ---
+stt_router = create_stt_router(
+    order=os.getenv("STT_ENGINES", "google"),
+    queue_timeout=float(os.getenv("STT_QUEUE_TIMEOUT", "2")),
+    timeout=float(os.getenv("STT_TIMEOUT", "15")),
+    google_concurrency=int(os.getenv("STT_GOOGLE_CONCURRENCY", "8")),
+    local_model=os.getenv("STT_LOCAL_MODEL", "base.en"),
+    local_workers=int(os.getenv("STT_LOCAL_WORKERS", "2")),
+    stub_text=os.getenv("STT_STUB_TEXT", "hello naru"),
+)
+
+# --- ADDED: Silence trimming before STT (smaller payloads; silent clips never reach the recognizer) ---
+silence_trimmer = SilenceTrimmer(
+    min_threshold=int(os.getenv("VAD_MIN_THRESHOLD", "300")),
+    pad_ms=int(os.getenv("VAD_PAD_MS", "200")),
+    max_pause_ms=int(os.getenv("VAD_MAX_PAUSE_MS", "500")),
+    enabled=os.getenv("VAD_ENABLED", "1") != "0",
+)
+
+
+def recognize_pcm(pcm, sample_rate=TARGET_SAMPLE_RATE, sample_width=TARGET_SAMPLE_WIDTH):
+    """Recognizes speech from 16-bit mono PCM."""
+    print("🎙️ Processing received audio...")
+    trimmed = silence_trimmer.trim(pcm, sample_rate)
+    if not trimmed.has_speech:
+        print("🔇 No speech detected; skipping speech recognition.")
         return None
-    except Exception as e:
-        print(f"Error processing audio data: {e}")
-        if "ffmpeg" in str(e).lower() or "Couldn't find ffmpeg" in str(e):
-             print("ERROR: Pydub couldn't find ffmpeg. Make sure ffmpeg is installed and in your system's PATH.")
+    user_text = stt_router.transcribe(trimmed.pcm, sample_rate, sample_width)
+    if user_text:
+        print(f"Recognized Text: {user_text}")
+    else:
+        print("Could not understand audio.")
+    return user_text
+
+def recognize_audio_data(audio_data, content_type=None):
+    """Recognizes speech from audio data bytes. Handles WebM/Ogg decoding, WAV/PCM pass straight through."""
+    try:
+        decoded = transcoder.decode(audio_data, content_type)
+    except TranscodeError as e:
+        print(f"Error decoding audio data: {e}")
         return None
+    return recognize_pcm(decoded.pcm, decoded.sample_rate, decoded.sample_width)
 
 
-# --- Groq Client Initialization ---
-client = None
-if GROQ_API_KEY:
+# --- Groq Client Initialization (lazy: the SDK is imported on first use or during warm-up) ---
+def create_groq_client():
+    """Builds this process's Groq client (its connection pool can't be shared across a fork)."""
+    if not GROQ_API_KEY:
+        print("Groq client not initialized because GROQ_API_KEY is missing.")
+        return None
     try:
-        client = Groq(api_key=GROQ_API_KEY)
+        from groq import Groq
+        groq_client = Groq(api_key=GROQ_API_KEY, max_retries=0) # llm_scheduler owns retries
         print("Groq client initialized successfully.")
+        return groq_client
     except Exception as e:
         print(f"Error initializing Groq client: {e}")
-else:
-    print("Groq client not initialized because GROQ_API_KEY is missing.")
+        return None
+
+client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """This process's Groq client, created on first call; None if it can't be built."""
+    global client
+    if client is None and GROQ_API_KEY:
+        with _client_lock:
+            if client is None:
+                client = create_groq_client()
+    return client
+
+
+def groq_retryable_errors():
+    """Resolved by llm_scheduler on the first failed call, so importing app.py doesn't import groq."""
+    from groq import RateLimitError, InternalServerError, APIConnectionError
+    return (RateLimitError, InternalServerError, APIConnectionError)
+
+# --- ADDED: Admission control in front of Groq (RPM/TPM quota buckets, bounded priority queue) ---
+LLM_MAX_TOKENS = 500
+# The Groq quota is per account, so each of WEB_CONCURRENCY worker processes gets an equal share
+WORKER_PROCESSES = max(int(os.getenv("WEB_CONCURRENCY", "1")), 1)
+llm_scheduler = LLMScheduler(
+    requests_per_minute=per_worker_quota(int(os.getenv("GROQ_RPM", "30")), WORKER_PROCESSES, "GROQ_RPM"),
+    tokens_per_minute=per_worker_quota(int(os.getenv("GROQ_TPM", "6000")), WORKER_PROCESSES, "GROQ_TPM"),
+    max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+    max_queue=int(os.getenv("LLM_QUEUE_SIZE", "32")),
+    queue_timeout=float(os.getenv("LLM_QUEUE_TIMEOUT", "10")),
+    max_retries=int(os.getenv("LLM_MAX_RETRIES", "2")),
+    retryable=groq_retryable_errors,
+)
 
 
 # --- MODIFIED: Character Profile with Instructions for Short Responses ---
@@ -270,10 +621,39 @@ Tera kaam hai help karna — lekin mazaa ke sath. Tu conversation mein spice daa
 
 
 
+def parse_coordinates(source):
+    """(lat, lon) from a request's latitude/longitude fields, or None if missing or out of range."""
+    try:
+        lat, lon = float(source.get('latitude')), float(source.get('longitude'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+    if -90 <= lat <= 90 and -180 <= lon <= 180: # Also rejects NaN
+        return lat, lon
+    return None
+
+
+def resolve_place_name(lat, lon):
+    """Display name of the nearest known place, e.g. "Pune, Maharashtra"."""
+    place, distance_km = place_index.nearest(lat, lon)
+    if place is None:
+        return f"{lat:.2f}, {lon:.2f}"
+    if distance_km > PLACE_NEAR_KM:
+        return f"near {place.display_name} (~{distance_km:.0f} km away)"
+    return place.display_name
+
+
 # --- Helper Function to get context based on state ---
-def get_location_context(selected_state_name):
-    """Gets coordinates and formatted location name for the system prompt."""
-    if not selected_state_name or selected_state_name.lower() == "select state":
+def get_location_context(selected_state_name, coordinates=None):
+    """Gets coordinates and formatted location name for the system prompt.
+
+    A state picked from the dropdown wins; otherwise browser coordinates are resolved to the
+    nearest known place, and weather is looked up for the user's own grid cell.
+    """
+    if (not selected_state_name or selected_state_name.lower() == "select state") and coordinates:
+        lat, lon = coordinates
+        location_display_name = resolve_place_name(lat, lon)
+        print(f"Using browser location ({lat:.3f}, {lon:.3f}): {location_display_name}")
+    elif not selected_state_name or selected_state_name.lower() == "select state":
          # Use default if no state is selected or it's the placeholder
         lat = DEFAULT_LATITUDE
         lon = DEFAULT_LONGITUDE
@@ -300,6 +680,64 @@ def get_location_context(selected_state_name):
 # --- End Helper Function ---
 
 
+# --- ADDED: Shared system prompt builder ---
+def build_system_prompt(location_context, movie_context=None):
+    """Builds the persona + time + location/weather system prompt from get_location_context() output."""
+    location_name, temp, weather, rain_chance, temp_max, temp_min = location_context
+    prompt = (
+        f"{get_character_profile()}\n"
+        f"Current Time: {get_current_time()}\n"
+        f"Current Location Context: {location_name}\n"
+        f"Current Temperature: {temp}°C\nWeather: {weather}\n"
+        f"Chance of rain today: {rain_chance} mm\nMax temperature today: {temp_max}°C\nMin temperature today: {temp_min}°C"
+    )
+    if movie_context:
+        prompt += f"\n{movie_context}"
+    return prompt
+
+
+# --- ADDED: Token-budgeted context window with rolling summary of older turns ---
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "llama3-8b-8192")
+CONTEXT_SUMMARY_MAX_TOKENS = int(os.getenv("CONTEXT_SUMMARY_MAX_TOKENS", "300"))
+
+
+def summarize_history(previous_summary, messages):
+    """Folds older messages (and the previous summary) into a short summary using a small model."""
+    if not get_client():
+        return None
+    transcript = "\n".join(f"{'User' if m['role'] == 'user' else 'Naru'}: {m['content']}" for m in messages)
+    if previous_summary:
+        transcript = f"Summary so far: {previous_summary}\n\nNew messages:\n{transcript}"
+    completion = llm_scheduler.call(lambda: get_client().chat.completions.create(
+        model=SUMMARY_MODEL,
+        messages=[
+            {"role": "system", "content": (
+                "Summarize this chat between a user and the assistant Naru in under 120 words. "
+                "Keep names, preferences, facts the user shared and open questions. Plain text, no lists."
+            )},
+            {"role": "user", "content": transcript},
+        ],
+        temperature=0.2,
+        max_tokens=CONTEXT_SUMMARY_MAX_TOKENS,
+    ), PRIORITY_BACKGROUND, count_tokens(transcript) + CONTEXT_SUMMARY_MAX_TOKENS + 60)
+    return completion.choices[0].message.content.strip()
+
+
+context_builder = ContextBuilder(
+    conversation_store,
+    summarize_history,
+    budget=int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000")),
+    summary_max_tokens=CONTEXT_SUMMARY_MAX_TOKENS,
+    min_fold_messages=int(os.getenv("CONTEXT_MIN_FOLD_MESSAGES", "4")),
+    max_window_messages=HISTORY_LOAD_LIMIT,
+)
+
+
+def build_messages(system_prompt, conversation_history, user_text, session_id=None):
+    """Builds the Groq messages list within the configured token budget."""
+    return context_builder.build(session_id or get_session_id(), system_prompt, conversation_history, user_text)
+
+
 # --- Flask Routes ---
 
 @app.route('/')
@@ -307,13 +745,236 @@ def index():
     """Renders the main chat page."""
     # --- ADDED: Pass states to the template ---
     states_list = ["Select State"] + sorted([s.title() for s in STATE_COORDINATES.keys()])
+    get_session_id() # Issue the session cookie now; WebSocket handshakes can't set one
     return render_template('index.html', states=states_list)
     # --- END ADDED ---
 
+# --- ADDED: Unified turn pipeline shared by /chat, /voice_input and the streaming endpoints ---
+# Stages: stt -> history_load -> weather -> prompt -> llm -> history_save -> tts -> encode
+LLM_MODEL = os.getenv("LLM_MODEL", "llama3-70b-8192")
+TRACE_HEADERS_ENABLED = os.getenv("TRACE_HEADERS", "0") == "1"
+
+
+def start_trace(endpoint):
+    """Starts timing the current request; the stage breakdown is recorded in after_request."""
+    g.trace = TurnTrace(endpoint)
+    return g.trace
+
+
+@app.after_request
+def finish_trace(response):
+    trace = g.pop('trace', None)
+    if trace is not None:
+        # For streamed responses this is time-to-headers; their stages are recorded as they finish
+        total = trace.finish(response.status_code)
+        if TRACE_HEADERS_ENABLED or request.headers.get('X-Trace') == '1':
+            response.headers['Server-Timing'] = trace.server_timing(total)
+    return response
+
+
+def prepare_turn(user_text, selected_state, trace, coordinates=None):
+    """Runs the stages before the LLM call and returns (session_id, messages, response cache key or None)."""
+    # --- Update session with the new state or browser location if provided (the latest one wins) ---
+    if selected_state:
+        session['selected_state'] = selected_state
+        session.pop('coordinates', None)
+        print(f"Updated session state to: {selected_state}")
+    elif coordinates:
+        session['coordinates'] = [round(coordinates[0], 4), round(coordinates[1], 4)]
+        session.pop('selected_state', None)
+
+    with trace.stage("history_load"):
+        session_id = get_session_id()
+        conversation_history = load_memory()
+    print(f"Loaded history for current session: {len(conversation_history)} messages")
+
+    with trace.stage("weather"):
+        location_context = get_location_context(session.get('selected_state'), session.get('coordinates'))
+
+    with trace.stage("movies"):
+        movie_context = get_movie_context(user_text)
+
+    with trace.stage("prompt"):
+        system_prompt = build_system_prompt(location_context, movie_context)
+        messages = build_messages(system_prompt, conversation_history, user_text, session_id)
+    return session_id, messages, response_cache.make_key(user_text, location_context, conversation_history)
+
+
+def audio_response(audio_data, text, status=200):
+    """Builds an MP3 response carrying the reply text in the X-Response-Text header."""
+    response = Response(audio_data, status=status, mimetype='audio/mpeg')
+    sanitized_text_for_header = ''.join(c for c in text if ord(c) < 128).replace('\n', ' ')
+    try:
+        header_value = sanitized_text_for_header.encode('latin-1', 'ignore').decode('latin-1')
+        response.headers['X-Response-Text'] = header_value
+    except Exception as header_e:
+        print(f"Warning: Could not set X-Response-Text header: {header_e}")
+        response.headers['X-Response-Text'] = "Response generated."
+    return response
+
+
+def speak_error(error_message, voice_gender, status, trace):
+    """Returns the spoken error reply (or JSON if TTS fails too)."""
+    with trace.stage("tts"):
+        error_audio = async_runtime.run(generate_speech_data(error_message, voice_gender))
+    with trace.stage("encode"):
+        if error_audio:
+            return audio_response(error_audio, error_message, status)
+        return make_response(jsonify({"error": error_message}), status)
+
+
+def estimate_llm_tokens(messages, max_tokens=LLM_MAX_TOKENS):
+    """Worst-case tokens for a completion: the prompt plus the full completion budget."""
+    return sum(count_tokens(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in messages) + max_tokens
+
+
+def admit_llm_call(messages, trace, max_tokens=LLM_MAX_TOKENS):
+    """Waits for an LLM slot (recorded as the "llm_queue" stage); raises LLMOverloadedError."""
+    with trace.stage("llm_queue"):
+        return llm_scheduler.acquire(PRIORITY_INTERACTIVE, estimate_llm_tokens(messages, max_tokens))
+
+
+# --- ADDED: Model routing (small model for banter, 70B for detail) with optional hedged requests ---
+model_router = ModelRouter(
+    small_model=os.getenv("LLM_SMALL_MODEL", "llama3-8b-8192"),
+    large_model=LLM_MODEL,
+    small_max_tokens=int(os.getenv("LLM_SMALL_MAX_TOKENS", "200")),
+    large_max_tokens=LLM_MAX_TOKENS,
+    enabled=os.getenv("LLM_ROUTING", "1") != "0",
+    hedge_delay=float(os.getenv("LLM_HEDGE_DELAY", "0")), # Seconds; 0 disables hedging
+    hedge_model=os.getenv("LLM_HEDGE_MODEL") or None,
+)
+
+
+def route_turn(user_text, messages, trace):
+    """Routes the turn to a model and admits its LLM call: returns (route, ticket)."""
+    route = model_router.route(user_text)
+    print(f"🧭 Routed to {route.model} ({route.reason}, max_tokens={route.max_tokens})")
+    return route, admit_llm_call(messages, trace, route.max_tokens)
+
+
+def _hedge_ticket(messages, route):
+    """A second LLM slot for a hedge, only if one is free right now."""
+    try:
+        return llm_scheduler.acquire(PRIORITY_INTERACTIVE, estimate_llm_tokens(messages, route.max_tokens), timeout=0)
+    except LLMOverloadedError:
+        return None
+
+
+def open_reply_stream(messages, route, ticket):
+    """Streaming completion on the routed model; when hedged, the first stream to produce a chunk wins."""
+    def opener(model, model_ticket):
+        return model_router.timed(model, lambda: first_chunk(lambda: llm_scheduler.stream(
+            lambda: get_client().chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=route.max_tokens,
+                stream=True,
+            ), model_ticket)), kind="first_token")
+
+    def make_backup():
+        hedge_ticket = _hedge_ticket(messages, route)
+        return opener(model_router.hedge_model or route.model, hedge_ticket) if hedge_ticket else None
+
+    (stream, head), winner = model_router.hedged(opener(route.model, ticket), make_backup, discard=close_stream)
+    if winner == "hedge":
+        print("🏁 Hedged stream answered first.")
+    return _reply_chunks(head, stream)
+
+
+def _reply_chunks(head, stream):
+    """The winning stream with its first chunk put back; closing it closes the stream and frees its LLM slot."""
+    try:
+        if head is not None:
+            yield head
+        yield from stream
+    finally:
+        stream.close()
+
+
+def collect_reply(messages, route, ticket, turn):
+    """Streams the reply into a string, stopping as soon as the turn is cancelled."""
+    turn.llm_budget = route.max_tokens
+    if turn.cancelled:
+        llm_scheduler.release(ticket) # Cancelled while queued: hand the slot straight back
+        turn.check()
+    parts = []
+    stream = open_reply_stream(messages, route, ticket)
+    try:
+        for chunk in stream:
+            turn.check()
+            if chunk.choices:
+                parts.append(chunk.choices[0].delta.content or '')
+    finally:
+        turn.llm_tokens = count_tokens(''.join(parts))
+        ticket.used_tokens = estimate_llm_tokens(messages, turn.llm_tokens)
+        stream.close() # Drops the upstream request if the turn was cancelled mid-reply
+    return ''.join(parts)
+
+
+def busy_response(error, voice_gender, trace, spoken=True):
+    """Fast 503 when the LLM scheduler is saturated (the spoken reply is pre-synthesized)."""
+    print(f"🚦 LLM overloaded, shedding request: {error}")
+    if spoken:
+        response = speak_error(BUSY_REPLY, voice_gender, 503, trace)
+    else:
+        response = make_response(jsonify({"error": BUSY_REPLY}), 503)
+    response.headers['Retry-After'] = str(max(int(math.ceil(error.retry_after or 1)), 1))
+    return response
+
+
+def run_turn(user_text, voice_gender, selected_state, trace, turn, error_message=ERROR_REPLY, coordinates=None):
+    """Runs one full turn (context -> prompt -> LLM -> TTS -> history -> response).
+
+    ``turn`` is checked between stages; once it is cancelled the LLM stream is closed, the
+    TTS job is cancelled and nothing is written to the history.
+    """
+    try:
+        turn.enter("context")
+        session_id, messages, reply_key = prepare_turn(user_text, selected_state, trace, coordinates)
+        ai_response_text = response_cache.get(reply_key)
+        if ai_response_text is not None:
+            print("♻️ Reply served from the response cache.")
+        else:
+            route, ticket = route_turn(user_text, messages, trace)
+            turn.stage = "llm" # collect_reply checks for cancellation and hands the slot back
+            with trace.stage("llm"):
+                ai_response_text = collect_reply(messages, route, ticket, turn).replace('*', '') # Remove markdown asterisks
+            response_cache.put(reply_key, ai_response_text)
+        print(f"🤖 Naru (Console Output): {ai_response_text}")
+
+        turn.enter("tts")
+        turn.reply_chars = len(ai_response_text)
+        with trace.stage("tts"):
+            audio_data = turn.wait(async_runtime.submit(generate_speech_data(ai_response_text, voice_gender)))
+
+        turn.enter("history_save")
+        with trace.stage("history_save"): # Only now: a turn cancelled earlier leaves no trace in the history
+            turn.commit(lambda: save_turn(user_text, ai_response_text, session_id, turn.generation))
+
+        turn.stage = "respond"
+        with trace.stage("encode"):
+            if audio_data:
+                print(f"🗣️ Sending audio response ({len(audio_data)} bytes) with text header.")
+                return audio_response(audio_data, ai_response_text)
+            print("🔊 TTS failed, sending JSON text response.")
+            return jsonify({"response_text": ai_response_text})
+
+    except TurnCancelled as e:
+        return cancelled_response(e, trace)
+    except LLMOverloadedError as e:
+        return busy_response(e, voice_gender, trace)
+    except Exception as e:
+        print(f"Error during AI processing or TTS: {e}")
+        return speak_error(error_message, voice_gender, 500, trace)
+
+
 @app.route('/chat', methods=['POST'])
 def chat_handler():
-    """Handles incoming chat messages (text). Uses session for history and state."""
-    if not client:
+    """Handles incoming chat messages (text). Uses the conversation store for history and session for state."""
+    trace = start_trace("chat")
+    if not get_client():
         return jsonify({"error": "AI Client not initialized. Check API Key."}), 500
 
     data = request.json
@@ -325,93 +986,221 @@ def chat_handler():
     if not user_input:
         return jsonify({"error": "No message provided"}), 400
 
-    # --- ADDED: Update session with the new state if provided ---
-    if selected_state_from_request:
-        session['selected_state'] = selected_state_from_request
-        print(f"Updated session state to: {selected_state_from_request}")
-    # --- Retrieve current state from session (might be the one just set) ---
-    current_state_in_session = session.get('selected_state')
+    turn = begin_turn("chat")
+    try:
+        return run_turn(user_input, voice_gender, selected_state_from_request, trace, turn,
+                        coordinates=parse_coordinates(data))
+    finally:
+        turn_registry.finish(turn)
 
-    # --- Load history from user's session ---
-    conversation_history = load_memory()
-    print(f"Loaded history for current session: {len(conversation_history)} messages")
 
-    # --- Get Context using the current state from the session ---
-    location_name, temp, weather, rain_chance, temp_max, temp_min = get_location_context(current_state_in_session)
-    current_time = get_current_time()
-    character_profile = get_character_profile()
+# --- ADDED: Token streaming endpoint (Server-Sent Events) ---
+def _sse_event(payload, event=None):
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(payload)}\n\n"
 
-    # --- Prepare messages for Groq (using dynamic location) ---
-    system_prompt = (
-        f"{character_profile}\n"
-        f"Current Time: {current_time}\n"
-        # --- MODIFIED: Use dynamic location name ---
-        f"Current Location Context: {location_name}\n"
-        f"Current Temperature: {temp}°C\nWeather: {weather}\n"
-        f"Chance of rain today: {rain_chance} mm\nMax temperature today: {temp_max}°C\nMin temperature today: {temp_min}°C"
-    )
 
-    messages = [
-        {"role": "system", "content": system_prompt},
-        *conversation_history, # Unpack session history
-        {"role": "user", "content": user_input}
-    ]
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream_handler():
+    """Streams the reply token by token as SSE; history is committed only when the stream finishes."""
+    trace = start_trace("chat_stream")
+    if not get_client():
+        return jsonify({"error": "AI Client not initialized. Check API Key."}), 500
 
-    try:
-        # --- Call Groq API ---
-        completion = client.chat.completions.create(
-            model="llama3-70b-8192",
-            messages=messages,
-            temperature=0.7,
-            max_tokens=500,
-        )
-        ai_response_text = completion.choices[0].message.content
-        ai_response_text = ai_response_text.replace('*', '') # Remove markdown asterisks
+    data = request.json
+    user_input = data.get('message')
+    selected_state_from_request = data.get('selected_state')
 
-        # --- Update and Save History IN SESSION ---
-        conversation_history.append({"role": "user", "content": user_input})
-        conversation_history.append({"role": "assistant", "content": ai_response_text})
-        MAX_HISTORY = 20
-        if len(conversation_history) > MAX_HISTORY:
-            conversation_history = conversation_history[-MAX_HISTORY:]
-        save_memory(conversation_history)
+    if not user_input:
+        return jsonify({"error": "No message provided"}), 400
 
-        # --- Generate Speech ---
-        audio_data = asyncio.run(generate_speech_data(ai_response_text, voice_gender))
+    # Resolved now: the generator runs after the request context is gone
+    turn = begin_turn("chat_stream")
+    turn.stage = "context"
+    try:
+        session_id, messages, _ = prepare_turn(user_input, selected_state_from_request, trace, parse_coordinates(data))
+        route, ticket = route_turn(user_input, messages, trace) # Before the 200 goes out, so overload is still a 503
+    except LLMOverloadedError as e:
+        turn_registry.finish(turn)
+        return busy_response(e, None, trace, spoken=False)
+    except Exception as e:
+        print(f"Error preparing streamed turn: {e}")
+        turn_registry.finish(turn)
+        return jsonify({"error": ERROR_REPLY}), 500
+
+    def generate():
+        parts = []
+        llm_started = time.perf_counter()
+        turn.stage = "llm"
+        turn.llm_budget = route.max_tokens
+        stream = None
+        try:
+            turn.check()
+            stream = open_reply_stream(messages, route, ticket)
+            for chunk in stream:
+                turn.check()
+                if not chunk.choices:
+                    continue
+                token = (chunk.choices[0].delta.content or '').replace('*', '') # Same markdown stripping as /chat
+                if token:
+                    if not parts:
+                        trace.record("llm_first_token", time.perf_counter() - llm_started)
+                    parts.append(token)
+                    yield _sse_event({"token": token})
+            trace.record("llm", time.perf_counter() - llm_started)
+
+            ai_response_text = ''.join(parts)
+            ticket.used_tokens = estimate_llm_tokens(messages, count_tokens(ai_response_text))
+            turn.stage = "history_save"
+            with trace.stage("history_save"):
+                turn.commit(lambda: save_turn(user_input, ai_response_text, session_id, turn.generation))
+        except TurnCancelled as e:
+            print(f"⏹️ Stream stopped: {e}")
+            yield _sse_event({"error": CANCELLED_REPLY, "reason": e.reason}, event="cancelled")
+            return
+        except Exception as e:
+            print(f"Error during streamed AI processing: {e}")
+            yield _sse_event({"error": ERROR_REPLY}, event="error")
+            return
+        finally:
+            turn.llm_tokens = count_tokens(''.join(parts))
+            if stream is not None:
+                stream.close() # Frees the LLM slot right away when cancelled mid-stream
+            llm_scheduler.release(ticket)
+            turn_registry.finish(turn)
+        print(f"🤖 Naru (Streamed): {ai_response_text}")
+        yield _sse_event({"response_text": ai_response_text}, event="done")
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.call_on_close(lambda: llm_scheduler.release(ticket)) # In case the stream never started
+    response.call_on_close(lambda: turn_registry.finish(turn))
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no' # Stop reverse proxies from buffering the stream
+    return response
+
+
+# --- ADDED: Sentence-pipelined TTS: audio starts while the LLM is still generating ---
+@app.route('/chat/audio_stream', methods=['POST'])
+def chat_audio_stream_handler():
+    """Streams MP3 audio sentence by sentence as the reply is generated (chunked response)."""
+    trace = start_trace("chat_audio_stream")
+    if not get_client():
+        return jsonify({"error": "AI Client not initialized. Check API Key."}), 500
 
-        print(f"🤖 Naru (Console Output): {ai_response_text}")
+    data = request.json
+    user_input = data.get('message')
+    voice_gender = data.get('voice_gender', 'male')
+    selected_state_from_request = data.get('selected_state')
 
-        if audio_data:
-            print(f"🗣️ Sending audio response ({len(audio_data)} bytes) with text header.")
-            response = Response(audio_data, mimetype='audio/mpeg')
-            sanitized_text_for_header = ''.join(c for c in ai_response_text if ord(c) < 128).replace('\n', ' ')
-            try:
-                header_value = sanitized_text_for_header.encode('latin-1', 'ignore').decode('latin-1')
-                response.headers['X-Response-Text'] = header_value
-            except Exception as header_e:
-                print(f"Warning: Could not set X-Response-Text header: {header_e}")
-                response.headers['X-Response-Text'] = "Response generated."
-            return response
-        else:
-            print("🔊 TTS failed, sending JSON text response.")
-            return jsonify({"response_text": ai_response_text})
+    if not user_input:
+        return jsonify({"error": "No message provided"}), 400
 
+    turn = begin_turn("chat_audio_stream")
+    turn.stage = "context"
+    try:
+        session_id, messages, _ = prepare_turn(user_input, selected_state_from_request, trace, parse_coordinates(data))
+        route, ticket = route_turn(user_input, messages, trace)
+    except LLMOverloadedError as e:
+        turn_registry.finish(turn)
+        return busy_response(e, voice_gender, trace)
     except Exception as e:
-        print(f"Error during AI processing or TTS: {e}")
-        error_message = "Sorry, I encountered an error trying to respond."
-        error_audio = asyncio.run(generate_speech_data(error_message, voice_gender))
-        if error_audio:
-            error_response = Response(error_audio, mimetype='audio/mpeg')
-            error_response.headers['X-Response-Text'] = error_message
-            return error_response, 500
-        else:
-            return jsonify({"error": error_message}), 500
+        print(f"Error preparing pipelined turn: {e}")
+        turn_registry.finish(turn)
+        return speak_error(ERROR_REPLY, voice_gender, 500, trace)
+    reply = {}
+    producer = {"started": False}
+
+    def generate_sentences():
+        # Runs on a worker thread: blocking Groq stream in, sentences out
+        producer["started"] = True
+        splitter = SentenceSplitter()
+        parts = []
+        llm_started = time.perf_counter()
+        turn.stage = "llm"
+        turn.llm_budget = route.max_tokens
+        if turn.cancelled:
+            llm_scheduler.release(ticket)
+            return
+        stream = open_reply_stream(messages, route, ticket)
+        try:
+            for chunk in stream:
+                if turn.cancelled:
+                    return # Closing the stream below frees the LLM slot; the audio loop stops too
+                if not chunk.choices:
+                    continue
+                token = (chunk.choices[0].delta.content or '').replace('*', '')
+                parts.append(token)
+                yield from splitter.feed(token)
+        finally:
+            turn.llm_tokens = count_tokens(''.join(parts))
+            ticket.used_tokens = estimate_llm_tokens(messages, turn.llm_tokens)
+            stream.close()
+        yield from splitter.flush()
+        trace.record("llm", time.perf_counter() - llm_started)
+
+        reply["text"] = ''.join(parts)
+        turn.stage = "tts"
+        turn.reply_chars = len(reply["text"])
+        print(f"🤖 Naru (Audio stream): {reply['text']}")
+
+    def synthesize(sentence):
+        return stream_speech_chunks(sentence, voice_gender)
+
+    sentences = generate_sentences()
+
+    def stop_producer():
+        """Closes the sentence generator, whose Groq stream holds the LLM slot until it is closed."""
+        try:
+            sentences.close()
+        except ValueError:
+            pass # Mid-next() on a worker thread: the pipeline closes it once that returns
+        if not producer["started"]:
+            llm_scheduler.release(ticket) # Never opened a stream that would release it
+
+    def generate_audio():
+        tts_started = time.perf_counter()
+        audio = async_runtime.iterate(lambda: pipelined_audio(sentences, synthesize, TTS_MAX_PARALLEL_SENTENCES))
+        delivered = False
+        try:
+            for index, data in enumerate(audio):
+                if turn.cancelled:
+                    print(f"⏹️ Audio stream stopped: turn cancelled ({turn.reason})")
+                    break
+                if index == 0:
+                    trace.record("tts_first_audio", time.perf_counter() - tts_started)
+                yield data
+            else:
+                delivered = "text" in reply
+        except GeneratorExit:
+            # The client went away: stop generating, and don't save a reply it never heard
+            turn_registry.cancel_turn(turn, "client_disconnected")
+            raise
+        except Exception as e:
+            print(f"Error during pipelined AI processing or TTS: {e}")
+        finally:
+            audio.close() # Cancels any synthesis still running
+            stop_producer()
+            if delivered:
+                try:
+                    with trace.stage("history_save"):
+                        turn.commit(lambda: save_turn(user_input, reply["text"], session_id, turn.generation))
+                except TurnCancelled:
+                    pass
+            turn_registry.finish(turn)
+        trace.record("tts", time.perf_counter() - tts_started)
+
+    response = Response(generate_audio(), mimetype='audio/mpeg')
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.call_on_close(stop_producer) # In case the audio never started
+    response.call_on_close(lambda: turn_registry.finish(turn))
+    return response
 
 
 @app.route('/voice_input', methods=['POST'])
 def voice_input_handler():
-    """Handles uploaded voice data. Uses session for history and state."""
-    if not client: return jsonify({"error": "AI Client not initialized."}), 500
+    """Handles uploaded voice data. Uses the conversation store for history and session for state."""
+    trace = start_trace("voice_input")
+    if not get_client(): return jsonify({"error": "AI Client not initialized."}), 500
 
     if 'audio_data' not in request.files:
         return jsonify({"error": "No audio data found"}), 400
@@ -423,105 +1212,153 @@ def voice_input_handler():
     selected_state_from_request = request.form.get('selected_state') # e.g., "Tamil Nadu"
     voice_gender = request.form.get('voice_gender', 'male')
 
-    user_text = recognize_audio_data(audio_bytes)
+    turn = begin_turn("voice_input")
+    try:
+        with trace.stage("stt"):
+            user_text = recognize_audio_data(audio_bytes, audio_file.mimetype)
+
+        if not user_text:
+            # STT failed
+            print(f"👂 STT failed.")
+            return speak_error(STT_FAILED_REPLY, voice_gender, 400, trace) # Bad request
+
+        return run_turn(user_text, voice_gender, selected_state_from_request, trace, turn,
+                        error_message=VOICE_ERROR_REPLY, coordinates=parse_coordinates(request.form))
+    finally:
+        turn_registry.finish(turn)
+
+
+# --- ADDED: Streaming voice input over WebSocket ---
+# Protocol: client sends {"type": "start", "format": "webm"|"pcm", "sample_rate", "voice_gender",
+# "selected_state", optionally "latitude"/"longitude"}, then binary audio chunks while the user speaks, then {"type": "stop"}.
+# The server may end the utterance earlier on trailing silence ({"type": "endpoint"}). It then
+# sends {"type": "transcript"}, {"type": "reply", "status", "text", "audio"} and, if
+# "audio" is true, the MP3 as one binary message. Bad input or no audio for
+# VOICE_STREAM_IDLE_TIMEOUT seconds gets {"type": "error"} before the socket is closed.
+VOICE_STREAM_IDLE_TIMEOUT = float(os.getenv("VOICE_STREAM_IDLE_TIMEOUT", "30"))
+VOICE_STREAM_MAX_SECONDS = int(os.getenv("VOICE_STREAM_MAX_SECONDS", "60"))
+VOICE_STREAM_SAMPLE_RATES = (8000, 192000) # Accepted range for "pcm" input
+
+
+def _send_turn_response(ws, response):
+    if response.mimetype == 'audio/mpeg':
+        ws.send(json.dumps({"type": "reply", "status": response.status_code, "audio": True,
+                            "text": response.headers.get('X-Response-Text', '')}))
+        ws.send(response.get_data())
+    else:
+        payload = response.get_json(silent=True) or {}
+        ws.send(json.dumps({"type": "reply", "status": response.status_code, "audio": False,
+                            "text": payload.get('response_text') or payload.get('error', '')}))
 
-    if user_text:
-        # --- ADDED: Update session with the new state if provided ---
-        if selected_state_from_request:
-            session['selected_state'] = selected_state_from_request
-            print(f"Updated session state (voice) to: {selected_state_from_request}")
-        # --- Retrieve current state from session ---
-        current_state_in_session = session.get('selected_state')
-
-        # --- Refactored AI Logic ---
-        conversation_history = load_memory()
-        print(f"Loaded history for current session (voice): {len(conversation_history)} messages")
-
-        # --- Get Context using the current state from the session ---
-        location_name, temp, weather, rain_chance, temp_max, temp_min = get_location_context(current_state_in_session)
-        current_time = get_current_time()
-        character_profile = get_character_profile()
-
-        # --- Prepare messages for Groq (using dynamic location) ---
-        system_prompt = (
-            f"{character_profile}\n"
-            f"Current Time: {current_time}\n"
-            # --- MODIFIED: Use dynamic location name ---
-            f"Current Location Context: {location_name}\n"
-            f"Current Temperature: {temp}°C\nWeather: {weather}\n"
-            f"Chance of rain today: {rain_chance} mm\nMax temperature today: {temp_max}°C\nMin temperature today: {temp_min}°C"
-        )
-        messages = [
-            {"role": "system", "content": system_prompt},
-            *conversation_history,
-            {"role": "user", "content": user_text}
-        ]
 
-        try:
-            completion = client.chat.completions.create(
-                model="llama3-70b-8192",
-                messages=messages,
-                temperature=0.7,
-                max_tokens=500
-            )
-            ai_response_text = completion.choices[0].message.content.replace('*', '')
+def _control_message(message):
+    """A text frame parsed as a JSON object, or None if it is anything else."""
+    try:
+        parsed = json.loads(message)
+    except (TypeError, ValueError):
+        return None
+    return parsed if isinstance(parsed, dict) else None
+
+
+def voice_stream_handler(ws):
+    """Decodes audio while the user is still speaking and answers as soon as the utterance ends."""
+    if not get_client():
+        ws.send(json.dumps({"type": "error", "error": "AI Client not initialized."}))
+        return
+    start = _control_message(ws.receive(timeout=VOICE_STREAM_IDLE_TIMEOUT)) or {}
+    if start.get('type') != 'start':
+        ws.send(json.dumps({"type": "error", "error": "Expected a start message"}))
+        return
+    voice_gender = start.get('voice_gender', 'male')
+    selected_state = start.get('selected_state')
+    coordinates = parse_coordinates(start)
+
+    # Registered when recording starts, so hitting record again cancels the previous reply
+    turn = begin_turn("voice_stream")
+    try:
+        _stream_voice_turn(ws, start, turn, voice_gender, selected_state, coordinates)
+    finally:
+        turn_registry.finish(turn)
 
-            # --- Update and Save History IN SESSION ---
-            conversation_history.append({"role": "user", "content": user_text})
-            conversation_history.append({"role": "assistant", "content": ai_response_text})
-            MAX_HISTORY = 20
-            if len(conversation_history) > MAX_HISTORY:
-                conversation_history = conversation_history[-MAX_HISTORY:]
-            save_memory(conversation_history)
 
-            print(f"🤖 Naru (Console Output): {ai_response_text}")
-            audio_data = asyncio.run(generate_speech_data(ai_response_text, voice_gender))
+def _stream_voice_turn(ws, start, turn, voice_gender, selected_state, coordinates):
+    trace = TurnTrace("voice_stream")
+    try:
+        sample_rate = int(start.get('sample_rate') or TARGET_SAMPLE_RATE)
+    except (TypeError, ValueError):
+        sample_rate = None
+    if sample_rate is None or not VOICE_STREAM_SAMPLE_RATES[0] <= sample_rate <= VOICE_STREAM_SAMPLE_RATES[1]:
+        ws.send(json.dumps({"type": "error", "error": f"Unsupported sample rate: {start.get('sample_rate')!r}"}))
+        return
+    try:
+        stream = VoiceStream(
+            input_format=start.get('format', 'webm'),
+            sample_rate=sample_rate,
+            max_seconds=VOICE_STREAM_MAX_SECONDS,
+        )
+    except TranscodeError as e:
+        print(f"Error starting voice stream decoder: {e}")
+        ws.send(json.dumps({"type": "error", "error": "Voice streaming is unavailable."}))
+        return
 
-            if audio_data:
-                print(f"🗣️ Sending audio response ({len(audio_data)} bytes) with text header.")
-                response = Response(audio_data, mimetype='audio/mpeg')
-                sanitized_text_for_header = ''.join(c for c in ai_response_text if ord(c) < 128).replace('\n', ' ')
-                try:
-                    header_value = sanitized_text_for_header.encode('latin-1', 'ignore').decode('latin-1')
-                    response.headers['X-Response-Text'] = header_value
-                except Exception as header_e:
-                    print(f"Warning: Could not set X-Response-Text header: {header_e}")
-                    response.headers['X-Response-Text'] = "Response generated."
-                return response
+    idle_since = time.monotonic()
+    try:
+        while not stream.speech_ended.is_set():
+            message = ws.receive(timeout=0.05)
+            if message is None:
+                if time.monotonic() - idle_since > VOICE_STREAM_IDLE_TIMEOUT:
+                    stream.abort()
+                    print(f"Voice stream idle for {VOICE_STREAM_IDLE_TIMEOUT:.0f}s; closing it.")
+                    ws.send(json.dumps({"type": "error", "error": "No audio received; the voice stream timed out."}))
+                    return
+                continue
+            idle_since = time.monotonic()
+            if isinstance(message, (bytes, bytearray)):
+                stream.feed(message)
             else:
-                print("🔊 TTS failed, sending JSON text response.")
-                return jsonify({"response_text": ai_response_text})
+                control = _control_message(message)
+                if control is None:
+                    stream.abort()
+                    ws.send(json.dumps({"type": "error", "error": "Expected a JSON object"}))
+                    return
+                if control.get('type') == 'stop':
+                    break
+        else:
+            ws.send(json.dumps({"type": "endpoint"})) # Lets the client stop recording
+    except Exception as e:
+        print(f"Voice stream ended early: {e}")
+        stream.abort()
+        return
 
-        except Exception as e:
-            print(f"Error during AI processing (voice input): {e}")
-            error_message = "Sorry, I encountered an error."
-            error_audio = asyncio.run(generate_speech_data(error_message, voice_gender))
-            if error_audio:
-                error_response = Response(error_audio, mimetype='audio/mpeg')
-                error_response.headers['X-Response-Text'] = error_message
-                return error_response, 500
-            else:
-                return jsonify({"error": error_message}), 500
-        # --- End Refactored Logic ---
+    with trace.stage("stt"):
+        pcm = stream.finish()
+        print(f"🎙️ Streamed {stream.bytes_received} bytes -> {len(pcm) / (TARGET_SAMPLE_RATE * TARGET_SAMPLE_WIDTH):.2f}s PCM")
+        user_text = recognize_pcm(pcm) if pcm else None
 
-    else:
-        # STT failed
-        error_message = "Sorry, I couldn't understand the audio."
+    if not user_text:
         print(f"👂 STT failed.")
-        error_audio = asyncio.run(generate_speech_data(error_message, voice_gender))
-        if error_audio:
-            error_response = Response(error_audio, mimetype='audio/mpeg')
-            error_response.headers['X-Response-Text'] = error_message
-            return error_response, 400 # Bad request
-        else:
-            return jsonify({"error": error_message}), 400
+        response = speak_error(STT_FAILED_REPLY, voice_gender, 400, trace)
+    else:
+        ws.send(json.dumps({"type": "transcript", "text": user_text}))
+        response = run_turn(user_text, voice_gender, selected_state, trace, turn, error_message=VOICE_ERROR_REPLY,
+                            coordinates=coordinates)
+    _send_turn_response(ws, response)
+    trace.finish(response.status_code)
+
+
+sock = Sock(app) if Sock else None
+if sock:
+    sock.route('/voice_stream')(voice_stream_handler)
+else:
+    print("Warning: flask-sock is not installed; streaming voice input (/voice_stream) is disabled.")
 
 
 @app.route('/clear_history', methods=['POST'])
 def clear_history_handler():
-    """Clears the conversation history stored in the user's session."""
-    if 'conversation_history' in session:
-        session.pop('conversation_history', None)
+    """Clears the conversation history stored for the user's session."""
+    # A reply still in flight would otherwise write its turn back into the cleared history
+    turn_registry.cancel(get_session_id(), "history_cleared")
+    if conversation_store.clear(get_session_id()):
         print(f"Cleared history for current session.")
         # Optionally clear the selected state as well?
         # session.pop('selected_state', None)
@@ -532,44 +1369,205 @@ def clear_history_handler():
         return jsonify({"message": "No server-side history to clear"}), 200
 
 
-# --- Run the App ---
-if __name__ == '__main__':
-    load_dotenv() # Load .env at start
-    print("Starting Flask app...")
-    print("Using Flask sessions for conversation history and state.")
-    print("Ensure .env file is present with API keys (GROQ_API_KEY, TMDB_API_KEY) and optionally FLASK_SECRET_KEY.")
-
-    # Re-check keys after potentially loading .env again
-    GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-    TMDB_API_KEY = os.getenv("TMDB_API_KEY")
-
-    # Update secret key from env if available
-    flask_secret = os.getenv("FLASK_SECRET_KEY")
-    if flask_secret:
-        app.secret_key = flask_secret
-        print("Loaded FLASK_SECRET_KEY from .env file.")
+# --- ADDED: Prometheus metrics (stage histograms + cache/client counters) ---
+for _prefix, _stats_fn in (
+    ("naru_weather_cache", weather_cache.stats),
+    ("naru_tts_cache", tts_cache.stats),
+    ("naru_response_cache", response_cache.stats),
+    ("naru_conversation_cache", conversation_store.stats),
+    ("naru_context", context_builder.stats),
+    ("naru_outbound_http", outbound.stats),
+    ("naru_stt", stt_router.stats),
+    ("naru_vad", silence_trimmer.stats),
+    ("naru_movie_cache", movie_index.stats),
+    ("naru_places", place_index.stats),
+    ("naru_llm_scheduler", llm_scheduler.stats),
+    ("naru_llm_router", model_router.stats),
+    ("naru_turns", turn_registry.stats),
+):
+    METRICS_REGISTRY.register(StatsCollector(_prefix, _stats_fn))
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_handler():
+    """Exposes metrics in the Prometheus text format."""
+    return Response(METRICS_REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/cache_stats', methods=['GET'])
+def cache_stats_handler():
+    """Reports hit/miss counters and entry ages for the server-side caches."""
+    return jsonify({
+        "weather": weather_cache.stats(),
+        "tts": tts_cache.stats(),
+        "responses": response_cache.stats(),
+        "conversations": conversation_store.stats(),
+        "context": context_builder.stats(),
+        "outbound_http": outbound.stats(),
+        "stt": stt_router.stats(),
+        "vad": silence_trimmer.stats(),
+        "movies": movie_index.stats(),
+        "places": place_index.stats(),
+        "llm_scheduler": llm_scheduler.stats(),
+        "llm_router": model_router.stats(),
+        "turns": turn_registry.stats(),
+    })
+
+
+# --- ADDED: Per-worker startup for multi-process servers (fork-safe clients, warm-up, probes) ---
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "30"))
+TTS_PREWARM_ENABLED = os.getenv("TTS_PREWARM", "1") != "0"
+STT_PREWARM_ENABLED = os.getenv("STT_PREWARM", "1") != "0"
+READY_GATE_ENABLED = os.getenv("READY_GATE", "0") == "1" # Also answer 503 on app routes until warmed up
+# Imported during warm-up instead of on the first request that needs them; text-only workers can drop edge_tts
+PRELOAD_MODULES = [name.strip() for name in os.getenv("PRELOAD_MODULES", "groq,edge_tts").split(",") if name.strip()]
+PROBE_ENDPOINTS = {'healthz_handler', 'readyz_handler', 'metrics_handler', 'static'}
+
+weather_refresher = None
+warmup = {"done": False, "seconds": None, "checks": {}}
+_clients_pid = os.getpid() # The process that built the clients and pools above
+_worker_pid = None
+_worker_lock = threading.Lock()
+
+
+def reset_clients_after_fork():
+    """Replaces what a forked child must not share with its parent: sockets, pool threads, locks."""
+    global client
+    client = None # Rebuilt lazily by get_client()
+    outbound.reset_after_fork()
+    transcoder.reset_after_fork()
+    stt_router.reset_after_fork()
+    llm_scheduler.reset_after_fork()
+    model_router.reset_after_fork()
+    turn_registry.reset_after_fork()
+    # async_runtime and conversation_store already re-create their loop/connections per process
+
+
+def run_warmup():
+    """Pre-fetches weather, pre-synthesizes canned audio, checks the decoder and loads STT models."""
+    global weather_refresher
+    started = time.perf_counter()
+    checks = {"preload_ms": {}}
+    for name in PRELOAD_MODULES:
+        import_started = time.perf_counter()
+        try:
+            importlib.import_module(name)
+            checks["preload_ms"][name] = round((time.perf_counter() - import_started) * 1000, 1)
+        except ImportError as e:
+            checks["preload_ms"][name] = f"failed: {e}"
+    checks["llm_client"] = "ok" if get_client() else "missing"
+
+    if WEATHER_PREFETCH_ENABLED:
+        weather_refresher = start_weather_prefetch()
+        checks["weather"] = f"{weather_refresher.last_stored or 0}/{len(weather_refresher.coordinates)} locations"
+    else:
+        checks["weather"] = "disabled"
 
-    # Initialize or re-initialize Groq client
-    if GROQ_API_KEY:
-        if not client:
+    if TTS_PREWARM_ENABLED:
+        deadline = time.monotonic() + WARMUP_TIMEOUT
+        futures = prewarm_tts_cache()
+        synthesized = 0
+        for future in futures:
             try:
-                client = Groq(api_key=GROQ_API_KEY)
-                print("Groq client initialized successfully.")
+                synthesized += bool(future.result(max(deadline - time.monotonic(), 0)))
             except Exception as e:
-                print(f"FATAL ERROR: Error initializing Groq client: {e}")
-                client = None
+                print(f"Warning: Canned reply pre-synthesis failed: {e}")
+        checks["canned_audio"] = f"{synthesized}/{len(futures)} clips"
     else:
-        print("\nFATAL ERROR: GROQ_API_KEY is missing after loading .env. Cannot start effectively.")
-        client = None
+        checks["canned_audio"] = "disabled"
+
+    if transcoder.backend == "pyav" or ffmpeg_available():
+        checks["audio_decoder"] = transcoder.backend
+    else:
+        checks["audio_decoder"] = "missing"
+        print("Warning: ffmpeg not found. Voice input will only accept WAV/PCM uploads until ffmpeg is installed.")
+
+    if STT_PREWARM_ENABLED:
+        stt_router.start()
+        checks["stt"] = "started"
+    else:
+        checks["stt"] = "on first use"
+
+    seconds = round(time.perf_counter() - started, 2)
+    warmup.update(done=True, seconds=seconds, checks=checks)
+    print(f"🔥 Worker {os.getpid()} warmed up in {seconds}s: {checks}")
+
+
+def is_ready():
+    return warmup["done"] and client is not None
+
+
+def init_worker():
+    """Idempotent per-process startup: fork-safe clients, then warm-up in the background.
+
+    Runs from create_app() and again on the first request in any forked child (e.g. under
+    gunicorn --preload), where the parent's connections, pools and threads can't be reused.
+    """
+    global _clients_pid, _worker_pid, warmup
+    pid = os.getpid()
+    if _worker_pid == pid:
+        return
+    with _worker_lock:
+        if _worker_pid == pid:
+            return
+        if _clients_pid != pid:
+            reset_clients_after_fork()
+            _clients_pid = pid
+        warmup = {"done": False, "seconds": None, "checks": {}}
+        _worker_pid = pid
+    threading.Thread(target=run_warmup, name="warmup", daemon=True).start()
 
-    if client:
-        print("Starting Flask development server...")
-        try:
-            AudioSegment.silent(duration=10) # Check pydub/ffmpeg
-            print("Pydub/ffmpeg check passed.")
-        except Exception as pydub_err:
-            print(f"Warning: Pydub check failed ({pydub_err}). Voice input might fail if ffmpeg is not installed/accessible.")
 
-        app.run(debug=True, host='0.0.0.0', port=5000)
+@app.before_request
+def ensure_worker_started():
+    init_worker()
+    if READY_GATE_ENABLED and not is_ready() and request.endpoint not in PROBE_ENDPOINTS:
+        response = jsonify({"error": "Server is warming up, please retry shortly."})
+        response.headers['Retry-After'] = '1'
+        return response, 503
+
+
+@app.route('/healthz', methods=['GET'])
+def healthz_handler():
+    """Liveness: the worker process is up and answering."""
+    return jsonify({"status": "ok", "pid": os.getpid()}), 200
+
+
+@app.route('/readyz', methods=['GET'])
+def readyz_handler():
+    """Readiness: 503 until this worker has an LLM client and has finished warming up."""
+    ready = is_ready()
+    return jsonify({
+        "ready": ready,
+        "pid": os.getpid(),
+        "warmup_seconds": warmup["seconds"],
+        "checks": warmup["checks"],
+    }), 200 if ready else 503
+
+
+def create_app():
+    """Application factory for multi-process servers, e.g.
+
+        WEB_CONCURRENCY=4 gunicorn -k gthread --threads 8 --timeout 120 'app:create_app()'
+
+    Configuration is read once, at import. Each worker process builds its own clients and
+    warms up in the background; send traffic only once its /readyz answers 200.
+    """
+    init_worker()
+    return app
+
+
+# --- Run the App ---
+if __name__ == '__main__':
+    print("Starting Flask app...")
+    print("Using the server-side conversation store for history; Flask sessions hold only the session id and state.")
+    print("Ensure .env file is present with API keys (GROQ_API_KEY, TMDB_API_KEY) and optionally FLASK_SECRET_KEY.")
+
+    if get_client():
+        debug = os.getenv("FLASK_DEBUG", "1") == "1"
+        if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+            create_app() # With the debug reloader only the child process serves, so only it warms up
+        print("Starting Flask development server...")
+        app.run(debug=debug, host='0.0.0.0', port=5000)
     else:
         print("Flask app will not run properly due to missing or failed Groq client initialization.")
\ No newline at end of file
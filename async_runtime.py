@@ -0,0 +1,105 @@
+import asyncio
+import concurrent.futures
+import os
+import queue
+import threading
+
+
+class AsyncRuntime:
+    """One long-lived event loop on a daemon thread that owns all of the app's async work.
+
+    Sync Flask handlers submit coroutines with ``run()``/``submit()`` and block only on the
+    returned future, so no event loop is built or torn down per request and concurrent TTS
+    jobs are multiplexed on the same loop. The loop is (re)started lazily and again after a
+    fork, so pre-fork servers get one loop per worker process.
+    """
+
+    def __init__(self, name="async-runtime", blocking_workers=32):
+        self.name = name
+        self.blocking_workers = blocking_workers
+        self._loop = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self):
+        if self._loop is None or self._pid != os.getpid() or not self._thread.is_alive():
+            self.start()
+        return self._loop
+
+    def start(self):
+        with self._lock:
+            if self._loop is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            loop = asyncio.new_event_loop()
+            # Blocking iterators (e.g. the Groq token stream) are pulled through run_in_executor
+            loop.set_default_executor(concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.blocking_workers, thread_name_prefix=f"{self.name}-blocking"))
+            ready = threading.Event()
+
+            def run_loop():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                loop.run_forever()
+
+            thread = threading.Thread(target=run_loop, name=self.name, daemon=True)
+            thread.start()
+            ready.wait()
+            self._loop, self._thread, self._pid = loop, thread, os.getpid()
+
+    def submit(self, coro):
+        """Schedules a coroutine on the runtime loop and returns a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """Runs a coroutine on the runtime loop and blocks the calling thread for its result."""
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def iterate(self, make_async_gen):
+        """Drives an async generator on the runtime loop and yields its items synchronously.
+
+        Closing the returned generator (e.g. the client disconnecting) cancels the async side.
+        """
+        items = queue.Queue()
+        end = object()
+
+        async def pump():
+            try:
+                agen = make_async_gen()
+                try:
+                    async for item in agen:
+                        items.put(item)
+                finally:
+                    await agen.aclose()
+            except Exception as e:
+                items.put(e) # Including a failing aclose(), or the consumer would never hear of it
+            finally:
+                items.put(end) # Always, so the consuming thread can't block on items.get() forever
+
+        future = self.submit(pump())
+        try:
+            while True:
+                item = items.get()
+                if item is end:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            future.cancel()
+
+    def stop(self, timeout=5):
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                return
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = self._pid = None
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+        loop.close()
@@ -0,0 +1,78 @@
+"""Per-request overhead of asyncio.run() versus submitting to the shared AsyncRuntime.
+
+Usage: python benchmarks/bench_async_runtime.py [--iterations N] [--threads T]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from async_runtime import AsyncRuntime
+
+
+async def fake_tts(chunks=8):
+    """Stand-in for generate_speech_data: a few awaits and a list of chunks joined once."""
+    audio_chunks = []
+    for _ in range(chunks):
+        await asyncio.sleep(0)
+        audio_chunks.append(b"\xff" * 512)
+    return b"".join(audio_chunks)
+
+
+def time_calls(call, iterations):
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        call()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def time_concurrent(call, iterations, threads):
+    per_thread = max(iterations // threads, 1)
+    workers = [threading.Thread(target=lambda: [call() for _ in range(per_thread)]) for _ in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    return per_thread * threads / elapsed
+
+
+def summarize(name, samples):
+    samples = sorted(samples)
+    p99 = samples[min(int(len(samples) * 0.99), len(samples) - 1)]
+    print(f"{name:<28} mean {statistics.mean(samples) * 1e6:9.1f} us   "
+          f"p50 {samples[len(samples) // 2] * 1e6:9.1f} us   p99 {p99 * 1e6:9.1f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    runtime = AsyncRuntime()
+    runtime.start()
+
+    print(f"{args.iterations} sequential calls")
+    summarize("asyncio.run(fake_tts())", time_calls(lambda: asyncio.run(fake_tts()), args.iterations))
+    summarize("runtime.run(fake_tts())", time_calls(lambda: runtime.run(fake_tts()), args.iterations))
+
+    print(f"\n{args.iterations} calls across {args.threads} threads")
+    before = time_concurrent(lambda: asyncio.run(fake_tts()), args.iterations, args.threads)
+    after = time_concurrent(lambda: runtime.run(fake_tts()), args.iterations, args.threads)
+    print(f"{'asyncio.run':<28} {before:9.0f} calls/s")
+    print(f"{'AsyncRuntime':<28} {after:9.0f} calls/s")
+
+    runtime.stop()
+
+
+if __name__ == "__main__":
+    main()
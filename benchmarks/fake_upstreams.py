@@ -0,0 +1,199 @@
+"""Local stand-ins for every upstream the app talks to, for offline load tests.
+
+Groq, Open-Meteo and TMDB are served over real HTTP by ``FakeUpstreamServer`` so the
+app's own clients (Groq SDK, OutboundClient) are exercised. edge-tts speaks a private
+websocket protocol, so ``FakeCommunicate`` replaces ``edge_tts.Communicate`` inside the
+worker. The recognizer is the app's own deterministic ``StubSTTEngine``.
+"""
+import asyncio
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+REPLY_WORDS = ("Arre bhai, scene ekdum set hai. Aaj mausam mast hai, chai pe chalte hain aur "
+               "ek solid movie dekhte hain. Bol, kya plan hai?").split()
+
+
+class UpstreamOptions:
+    """Latency knobs for the fakes (seconds, tokens/s, bytes).
+
+    ``model_first_token`` / ``model_tokens_per_second`` override the LLM defaults per model
+    name, to simulate a fast small model next to a slow large one. With probability
+    ``llm_tail_probability`` a completion is delayed by an extra ``llm_tail_delay`` (the
+    tail that hedged requests are meant to cut).
+    """
+
+    def __init__(self, llm_first_token=0.25, llm_tokens_per_second=250.0, reply_tokens=40,
+                 weather_latency=0.08, tmdb_latency=0.12, tts_first_chunk=0.15,
+                 tts_bytes_per_second=48000, stt_latency=0.3, model_first_token=None,
+                 model_tokens_per_second=None, llm_tail_probability=0.0, llm_tail_delay=2.0):
+        self.llm_first_token = llm_first_token
+        self.llm_tokens_per_second = llm_tokens_per_second
+        self.model_first_token = dict(model_first_token or {})
+        self.model_tokens_per_second = dict(model_tokens_per_second or {})
+        self.llm_tail_probability = llm_tail_probability
+        self.llm_tail_delay = llm_tail_delay
+        self.reply_tokens = reply_tokens
+        self.weather_latency = weather_latency
+        self.tmdb_latency = tmdb_latency
+        self.tts_first_chunk = tts_first_chunk
+        self.tts_bytes_per_second = tts_bytes_per_second
+        self.stt_latency = stt_latency
+
+    def to_dict(self):
+        return dict(vars(self))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "FakeUpstream/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        options = self.server.options
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        self.server.count(url.path)
+        if url.path == "/v1/forecast":
+            time.sleep(options.weather_latency)
+            locations = len(query.get("latitude", ["0"])[0].split(","))
+            payload = [{
+                "current_weather": {"temperature": 29.5, "weathercode": 2},
+                "daily": {"temperature_2m_max": [33.1], "temperature_2m_min": [24.8], "precipitation_sum": [1.2]},
+            } for _ in range(locations)]
+            return self._json(payload[0] if locations == 1 else payload)
+        if url.path.startswith("/3/"):
+            time.sleep(options.tmdb_latency)
+            seed = query.get("query", query.get("with_genres", ["popular"]))[0]
+            return self._json({"results": [{
+                "id": abs(hash((seed, i))) % 10 ** 7,
+                "title": f"{seed.title()} Story {i + 1}",
+                "overview": "A fake film for load testing, streaming on Netflix." if i % 2 else "A fake film.",
+                "release_date": f"20{10 + i}-06-01",
+                "vote_average": 6.5 + i / 10,
+                "popularity": 100 - i,
+            } for i in range(8)]})
+        self._json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        options = self.server.options
+        url = urlparse(self.path)
+        self.server.count(url.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not url.path.endswith("/chat/completions"):
+            return self._json({"error": "not found"}, 404)
+
+        # Vary every reply so the TTS cache doesn't turn the benchmark into a cache benchmark
+        serial = next(self.server.serial)
+        words = list(itertools.islice(itertools.cycle(REPLY_WORDS), min(options.reply_tokens, request.get("max_tokens") or 10 ** 6)))
+        words[-1] = f"{words[-1]} #{serial}"
+        created = int(time.time())
+        model = request.get("model")
+        first_token = options.model_first_token.get(model, options.llm_first_token)
+        if random.random() < options.llm_tail_probability:
+            first_token += options.llm_tail_delay
+        tokens_per_second = options.model_tokens_per_second.get(model, options.llm_tokens_per_second)
+        self.server.count(f"model:{model}")
+        time.sleep(first_token)
+        if not request.get("stream"):
+            time.sleep(len(words) / tokens_per_second)
+            return self._json({
+                "id": f"chatcmpl-{serial}", "object": "chat.completion", "created": created,
+                "model": request.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": " ".join(words)},
+                             "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 500, "completion_tokens": len(words), "total_tokens": 500 + len(words)},
+            })
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send(payload):
+            data = f"data: {payload}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        for index, word in enumerate(words):
+            send(json.dumps({
+                "id": f"chatcmpl-{serial}", "object": "chat.completion.chunk", "created": created,
+                "model": request.get("model"),
+                "choices": [{"index": 0, "delta": {"content": word + " " if index < len(words) - 1 else word},
+                             "finish_reason": None}],
+            }))
+            time.sleep(1 / tokens_per_second)
+        send(json.dumps({
+            "id": f"chatcmpl-{serial}", "object": "chat.completion.chunk", "created": created,
+            "model": request.get("model"), "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+        }))
+        send("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class FakeUpstreamServer(ThreadingHTTPServer):
+    """Open-Meteo (/v1/forecast), TMDB (/3/...) and Groq (/openai/v1/chat/completions)."""
+
+    daemon_threads = True
+
+    def __init__(self, options, host="127.0.0.1", port=0):
+        super().__init__((host, port), _Handler)
+        self.options = options
+        self.serial = itertools.count(1)
+        self.requests = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, path):
+        with self._lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-upstreams", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class FakeCommunicate:
+    """Drop-in for ``edge_tts.Communicate``: emits MP3-sized chunks at a configurable rate."""
+
+    options = UpstreamOptions()
+    chunk_bytes = 4096
+
+    def __init__(self, text, voice, rate="+0%", **kwargs):
+        self.text = text
+        # ~15 characters of speech per second at 48 kbps (6000 bytes/s)
+        self.total_bytes = max(len(text) * 400, self.chunk_bytes)
+
+    async def stream(self):
+        await asyncio.sleep(self.options.tts_first_chunk)
+        sent = 0
+        while sent < self.total_bytes:
+            size = min(self.chunk_bytes, self.total_bytes - sent)
+            yield {"type": "audio", "data": b"\xff\xf3" + b"\x00" * (size - 2)}
+            sent += size
+            await asyncio.sleep(size / self.options.tts_bytes_per_second)
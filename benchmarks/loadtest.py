@@ -0,0 +1,336 @@
+"""Offline load test: N concurrent sessions against /chat and /voice_input on local fakes.
+
+Boots ``--workers`` app processes (each a threaded werkzeug server importing app.py) wired to
+the fakes in fake_upstreams.py, drives them for ``--duration`` seconds and reports latency
+and time-to-first-byte percentiles, requests/s and RSS/CPU per worker. The report is written
+as JSON; pass ``--compare`` with an earlier report to print the deltas.
+
+Usage: python benchmarks/loadtest.py [--workers 2] [--sessions 8] [--duration 20]
+                                     [--voice-ratio 0.3] [--stream-ratio 0.0]
+                                     [--output PATH] [--compare OLD.json]
+"""
+import argparse
+import io
+import json
+import math
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+from datetime import datetime, timezone
+
+import requests
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_upstreams import FakeUpstreamServer, UpstreamOptions
+
+CHAT_MESSAGES = (
+    "Bhai kya scene hai aaj?",
+    "Aaj ka mausam kaisa hai?",
+    "Koi acchi comedy movie batao",
+    "Weekend pe kya karu?",
+    "Ek joke suna de yaar",
+    "Movies like inception on netflix",
+    "Explain in detail how monsoon rains form over India",
+)
+SMALL_MODEL = "llama3-8b-8192"
+STATES = ("Maharashtra", "Karnataka", "Delhi", "Kerala", None)
+
+
+def serve_worker(port, upstream_url, options, data_dir, app_env):
+    """Worker process entry point: points app.py at the fakes and serves it on ``port``."""
+    os.environ.update({
+        "GROQ_API_KEY": "bench", "GROQ_BASE_URL": upstream_url,
+        "TMDB_API_KEY": "bench", "TMDB_API_URL": f"{upstream_url}/3",
+        "WEATHER_API_URL": f"{upstream_url}/v1/forecast",
+        "CONVERSATION_DB_PATH": os.path.join(data_dir, f"conversations-{port}.db"),
+        "STT_ENGINES": "stub", "STT_PREWARM": "0",
+        "FLASK_SECRET_KEY": "bench",
+    })
+    os.environ.update(app_env)
+    sys.stdout = sys.stderr = open(os.path.join(data_dir, f"worker-{port}.log"), "w", buffering=1)
+
+    import edge_tts
+    from fake_upstreams import FakeCommunicate
+    FakeCommunicate.options = options
+    edge_tts.Communicate = FakeCommunicate
+
+    import app as naru
+    from stt_engines import STTRouter, StubSTTEngine
+    naru.stt_router = STTRouter([StubSTTEngine(text="Bhai aaj ka mausam kaisa hai", delay=options.stt_latency)])
+
+    from werkzeug.serving import make_server
+    make_server("127.0.0.1", port, naru.create_app(), threaded=True).serve_forever()
+
+
+def _free_port():
+    import socket
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_ready(url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Worker at {url} did not become ready within {timeout}s")
+
+
+def _proc_usage(pid):
+    """(cpu_seconds, rss_mb, peak_rss_mb) from /proc; Nones where unavailable."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+        rss = peak = None
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    rss = int(line.split()[1]) / 1024
+                elif line.startswith("VmHWM:"):
+                    peak = int(line.split()[1]) / 1024
+        return cpu, rss, peak
+    except (OSError, ValueError, IndexError):
+        return None, None, None
+
+
+def make_voice_clip(seconds=1.5, rate=16000):
+    """A WAV clip (takes the decoder's no-ffmpeg fast path), like a short spoken question."""
+    frames = bytearray()
+    for i in range(int(seconds * rate)):
+        sample = int(6000 * math.sin(2 * math.pi * 220 * i / rate))
+        frames += sample.to_bytes(2, "little", signed=True)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(bytes(frames))
+    return buffer.getvalue()
+
+
+def run_session(index, base_url, deadline, voice_ratio, stream_ratio, voice_clip, results, seed):
+    rng = random.Random(seed + index)
+    http = requests.Session() # Keeps the session cookie, so history builds up like a real chat
+    while time.monotonic() < deadline:
+        state = rng.choice(STATES)
+        roll = rng.random()
+        started = time.perf_counter()
+        try:
+            if roll < voice_ratio:
+                endpoint = "/voice_input"
+                response = http.post(f"{base_url}/voice_input", stream=True, timeout=60, files={
+                    "audio_data": ("clip.wav", voice_clip, "audio/wav")}, data={
+                    "voice_gender": rng.choice(("male", "female")), "selected_state": state or ""})
+            else:
+                endpoint = "/chat/audio_stream" if roll < voice_ratio + stream_ratio else "/chat"
+                response = http.post(f"{base_url}{endpoint}", stream=True, timeout=60, json={
+                    "message": rng.choice(CHAT_MESSAGES), "voice_gender": rng.choice(("male", "female")),
+                    "selected_state": state})
+            body = response.iter_content(chunk_size=None)
+            first = next(body, b"")
+            ttfb = time.perf_counter() - started
+            size = len(first) + sum(len(chunk) for chunk in body)
+            total = time.perf_counter() - started
+            results.append({"endpoint": endpoint, "status": response.status_code, "ttfb": ttfb,
+                            "latency": total, "bytes": size})
+        except requests.exceptions.RequestException as e:
+            results.append({"endpoint": endpoint, "status": 0, "error": str(e),
+                            "ttfb": None, "latency": time.perf_counter() - started, "bytes": 0})
+
+
+def percentiles(values):
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "mean": None}
+    values = sorted(values)
+
+    def rank(p):
+        return round(values[min(max(math.ceil(p * len(values)) - 1, 0), len(values) - 1)] * 1000, 1)
+
+    return {"p50": rank(0.50), "p95": rank(0.95), "p99": rank(0.99),
+            "mean": round(sum(values) / len(values) * 1000, 1)}
+
+
+def summarize(results, elapsed):
+    report = {}
+    for endpoint in sorted({r["endpoint"] for r in results}) + ["all"]:
+        rows = [r for r in results if endpoint in ("all", r["endpoint"])]
+        ok = [r for r in rows if 200 <= r["status"] < 300]
+        report[endpoint] = {
+            "requests": len(rows),
+            "errors": len(rows) - len(ok),
+            "requests_per_second": round(len(rows) / elapsed, 2),
+            "latency_ms": percentiles([r["latency"] for r in ok]),
+            "ttfb_ms": percentiles([r["ttfb"] for r in ok]),
+            "mean_response_bytes": round(sum(r["bytes"] for r in ok) / len(ok)) if ok else 0,
+        }
+    return report
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def print_report(report, baseline=None):
+    print(f"\nCommit {report['commit']}  workers {report['config']['workers']}  "
+          f"sessions {report['config']['sessions']}  {report['elapsed_seconds']}s")
+    for endpoint, stats in report["endpoints"].items():
+        line = (f"{endpoint:<18} {stats['requests']:6d} req {stats['errors']:4d} err "
+                f"{stats['requests_per_second']:7.2f} req/s   latency p50/p95/p99 "
+                f"{stats['latency_ms']['p50']}/{stats['latency_ms']['p95']}/{stats['latency_ms']['p99']} ms   "
+                f"ttfb p50/p95 {stats['ttfb_ms']['p50']}/{stats['ttfb_ms']['p95']} ms")
+        print(line)
+        old = (baseline or {}).get("endpoints", {}).get(endpoint)
+        if old:
+            deltas = []
+            for metric, key in (("latency", "latency_ms"), ("ttfb", "ttfb_ms")):
+                for p in ("p50", "p95", "p99"):
+                    new_value, old_value = stats[key][p], old[key][p]
+                    if new_value is not None and old_value:
+                        deltas.append(f"{metric} {p} {(new_value - old_value) / old_value * 100:+.1f}%")
+            rps_old = old["requests_per_second"]
+            if rps_old:
+                deltas.append(f"req/s {(stats['requests_per_second'] - rps_old) / rps_old * 100:+.1f}%")
+            print(f"{'':<18} vs {baseline.get('commit')}: " + ", ".join(deltas))
+    for worker in report["workers"]:
+        print(f"worker {worker['pid']:<7} cpu {worker['cpu_percent']}%  rss {worker['rss_mb']} MB "
+              f"(peak {worker['peak_rss_mb']} MB)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--sessions", type=int, default=8, help="Concurrent client sessions")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds of load after warm-up")
+    parser.add_argument("--voice-ratio", type=float, default=0.3, help="Share of turns sent to /voice_input")
+    parser.add_argument("--stream-ratio", type=float, default=0.0,
+                        help="Share of turns sent to /chat/audio_stream (where TTFB differs from latency)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--llm-first-token", type=float, default=0.25)
+    parser.add_argument("--llm-tokens-per-second", type=float, default=250.0)
+    parser.add_argument("--reply-tokens", type=int, default=40)
+    parser.add_argument("--tts-first-chunk", type=float, default=0.15)
+    parser.add_argument("--tts-bytes-per-second", type=int, default=48000)
+    parser.add_argument("--stt-latency", type=float, default=0.3)
+    parser.add_argument("--small-model-first-token", type=float, default=0.1)
+    parser.add_argument("--small-model-tokens-per-second", type=float, default=800.0)
+    parser.add_argument("--llm-tail-probability", type=float, default=0.0,
+                        help="Chance a completion is delayed by --llm-tail-delay")
+    parser.add_argument("--llm-tail-delay", type=float, default=2.0)
+    parser.add_argument("--weather-latency", type=float, default=0.08)
+    parser.add_argument("--tmdb-latency", type=float, default=0.12)
+    parser.add_argument("--groq-rpm", type=int, default=0, help="Per-worker requests/minute quota (0 = unlimited)")
+    parser.add_argument("--groq-tpm", type=int, default=0, help="Per-worker tokens/minute quota (0 = unlimited)")
+    parser.add_argument("--no-routing", action="store_true", help="Send every turn to the large model")
+    parser.add_argument("--hedge-delay", type=float, default=0.0, help="LLM_HEDGE_DELAY for the workers")
+    parser.add_argument("--response-cache", action="store_true",
+                        help="Serve repeated first turns from the response cache (off so every turn reaches the LLM)")
+    parser.add_argument("--output", help="Report path (default benchmarks/results/loadtest-<time>-<commit>.json)")
+    parser.add_argument("--compare", help="Earlier report to diff against")
+    args = parser.parse_args()
+
+    options = UpstreamOptions(
+        llm_first_token=args.llm_first_token, llm_tokens_per_second=args.llm_tokens_per_second,
+        reply_tokens=args.reply_tokens, weather_latency=args.weather_latency, tmdb_latency=args.tmdb_latency,
+        tts_first_chunk=args.tts_first_chunk, tts_bytes_per_second=args.tts_bytes_per_second,
+        stt_latency=args.stt_latency,
+        model_first_token={SMALL_MODEL: args.small_model_first_token},
+        model_tokens_per_second={SMALL_MODEL: args.small_model_tokens_per_second},
+        llm_tail_probability=args.llm_tail_probability, llm_tail_delay=args.llm_tail_delay,
+    )
+    app_env = {
+        "GROQ_RPM": str(args.groq_rpm), "GROQ_TPM": str(args.groq_tpm), # 0 = no quota model
+        "LLM_SMALL_MODEL": SMALL_MODEL, "LLM_ROUTING": "0" if args.no_routing else "1",
+        "LLM_HEDGE_DELAY": str(args.hedge_delay), "RESPONSE_CACHE": "1" if args.response_cache else "0",
+    }
+    upstreams = FakeUpstreamServer(options).start()
+    data_dir = tempfile.mkdtemp(prefix="naru-loadtest-")
+    context = multiprocessing.get_context("spawn")
+    ports = [_free_port() for _ in range(args.workers)]
+    workers = [context.Process(target=serve_worker, args=(port, upstreams.url, options, data_dir, app_env),
+                               daemon=True)
+               for port in ports]
+    for worker in workers:
+        worker.start()
+    base_urls = [f"http://127.0.0.1:{port}" for port in ports]
+    try:
+        for url in base_urls:
+            _wait_ready(f"{url}/readyz")
+        print(f"{args.workers} worker(s) ready; logs in {data_dir}")
+
+        voice_clip = make_voice_clip()
+        usage_before = {w.pid: _proc_usage(w.pid) for w in workers}
+        results = []
+        started = time.perf_counter()
+        deadline = time.monotonic() + args.duration
+        sessions = [threading.Thread(target=run_session, args=(
+            i, base_urls[i % len(base_urls)], deadline, args.voice_ratio, args.stream_ratio, voice_clip, results, args.seed))
+            for i in range(args.sessions)]
+        for session in sessions:
+            session.start()
+        for session in sessions:
+            session.join()
+        elapsed = time.perf_counter() - started
+
+        worker_stats = []
+        for worker, url in zip(workers, base_urls):
+            cpu_after, rss, peak = _proc_usage(worker.pid)
+            cpu_before = usage_before[worker.pid][0]
+            cpu = cpu_after - cpu_before if cpu_after is not None and cpu_before is not None else None
+            worker_stats.append({
+                "pid": worker.pid, "url": url,
+                "cpu_seconds": round(cpu, 2) if cpu is not None else None,
+                "cpu_percent": round(cpu / elapsed * 100, 1) if cpu is not None else None,
+                "rss_mb": round(rss, 1) if rss is not None else None,
+                "peak_rss_mb": round(peak, 1) if peak is not None else None,
+            })
+    finally:
+        for worker in workers:
+            worker.terminate()
+        upstreams.stop()
+
+    report = {
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "elapsed_seconds": round(elapsed, 2),
+        "config": {"workers": args.workers, "sessions": args.sessions, "duration": args.duration,
+                   "voice_ratio": args.voice_ratio, "stream_ratio": args.stream_ratio, "app_env": app_env, "seed": args.seed, "upstreams": options.to_dict()},
+        "endpoints": summarize(results, elapsed),
+        "workers": worker_stats,
+        "upstream_requests": dict(upstreams.requests),
+    }
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    output = args.output or os.path.join(
+        ROOT, "benchmarks", "results",
+        f"loadtest-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{report['commit'] or 'nogit'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {output}")
+
+
+if __name__ == "__main__":
+    main()
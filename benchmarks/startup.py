@@ -0,0 +1,218 @@
+"""Cold-start benchmark: import cost per dependency and time until a new worker can serve.
+
+Measures, each in a fresh interpreter:
+
+* the cumulative import time of every heavy dependency on its own (``python -X importtime``),
+* ``import app``: total time, the heaviest modules it pulls in, and which of the heavy
+  dependencies it loads eagerly (the voice and LLM stacks should load lazily),
+* a worker booted from ``create_app()`` against the local fakes: time from process start
+  to the first /healthz answer, to /readyz turning 200, and to the first text reply.
+
+The report is written as JSON; pass ``--compare`` with an earlier report to print the deltas.
+
+Usage: python benchmarks/startup.py [--repeat 3] [--preload groq,edge_tts]
+                                    [--output PATH] [--compare OLD.json]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import requests
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_upstreams import FakeUpstreamServer, UpstreamOptions
+from loadtest import _free_port, _git_commit
+
+DEPENDENCIES = ("flask", "flask_sock", "requests", "dotenv", "groq", "edge_tts", "speech_recognition",
+                "av", "faster_whisper")
+APP_ENV = { # Offline and deterministic: no STT model load, no network
+    "GROQ_API_KEY": "bench", "TMDB_API_KEY": "bench", "FLASK_SECRET_KEY": "bench",
+    "CONVERSATION_STORE": "memory", "STT_ENGINES": "stub", "STT_PREWARM": "0", "TTS_PREWARM": "0",
+}
+
+
+def parse_importtime(stderr):
+    """-X importtime output -> [(depth, module, cumulative_ms)] in import order."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((depth, name.strip(), int(cumulative) / 1000))
+    return rows
+
+
+def _run_python(code, env=None):
+    return subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, capture_output=True,
+                          text=True, timeout=120, env=dict(os.environ, **(env or {})))
+
+
+def measure_dependency(name, repeat):
+    """Median cold import time of one dependency, or None if it isn't installed."""
+    times = []
+    for _ in range(repeat):
+        result = _run_python(f"import {name}")
+        if result.returncode != 0:
+            return None
+        times.append(next(ms for depth, module, ms in reversed(parse_importtime(result.stderr)) if module == name))
+    return round(statistics.median(times), 1)
+
+
+def measure_app_import(repeat, top=10):
+    """Median ``import app`` time, its heaviest direct imports and the heavy dependencies it loaded."""
+    code = ("import json, sys; import app; "
+            f"print(json.dumps([m for m in {list(DEPENDENCIES)!r} if m in sys.modules]))")
+    totals, children, loaded = [], {}, []
+    for _ in range(repeat):
+        result = _run_python(code, APP_ENV)
+        if result.returncode != 0:
+            raise RuntimeError(f"import app failed:\n{result.stderr[-2000:]}")
+        rows = parse_importtime(result.stderr)
+        totals.append(next(ms for depth, module, ms in reversed(rows) if module == "app"))
+        for depth, module, ms in rows:
+            if depth == 1:
+                children.setdefault(module, []).append(ms)
+        loaded = json.loads(result.stdout.strip().splitlines()[-1])
+    heaviest = sorted(((m, round(statistics.median(v), 1)) for m, v in children.items()), key=lambda x: -x[1])
+    return {"total_ms": round(statistics.median(totals), 1), "heaviest_imports_ms": dict(heaviest[:top]),
+            "heavy_dependencies_loaded": loaded}
+
+
+def serve_app(port, upstream_url, app_env):
+    """Worker process entry point: imports app.py, builds it with create_app() and serves it."""
+    os.environ.update(APP_ENV)
+    os.environ.update({
+        "GROQ_BASE_URL": upstream_url, "TMDB_API_URL": f"{upstream_url}/3",
+        "WEATHER_API_URL": f"{upstream_url}/v1/forecast",
+    })
+    os.environ.update(app_env)
+    sys.stdout = sys.stderr = open(os.devnull, "w")
+    import app as naru
+    from werkzeug.serving import make_server
+    make_server("127.0.0.1", port, naru.create_app(), threaded=True).serve_forever()
+
+
+def _poll(url, deadline, ok=200):
+    while time.perf_counter() < deadline:
+        try:
+            response = requests.get(url, timeout=1)
+            if response.status_code == ok:
+                return response
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.005)
+    raise RuntimeError(f"{url} did not answer {ok} in time")
+
+
+def measure_first_request(upstream_url, app_env, timeout=60):
+    """Seconds from spawning a worker to its first /healthz, /readyz 200 and first streamed reply."""
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    process = multiprocessing.get_context("spawn").Process(
+        target=serve_app, args=(port, upstream_url, app_env), daemon=True)
+    started = time.perf_counter()
+    deadline = started + timeout
+    process.start()
+    try:
+        _poll(f"{base_url}/healthz", deadline)
+        healthy = time.perf_counter() - started
+        ready_response = _poll(f"{base_url}/readyz", deadline)
+        ready = time.perf_counter() - started
+        request_started = time.perf_counter()
+        response = requests.post(f"{base_url}/chat/stream", json={"message": "Bhai kya scene hai?"},
+                                 stream=True, timeout=timeout)
+        response.raise_for_status()
+        chunks = response.iter_content(chunk_size=None)
+        next(chunks)
+        first_reply = time.perf_counter() - request_started
+        for _ in chunks: # Drain, so the reply finishes normally
+            pass
+    finally:
+        process.terminate()
+        process.join(5)
+    return {
+        "first_healthz_ms": round(healthy * 1000, 1),
+        "ready_ms": round(ready * 1000, 1),
+        "first_reply_ttfb_ms": round(first_reply * 1000, 1),
+        "warmup": ready_response.json(),
+    }
+
+
+def print_report(report, baseline=None):
+    old = baseline or {}
+
+    def delta(new, old_value):
+        if isinstance(new, (int, float)) and isinstance(old_value, (int, float)) and old_value:
+            return f"  ({(new - old_value) / old_value * 100:+.1f}% vs {old.get('commit')})"
+        return ""
+
+    print(f"\nCommit {report['commit']}  python {report['python']}  repeat {report['config']['repeat']}")
+    print("\nCold import, each dependency alone (ms)")
+    for name, ms in report["dependencies_ms"].items():
+        print(f"  {name:<20} {'not installed' if ms is None else f'{ms:8.1f}'}"
+              f"{delta(ms, old.get('dependencies_ms', {}).get(name))}")
+    app_import = report["app_import"]
+    print(f"\nimport app: {app_import['total_ms']} ms{delta(app_import['total_ms'], old.get('app_import', {}).get('total_ms'))}")
+    print("  heaviest direct imports: " + ", ".join(f"{m} {ms}" for m, ms in app_import["heaviest_imports_ms"].items()))
+    print("  heavy dependencies loaded eagerly: " + (", ".join(app_import["heavy_dependencies_loaded"]) or "none"))
+    print("\nWorker boot (ms from process start)")
+    for key in ("first_healthz_ms", "ready_ms", "first_reply_ttfb_ms"):
+        value = report["worker"][key]
+        print(f"  {key:<20} {value:8.1f}{delta(value, old.get('worker', {}).get(key))}")
+    print(f"  warm-up checks: {report['worker']['warmup'].get('checks')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per import measurement (median is reported)")
+    parser.add_argument("--preload", default=None,
+                        help="PRELOAD_MODULES for the booted worker (default: the app's default)")
+    parser.add_argument("--output", help="Report path (default benchmarks/results/startup-<time>-<commit>.json)")
+    parser.add_argument("--compare", help="Earlier startup report to diff against")
+    args = parser.parse_args()
+
+    app_env = {} if args.preload is None else {"PRELOAD_MODULES": args.preload}
+    dependencies = {name: measure_dependency(name, args.repeat) for name in DEPENDENCIES}
+    app_import = measure_app_import(args.repeat)
+    upstreams = FakeUpstreamServer(UpstreamOptions()).start()
+    try:
+        worker = measure_first_request(upstreams.url, app_env)
+    finally:
+        upstreams.stop()
+
+    report = {
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "config": {"repeat": args.repeat, "app_env": app_env},
+        "dependencies_ms": dependencies,
+        "app_import": app_import,
+        "worker": worker,
+    }
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    output = args.output or os.path.join(
+        ROOT, "benchmarks", "results",
+        f"startup-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{report['commit'] or 'nogit'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+import hashlib
+import math
+import re
+import threading
+
+# Chat-format overhead per message (role markers etc.)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_WORD_PIECES = re.compile(r"\w+|[^\w\s]")
+
+
+def count_tokens(text):
+    """Estimates Llama 3 tokens: ~4 characters per token, never fewer than words + punctuation."""
+    if not text:
+        return 0
+    return max(math.ceil(len(text) / 4), len(_WORD_PIECES.findall(text)))
+
+
+def _anchor(messages):
+    """Fingerprint of the last two messages of a prefix; marks how far a summary reaches."""
+    digest = hashlib.sha1()
+    for message in messages[-2:]:
+        digest.update(message["role"].encode("utf-8") + b"\0" + message["content"].encode("utf-8") + b"\0")
+    return digest.hexdigest()
+
+
+class ContextBuilder:
+    """Fits system prompt + rolling summary + recent history + user input into a token budget.
+
+    The newest messages that fit (at most ``max_window_messages``) are sent verbatim. Older
+    ones are folded into a per-session summary kept in the conversation store; folding runs
+    on a background thread once at least ``min_fold_messages`` unsummarized messages have
+    fallen out of the window, so a request never waits on the summarizer. ``history`` should
+    be the whole stored history, so nothing falls out without being folded.
+    """
+
+    def __init__(self, store, summarize, budget=3000, summary_max_tokens=300, min_fold_messages=4,
+                 token_counter=count_tokens, max_window_messages=None):
+        self.store = store
+        self.summarize = summarize
+        self.budget = budget
+        self.summary_max_tokens = summary_max_tokens
+        self.min_fold_messages = min_fold_messages
+        self.max_window_messages = max_window_messages
+        self.count_tokens = token_counter
+        self._folding = set()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.prompt_tokens_total = 0
+        self.full_history_tokens_total = 0
+        self.summaries_built = 0
+        self.summaries_discarded = 0
+        self.summary_errors = 0
+
+    def _message_tokens(self, message):
+        return self.count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+    def build(self, session_id, system_prompt, history, user_input):
+        """Returns the messages list for the LLM call."""
+        system_message = {"role": "system", "content": system_prompt}
+        user_message = {"role": "user", "content": user_input}
+        fixed_tokens = self._message_tokens(system_message) + self._message_tokens(user_message)
+        remaining = self.budget - fixed_tokens
+
+        summary = self.store.load_summary(session_id)
+        summary_message = None
+        summary_tokens = 0
+        if summary:
+            summary_message = {"role": "system", "content": f"Summary of the earlier conversation: {summary['content']}"}
+            summary_tokens = self._message_tokens(summary_message)
+            if summary_tokens <= remaining:
+                remaining -= summary_tokens
+            else:
+                summary_message, summary_tokens = None, 0
+
+        # Newest-first until the budget runs out
+        window_start = len(history)
+        history_tokens = 0
+        for index in range(len(history) - 1, -1, -1):
+            tokens = self._message_tokens(history[index])
+            if tokens > remaining or (self.max_window_messages and len(history) - index > self.max_window_messages):
+                break
+            remaining -= tokens
+            history_tokens += tokens
+            window_start = index
+        # Start the window on a user message so the model never sees a reply without its question
+        while window_start < len(history) and history[window_start]["role"] != "user":
+            history_tokens -= self._message_tokens(history[window_start])
+            window_start += 1
+
+        messages = [system_message]
+        if summary_message:
+            messages.append(summary_message)
+        messages.extend(history[window_start:])
+        messages.append(user_message)
+
+        prompt_tokens = fixed_tokens + summary_tokens + history_tokens
+        full_history_tokens = fixed_tokens + sum(self._message_tokens(m) for m in history)
+        with self._lock:
+            self.requests += 1
+            self.prompt_tokens_total += prompt_tokens
+            self.full_history_tokens_total += full_history_tokens
+        print(f"🧮 Prompt ~{prompt_tokens} tokens (budget {self.budget}): "
+              f"{len(history) - window_start}/{len(history)} history msgs, "
+              f"summary {summary_tokens}; full history would be ~{full_history_tokens}")
+
+        if window_start:
+            self._maybe_fold(session_id, summary, history, window_start)
+        return messages
+
+    def _maybe_fold(self, session_id, summary, history, window_start):
+        pending_start = 0
+        if summary:
+            for index in range(len(history), 0, -1):
+                if _anchor(history[:index]) == summary["anchor"]:
+                    pending_start = index
+                    break
+        pending = history[pending_start:window_start]
+        if len(pending) < self.min_fold_messages:
+            return
+        with self._lock:
+            if session_id in self._folding:
+                return
+            self._folding.add(session_id)
+        previous = summary["content"] if summary else None
+        anchor = _anchor(history[:window_start])
+        epoch = self.store.history_epoch(session_id)
+        threading.Thread(
+            target=self._fold, args=(session_id, previous, pending, anchor, epoch), name="context-summary", daemon=True
+        ).start()
+
+    def _still_stored(self, session_id, anchor):
+        """True if the folded messages are still in the store (a clear removes them)."""
+        history = self.store.load(session_id)
+        return any(_anchor(history[:index]) == anchor for index in range(len(history), 0, -1))
+
+    def _fold(self, session_id, previous_summary, messages, anchor, epoch):
+        try:
+            content = self.summarize(previous_summary, messages)
+            if not content:
+                return
+            # A clear while summarizing must not bring the old conversation back as a summary
+            if self._still_stored(session_id, anchor) and self.store.save_summary(session_id, anchor, content, epoch):
+                with self._lock:
+                    self.summaries_built += 1
+            else:
+                print("🧹 History was cleared while summarizing; summary discarded.")
+                with self._lock:
+                    self.summaries_discarded += 1
+        except Exception as e:
+            with self._lock:
+                self.summary_errors += 1
+            print(f"Error summarizing conversation history: {e}")
+        finally:
+            with self._lock:
+                self._folding.discard(session_id)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "token_budget": self.budget,
+                "prompt_tokens_total": self.prompt_tokens_total,
+                "full_history_tokens_total": self.full_history_tokens_total,
+                "tokens_saved_total": self.full_history_tokens_total - self.prompt_tokens_total,
+                "summaries_built": self.summaries_built,
+                "summaries_discarded": self.summaries_discarded,
+                "summary_errors": self.summary_errors,
+            }
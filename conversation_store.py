@@ -0,0 +1,370 @@
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+# Compact on-disk role encoding
+_ROLE_CODES = {"user": "u", "assistant": "a", "system": "s"}
+_ROLE_NAMES = {code: role for role, code in _ROLE_CODES.items()}
+
+
+class StaleTurnError(Exception):
+    """Raised by ``append`` when a newer turn began (or the history was cleared) since ``generation``."""
+
+
+class ConversationStore(ABC):
+    """Interface for server-side conversation history, keyed by session id."""
+
+    @abstractmethod
+    def load(self, session_id, limit=None):
+        """Returns up to ``limit`` most recent messages, oldest first."""
+
+    @abstractmethod
+    def append(self, session_id, messages, generation=None):
+        """Appends messages for one turn without rewriting earlier ones.
+
+        With ``generation`` (from ``begin_turn``) the write is refused with StaleTurnError if
+        the session has moved on since. Returns ``(version_before, version_after)`` observed
+        atomically with the write.
+        """
+
+    @abstractmethod
+    def clear(self, session_id):
+        """Deletes a session's history and invalidates turns in flight; returns the number of messages removed."""
+
+    @abstractmethod
+    def begin_turn(self, session_id):
+        """Starts a new turn generation for the session (shared by all workers) and returns it."""
+
+    @abstractmethod
+    def turn_generation(self, session_id):
+        """Returns the session's current turn generation (0 if no turn has begun)."""
+
+    @abstractmethod
+    def version(self, session_id):
+        """Returns a value that changes whenever the session's history changes."""
+
+    @abstractmethod
+    def history_epoch(self, session_id):
+        """Returns a counter that changes only when the session's history is cleared."""
+
+    @abstractmethod
+    def load_summary(self, session_id):
+        """Returns the stored rolling summary dict (``anchor``, ``content``) or None."""
+
+    @abstractmethod
+    def save_summary(self, session_id, anchor, content, epoch=None):
+        """Replaces the session's rolling summary; ``anchor`` marks the last folded message.
+
+        With ``epoch`` (from ``history_epoch``) nothing is saved if the history was cleared
+        since. Returns True if the summary was saved.
+        """
+
+
+class MemoryConversationStore(ConversationStore):
+    """Process-local store; fine for a single dev server, not for multiple workers."""
+
+    def __init__(self, max_messages_per_session=200):
+        self.max_messages_per_session = max_messages_per_session
+        self._sessions = {}
+        self._summaries = {}
+        self._versions = {}
+        self._generations = {}
+        self._epochs = {}
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def load(self, session_id, limit=None):
+        with self._lock:
+            messages = self._sessions.get(session_id, [])
+            return [dict(m) for m in (messages[-limit:] if limit else messages)]
+
+    def append(self, session_id, messages, generation=None):
+        with self._lock:
+            if generation is not None and generation != self._generations.get(session_id, 0):
+                raise StaleTurnError(f"Turn generation {generation} is stale")
+            version_before = self._versions.get(session_id)
+            history = self._sessions.setdefault(session_id, [])
+            history.extend(dict(m) for m in messages)
+            del history[:-self.max_messages_per_session]
+            self._counter += 1
+            self._versions[session_id] = self._counter
+            return version_before, self._counter
+
+    def clear(self, session_id):
+        with self._lock:
+            self._generations[session_id] = self._generations.get(session_id, 0) + 1
+            self._epochs[session_id] = self._epochs.get(session_id, 0) + 1
+            self._versions.pop(session_id, None)
+            self._summaries.pop(session_id, None)
+            return len(self._sessions.pop(session_id, []))
+
+    def version(self, session_id):
+        with self._lock:
+            return self._versions.get(session_id)
+
+    def begin_turn(self, session_id):
+        with self._lock:
+            self._generations[session_id] = self._generations.get(session_id, 0) + 1
+            return self._generations[session_id]
+
+    def turn_generation(self, session_id):
+        with self._lock:
+            return self._generations.get(session_id, 0)
+
+    def history_epoch(self, session_id):
+        with self._lock:
+            return self._epochs.get(session_id, 0)
+
+    def load_summary(self, session_id):
+        with self._lock:
+            summary = self._summaries.get(session_id)
+            return dict(summary) if summary else None
+
+    def save_summary(self, session_id, anchor, content, epoch=None):
+        with self._lock:
+            if epoch is not None and epoch != self._epochs.get(session_id, 0):
+                return False
+            self._summaries[session_id] = {"anchor": anchor, "content": content}
+            return True
+
+
+class SQLiteConversationStore(ConversationStore):
+    """Durable store in a WAL-mode SQLite file, safe to share between worker processes.
+
+    Each message is one row, so a turn is a two-row INSERT rather than a rewrite of the
+    whole history. Connections are per thread and re-opened after a fork.
+    """
+
+    def __init__(self, path, max_messages_per_session=200, busy_timeout_ms=5000):
+        self.path = path
+        self.max_messages_per_session = max_messages_per_session
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with _transaction(self._connection()) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " session_id TEXT NOT NULL,"
+                " role TEXT NOT NULL,"
+                " content TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS messages_session_seq ON messages (session_id, seq)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS summaries ("
+                " session_id TEXT PRIMARY KEY,"
+                " anchor TEXT NOT NULL,"
+                " content TEXT NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS turn_generations ("
+                " session_id TEXT PRIMARY KEY,"
+                " generation INTEGER NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS history_epochs ("
+                " session_id TEXT PRIMARY KEY,"
+                " epoch INTEGER NOT NULL)"
+            )
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            # Autocommit mode; writes manage their own BEGIN IMMEDIATE transactions
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL") # Durable across app crashes; fsync at checkpoints
+            conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def load(self, session_id, limit=None):
+        rows = self._connection().execute(
+            "SELECT role, content FROM messages WHERE session_id = ? ORDER BY seq DESC LIMIT ?",
+            (session_id, limit if limit else -1),
+        ).fetchall()
+        return [{"role": _ROLE_NAMES.get(role, role), "content": content} for role, content in reversed(rows)]
+
+    def append(self, session_id, messages, generation=None):
+        rows = [(session_id, _ROLE_CODES.get(m["role"], m["role"]), m["content"]) for m in messages]
+        with _transaction(self._connection()) as conn:
+            if generation is not None and generation != self._generation(conn, session_id):
+                raise StaleTurnError(f"Turn generation {generation} is stale") # Rolls back
+            version_before = self._version(conn, session_id)
+            conn.executemany("INSERT INTO messages (session_id, role, content) VALUES (?, ?, ?)", rows)
+            # Retention: keep only the newest N rows for this session
+            conn.execute(
+                "DELETE FROM messages WHERE session_id = ? AND seq <= ("
+                " SELECT seq FROM messages WHERE session_id = ? ORDER BY seq DESC LIMIT 1 OFFSET ?)",
+                (session_id, session_id, self.max_messages_per_session),
+            )
+            return version_before, self._version(conn, session_id)
+
+    def clear(self, session_id):
+        with _transaction(self._connection()) as conn:
+            self._bump_generation(conn, session_id)
+            conn.execute("INSERT OR IGNORE INTO history_epochs (session_id, epoch) VALUES (?, 0)", (session_id,))
+            conn.execute("UPDATE history_epochs SET epoch = epoch + 1 WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM summaries WHERE session_id = ?", (session_id,))
+            return conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,)).rowcount
+
+    def version(self, session_id):
+        return self._version(self._connection(), session_id)
+
+    def begin_turn(self, session_id):
+        with _transaction(self._connection()) as conn:
+            return self._bump_generation(conn, session_id)
+
+    def turn_generation(self, session_id):
+        return self._generation(self._connection(), session_id)
+
+    @staticmethod
+    def _bump_generation(conn, session_id):
+        conn.execute("INSERT OR IGNORE INTO turn_generations (session_id, generation) VALUES (?, 0)", (session_id,))
+        conn.execute("UPDATE turn_generations SET generation = generation + 1 WHERE session_id = ?", (session_id,))
+        return SQLiteConversationStore._generation(conn, session_id)
+
+    @staticmethod
+    def _generation(conn, session_id):
+        row = conn.execute("SELECT generation FROM turn_generations WHERE session_id = ?", (session_id,)).fetchone()
+        return row[0] if row else 0
+
+    def load_summary(self, session_id):
+        row = self._connection().execute(
+            "SELECT anchor, content FROM summaries WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return {"anchor": row[0], "content": row[1]} if row else None
+
+    def history_epoch(self, session_id):
+        return self._epoch(self._connection(), session_id)
+
+    def save_summary(self, session_id, anchor, content, epoch=None):
+        with _transaction(self._connection()) as conn:
+            if epoch is not None and epoch != self._epoch(conn, session_id):
+                return False # Cleared while the summary was being written
+            conn.execute(
+                "INSERT OR REPLACE INTO summaries (session_id, anchor, content) VALUES (?, ?, ?)",
+                (session_id, anchor, content),
+            )
+            return True
+
+    @staticmethod
+    def _epoch(conn, session_id):
+        row = conn.execute("SELECT epoch FROM history_epochs WHERE session_id = ?", (session_id,)).fetchone()
+        return row[0] if row else 0
+
+    @staticmethod
+    def _version(conn, session_id):
+        row = conn.execute(
+            "SELECT MAX(seq), COUNT(*) FROM messages WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return row if row[0] is not None else None
+
+
+class _transaction:
+    """BEGIN IMMEDIATE ... COMMIT/ROLLBACK on an autocommit connection."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+class CachedConversationStore(ConversationStore):
+    """In-process LRU in front of another store.
+
+    A cached history is reused only while the backend's ``version()`` for that session is
+    unchanged, so writes from other worker processes are picked up on the next load.
+    """
+
+    def __init__(self, backend, max_sessions=1024):
+        self.backend = backend
+        self.max_sessions = max_sessions
+        self._cache = OrderedDict() # session_id -> (version, messages)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, session_id, limit=None):
+        current_version = self.backend.version(session_id)
+        with self._lock:
+            cached = self._cache.get(session_id)
+            if cached is not None and cached[0] == current_version:
+                self._cache.move_to_end(session_id)
+                self.hits += 1
+                messages = cached[1]
+                return [dict(m) for m in (messages[-limit:] if limit else messages)]
+            self.misses += 1
+
+        messages = self.backend.load(session_id)
+        with self._lock:
+            self._cache[session_id] = (current_version, messages)
+            self._cache.move_to_end(session_id)
+            while len(self._cache) > self.max_sessions:
+                self._cache.popitem(last=False)
+        return [dict(m) for m in (messages[-limit:] if limit else messages)]
+
+    def append(self, session_id, messages, generation=None):
+        version_before, version_after = self.backend.append(session_id, messages, generation)
+        with self._lock:
+            cached = self._cache.get(session_id)
+            if cached is not None and cached[0] == version_before:
+                # Nobody else wrote in between, so extend the cached copy instead of reloading
+                retained = (cached[1] + [dict(m) for m in messages])[-self.backend.max_messages_per_session:]
+                self._cache[session_id] = (version_after, retained)
+            else:
+                self._cache.pop(session_id, None)
+        return version_before, version_after
+
+    def clear(self, session_id):
+        with self._lock:
+            self._cache.pop(session_id, None)
+        return self.backend.clear(session_id)
+
+    def version(self, session_id):
+        return self.backend.version(session_id)
+
+    def begin_turn(self, session_id):
+        return self.backend.begin_turn(session_id)
+
+    def turn_generation(self, session_id):
+        return self.backend.turn_generation(session_id)
+
+    def history_epoch(self, session_id):
+        return self.backend.history_epoch(session_id)
+
+    def load_summary(self, session_id):
+        return self.backend.load_summary(session_id)
+
+    def save_summary(self, session_id, anchor, content, epoch=None):
+        return self.backend.save_summary(session_id, anchor, content, epoch)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "sessions_cached": len(self._cache),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+def create_conversation_store(backend="sqlite", path=None, max_messages_per_session=200, cache_sessions=1024):
+    """Builds the configured store: 'sqlite' (default, multi-process safe) or 'memory'."""
+    if backend == "memory":
+        store = MemoryConversationStore(max_messages_per_session)
+    elif backend == "sqlite":
+        store = SQLiteConversationStore(path or "conversations.db", max_messages_per_session)
+    else:
+        raise ValueError(f"Unknown conversation store backend: {backend}")
+    return CachedConversationStore(store, max_sessions=cache_sessions)
@@ -0,0 +1,170 @@
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Upstream responses worth retrying; everything else is returned to the caller as-is.
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised instead of calling a host whose circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open -> half-open (one probe) -> closed."""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        """Returns True if a call may go out now."""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+
+class OutboundClient:
+    """Shared HTTP client: one pooled keep-alive Session and one breaker per host."""
+
+    def __init__(self, connect_timeout=3.05, read_timeout=10.0, retries=2, backoff_base=0.2,
+                 backoff_max=2.0, pool_size=10, failure_threshold=5, reset_timeout=30.0):
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.pool_size = pool_size
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._sessions = {}
+        self._breakers = {}
+        self._lock = threading.Lock()
+        self.requests_sent = 0
+        self.retries_made = 0
+        self.short_circuited = 0
+
+    def _host_state(self, url):
+        parts = urlsplit(url)
+        host = f"{parts.scheme}://{parts.netloc}"
+        with self._lock:
+            if host not in self._sessions:
+                session = requests.Session()
+                # Retries are handled here so the breaker sees every attempt
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+                session.mount(host, adapter)
+                self._sessions[host] = session
+                self._breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return host, self._sessions[host], self._breakers[host]
+
+    def _backoff(self, attempt, retry_after=None):
+        if retry_after is not None:
+            delay = min(retry_after, self.backoff_max)
+        else:
+            # "Full jitter": uniform in [0, base * 2^attempt], capped
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        time.sleep(delay)
+
+    def get(self, url, params=None, **kwargs):
+        """GET with timeouts, bounded jittered retries and a per-host circuit breaker.
+
+        Raises a ``requests.exceptions.RequestException`` subclass on failure, so callers
+        can keep their existing fallback handling.
+        """
+        host, session, breaker = self._host_state(url)
+        kwargs.setdefault("timeout", self.timeout)
+
+        for attempt in range(self.retries + 1):
+            if not breaker.allow():
+                self.short_circuited += 1
+                raise CircuitOpenError(f"Circuit open for {host}")
+            try:
+                self.requests_sent += 1
+                response = session.get(url, params=params, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                breaker.record_failure()
+                if attempt >= self.retries:
+                    raise
+                self.retries_made += 1
+                self._backoff(attempt)
+                continue
+            except requests.exceptions.RequestException:
+                # Not retried (e.g. a truncated body), but still a failure: a half-open probe
+                # that ends here must re-open the breaker instead of staying "in progress"
+                breaker.record_failure()
+                raise
+
+            if response.status_code in RETRY_STATUSES:
+                breaker.record_failure()
+                if attempt < self.retries:
+                    self.retries_made += 1
+                    self._backoff(attempt, _retry_after_seconds(response))
+                    continue
+            else:
+                breaker.record_success()
+            return response
+
+    def stats(self):
+        with self._lock:
+            breakers = {host: {"state": b.state, "consecutive_failures": b.failures}
+                        for host, b in self._breakers.items()}
+        return {
+            "requests_sent": self.requests_sent,
+            "retries": self.retries_made,
+            "short_circuited": self.short_circuited,
+            "hosts": breakers,
+        }
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+            self._breakers.clear()
+
+    def reset_after_fork(self):
+        """Drops pooled connections inherited from the parent process without closing them."""
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._breakers = {}
+
+
+def _retry_after_seconds(response):
+    value = response.headers.get("Retry-After")
+    try:
+        return max(float(value), 0.0) if value is not None else None
+    except ValueError:
+        return None
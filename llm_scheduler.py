@@ -0,0 +1,312 @@
+import heapq
+import itertools
+import random
+import re
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from metrics import REGISTRY, Counter, Gauge, Histogram
+
+PRIORITY_INTERACTIVE = 0 # A user is waiting on the reply
+PRIORITY_BACKGROUND = 10 # Summaries and other work nobody is waiting on
+
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "naru_llm_queue_depth", "LLM calls waiting for admission."))
+IN_FLIGHT = REGISTRY.register(Gauge(
+    "naru_llm_in_flight", "LLM calls admitted and not yet finished."))
+QUEUE_WAIT_SECONDS = REGISTRY.register(Histogram(
+    "naru_llm_queue_wait_seconds", "Time from enqueue to admission (or rejection).", ("priority", "outcome")))
+ADMISSIONS_TOTAL = REGISTRY.register(Counter(
+    "naru_llm_admissions_total", "Admission decisions by outcome.", ("outcome",)))
+RETRIES_TOTAL = REGISTRY.register(Counter(
+    "naru_llm_retries_total", "Retried LLM calls by upstream status.", ("status",)))
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+class LLMOverloadedError(Exception):
+    """The scheduler can't take the call now; ``retry_after`` is a hint in seconds."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Continuously refilling bucket sized to one minute of quota; 0 means unlimited."""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    @property
+    def unlimited(self):
+        return self.capacity <= 0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until ``amount`` tokens are available (0 if they are now)."""
+        if self.unlimited:
+            return 0.0
+        self._refill(now)
+        amount = min(amount, self.capacity) # A call bigger than the whole quota waits for a full bucket
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def consume(self, amount, now):
+        if not self.unlimited:
+            self._refill(now)
+            self.tokens -= min(amount, self.capacity)
+
+    def refund(self, amount):
+        """Returns over-estimated tokens (or charges under-estimated ones when negative)."""
+        if not self.unlimited:
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+def per_worker_quota(per_minute, workers, name="quota"):
+    """One worker's share of an account-wide per-minute quota (0 = unlimited stays unlimited).
+
+    Never rounds down to 0, which TokenBucket would read as unlimited: with more workers
+    than the quota each still gets 1/minute, so the account can overshoot by up to
+    ``workers - per_minute`` and a warning says so.
+    """
+    if per_minute <= 0:
+        return per_minute
+    workers = max(workers, 1)
+    if per_minute < workers:
+        print(f"Warning: {name} of {per_minute}/min is less than one per worker ({workers} workers); "
+              f"each worker is allowed 1/min, up to {workers}/min in total. Lower WEB_CONCURRENCY to stay within it.")
+    return max(per_minute // workers, 1)
+
+
+def _parse_duration(value):
+    """'1.5', '7.66s', '2m59.56s' or an HTTP date -> seconds."""
+    value = (value or "").strip()
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if parts:
+        return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_after_from(exc):
+    """Reads Retry-After (or Groq's x-ratelimit-reset-* headers) off an API error."""
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    for name in ("retry-after", "x-ratelimit-reset-requests", "x-ratelimit-reset-tokens"):
+        seconds = _parse_duration(headers.get(name))
+        if seconds is not None:
+            return seconds
+    return None
+
+
+class Ticket:
+    """An admitted call. Pass it back to ``release`` (idempotent) when the call is finished."""
+
+    def __init__(self, priority, estimated_tokens, waited):
+        self.priority = priority
+        self.estimated_tokens = estimated_tokens
+        self.waited = waited
+        self.used_tokens = None # Set once known so the token bucket can be corrected
+        self.released = False
+
+
+class LLMScheduler:
+    """Admission control in front of the LLM: quota buckets, bounded priority queue, retries.
+
+    A call is admitted when it is the highest-priority waiter, fewer than
+    ``max_concurrency`` calls are in flight, the requests/minute and tokens/minute
+    buckets can cover it, and no upstream Retry-After is pending. When ``max_queue``
+    callers are already waiting, or admission takes longer than ``queue_timeout``,
+    LLMOverloadedError is raised so the request can fail fast instead of holding a thread.
+    Errors of the ``retryable`` types are retried up to ``max_retries`` times; ``retryable``
+    may also be a function returning the types, called on the first error so the client
+    library needn't be imported up front. A 429 pauses admissions for everyone until the
+    Retry-After has passed.
+    """
+
+    def __init__(self, requests_per_minute=30, tokens_per_minute=6000, max_concurrency=8, max_queue=32,
+                 queue_timeout=10.0, max_retries=2, backoff_base=0.5, max_retry_wait=20.0, retryable=()):
+        self._rpm = TokenBucket(requests_per_minute)
+        self._tpm = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.max_retry_wait = max_retry_wait
+        self._retryable = retryable if callable(retryable) else tuple(retryable)
+        self._cond = threading.Condition()
+        self._waiters = [] # heap of [priority, seq]
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+        self.rate_limited = 0
+        self.retries = 0
+        self.wait_seconds_total = 0.0
+
+    @property
+    def retryable(self):
+        if callable(self._retryable):
+            self._retryable = tuple(self._retryable())
+        return self._retryable
+
+    def reset_after_fork(self):
+        """Starts a forked child with an empty queue; waiters and in-flight calls belong to the parent."""
+        self._cond = threading.Condition()
+        self._waiters = []
+        self.in_flight = 0
+        QUEUE_DEPTH.set(0)
+        IN_FLIGHT.set(0)
+
+    def _admission_wait(self, estimated_tokens, now):
+        """Seconds until the head waiter can go; None to wait for a release."""
+        if self.in_flight >= self.max_concurrency:
+            return None
+        return max(self._paused_until - now, self._rpm.wait_time(1, now), self._tpm.wait_time(estimated_tokens, now), 0.0)
+
+    def _retry_hint(self, now):
+        return round(max(self._paused_until - now, self._rpm.wait_time(1, now), 1.0), 1)
+
+    def acquire(self, priority=PRIORITY_INTERACTIVE, estimated_tokens=0, timeout=None):
+        """Blocks until the call may start and returns its Ticket; raises LLMOverloadedError."""
+        timeout = self.queue_timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        with self._cond:
+            # Only callers that would actually have to wait count against the queue bound
+            if len(self._waiters) >= self.max_queue and (self._waiters or self._admission_wait(estimated_tokens, started) != 0):
+                self.rejected_full += 1
+                ADMISSIONS_TOTAL.inc(outcome="queue_full")
+                QUEUE_WAIT_SECONDS.observe(0.0, priority=priority, outcome="queue_full")
+                raise LLMOverloadedError(f"LLM queue full ({self.max_queue} waiting)", self._retry_hint(started))
+            waiter = [priority, next(self._seq)]
+            heapq.heappush(self._waiters, waiter)
+            QUEUE_DEPTH.set(len(self._waiters))
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = self._admission_wait(estimated_tokens, now) if self._waiters[0] is waiter else None
+                    if wait == 0:
+                        break
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self.rejected_timeout += 1
+                        ADMISSIONS_TOTAL.inc(outcome="timeout")
+                        QUEUE_WAIT_SECONDS.observe(now - started, priority=priority, outcome="timeout")
+                        raise LLMOverloadedError(
+                            f"LLM admission timed out after {timeout:.1f}s", self._retry_hint(now))
+                    self._cond.wait(remaining if wait is None else min(wait, remaining))
+            except BaseException:
+                self._waiters.remove(waiter)
+                heapq.heapify(self._waiters)
+                QUEUE_DEPTH.set(len(self._waiters))
+                self._cond.notify_all()
+                raise
+
+            heapq.heappop(self._waiters)
+            self._rpm.consume(1, now)
+            self._tpm.consume(estimated_tokens, now)
+            self.in_flight += 1
+            self.admitted += 1
+            waited = now - started
+            self.wait_seconds_total += waited
+            QUEUE_DEPTH.set(len(self._waiters))
+            IN_FLIGHT.set(self.in_flight)
+            self._cond.notify_all() # The next head may be admissible too
+        ADMISSIONS_TOTAL.inc(outcome="admitted")
+        QUEUE_WAIT_SECONDS.observe(waited, priority=priority, outcome="admitted")
+        return Ticket(priority, estimated_tokens, waited)
+
+    def release(self, ticket):
+        with self._cond:
+            if ticket.released:
+                return
+            ticket.released = True
+            self.in_flight -= 1
+            if ticket.used_tokens is not None:
+                self._tpm.refund(ticket.estimated_tokens - ticket.used_tokens)
+            IN_FLIGHT.set(self.in_flight)
+            self._cond.notify_all()
+
+    def _invoke(self, fn):
+        attempt = 0
+        while True:
+            try:
+                return fn()
+            except self.retryable as e:
+                status = getattr(e, "status_code", None)
+                retry_after = retry_after_from(e)
+                if status == 429:
+                    with self._cond:
+                        self.rate_limited += 1
+                        # Hold back every caller, not just this one, until the quota window resets
+                        pause = retry_after if retry_after is not None else self.backoff_base * 2 ** attempt
+                        self._paused_until = max(self._paused_until, time.monotonic() + pause)
+                delay = retry_after if retry_after is not None else random.uniform(0, self.backoff_base * 2 ** attempt)
+                if attempt >= self.max_retries or delay > self.max_retry_wait:
+                    if status == 429:
+                        raise LLMOverloadedError("LLM rate limit exceeded", retry_after) from e
+                    raise
+                attempt += 1
+                with self._cond:
+                    self.retries += 1
+                    self._rpm.consume(1, time.monotonic())
+                RETRIES_TOTAL.inc(status=status or "connection")
+                print(f"⏳ LLM call failed ({status or type(e).__name__}); retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+
+    def call(self, fn, priority=PRIORITY_INTERACTIVE, estimated_tokens=0, ticket=None):
+        """Runs ``fn()`` (a non-streaming completion) under admission control."""
+        ticket = ticket or self.acquire(priority, estimated_tokens)
+        try:
+            result = self._invoke(fn)
+            usage = getattr(result, "usage", None)
+            if getattr(usage, "total_tokens", None):
+                ticket.used_tokens = usage.total_tokens
+            return result
+        finally:
+            self.release(ticket)
+
+    def stream(self, fn, ticket):
+        """Iterates the stream returned by ``fn()``, holding ``ticket`` until it is exhausted or closed."""
+        stream = None
+        try:
+            stream = self._invoke(fn)
+            yield from stream
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close() # Drops the upstream response, so a stream closed early stops generating
+            self.release(ticket)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "queue_depth": len(self._waiters),
+                "in_flight": self.in_flight,
+                "admitted": self.admitted,
+                "rejected_queue_full": self.rejected_full,
+                "rejected_timeout": self.rejected_timeout,
+                "rate_limited": self.rate_limited,
+                "retries": self.retries,
+                "mean_wait_ms": round(self.wait_seconds_total / self.admitted * 1000, 1) if self.admitted else 0.0,
+                "paused_for_seconds": round(max(self._paused_until - time.monotonic(), 0.0), 1),
+            }
@@ -0,0 +1,160 @@
+import concurrent.futures
+import re
+import threading
+import time
+
+from metrics import REGISTRY, Counter, Histogram
+
+MODEL_SECONDS = REGISTRY.register(Histogram(
+    "naru_llm_model_seconds", "LLM latency per model: full completion, or first streamed chunk.",
+    ("model", "kind", "outcome")))
+ROUTES_TOTAL = REGISTRY.register(Counter(
+    "naru_llm_routes_total", "Routing decisions by route and reason.", ("route", "reason")))
+HEDGES_TOTAL = REGISTRY.register(Counter(
+    "naru_llm_hedges_total", "Hedged requests: fired, won by the hedge, or skipped (no capacity).", ("outcome",)))
+
+# Asking for depth in English or Hinglish ("explain in detail", "tell me more", "detail mein batao", ...)
+DETAIL_PATTERN = re.compile(
+    r"\b(in detail|detail(ed)? (mein|me|main|se)|tell me more|explain|elaborate|step by step|"
+    r"samjha(o|na|de|do)?|vistar|poora bata|deep dive|breakdown|compare|pros and cons|why does|how does)\b",
+    re.IGNORECASE,
+)
+
+
+class Route:
+    def __init__(self, name, model, max_tokens, reason):
+        self.name = name
+        self.model = model
+        self.max_tokens = max_tokens
+        self.reason = reason
+
+    def __repr__(self):
+        return f"Route({self.name}, {self.model}, max_tokens={self.max_tokens}, {self.reason})"
+
+
+class ModelRouter:
+    """Sends casual turns to a small fast model and detail requests to the large one.
+
+    Optionally hedges: if the first request hasn't answered after ``hedge_delay`` seconds,
+    a second identical request is fired (to ``hedge_model``, default the same model) and
+    whichever answers first wins. The loser is discarded once it finishes. ``hedge_delay``
+    of 0 turns hedging off.
+    """
+
+    def __init__(self, small_model, large_model, small_max_tokens=200, large_max_tokens=500,
+                 long_input_words=40, enabled=True, hedge_delay=0.0, hedge_model=None, hedge_workers=16):
+        self.small_model = small_model
+        self.large_model = large_model
+        self.small_max_tokens = small_max_tokens
+        self.large_max_tokens = large_max_tokens
+        self.long_input_words = long_input_words
+        self.enabled = enabled
+        self.hedge_delay = hedge_delay
+        self.hedge_model = hedge_model
+        self.hedge_workers = hedge_workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self.reset_after_fork()
+        self.routes = {}
+        self.hedges_fired = 0
+        self.hedges_won = 0
+        self.hedges_skipped = 0
+
+    def reset_after_fork(self):
+        """(Re)creates the hedge pool; a forked child can't use the parent's threads."""
+        self._lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.hedge_workers, thread_name_prefix="llm-hedge") if self.hedge_delay > 0 else None
+
+    def route(self, user_text):
+        """Picks the model and completion budget for a turn."""
+        if not self.enabled:
+            route = Route("large", self.large_model, self.large_max_tokens, "routing_disabled")
+        elif DETAIL_PATTERN.search(user_text or ""):
+            route = Route("large", self.large_model, self.large_max_tokens, "detail_request")
+        elif len((user_text or "").split()) > self.long_input_words:
+            route = Route("large", self.large_model, self.large_max_tokens, "long_input")
+        else:
+            route = Route("small", self.small_model, self.small_max_tokens, "casual")
+        ROUTES_TOTAL.inc(route=route.name, reason=route.reason)
+        with self._lock:
+            self.routes[route.name] = self.routes.get(route.name, 0) + 1
+        return route
+
+    @staticmethod
+    def timed(model, fn, kind="completion"):
+        """Wraps ``fn`` so its latency is recorded against ``model``."""
+        def run():
+            started = time.perf_counter()
+            try:
+                result = fn()
+            except Exception:
+                MODEL_SECONDS.observe(time.perf_counter() - started, model=model, kind=kind, outcome="error")
+                raise
+            MODEL_SECONDS.observe(time.perf_counter() - started, model=model, kind=kind, outcome="ok")
+            return result
+        return run
+
+    def hedged(self, primary, make_backup, discard=None):
+        """Runs ``primary()``, racing it against a backup when it is slow.
+
+        ``make_backup()`` is called only once the hedge delay has passed. It returns the
+        backup callable, or None if no backup should be fired (e.g. no LLM capacity).
+        ``discard(result)`` is called with the losing result when it arrives (to close a
+        stream). Returns (result, "primary" | "hedge").
+        """
+        if self._executor is None:
+            return primary(), "primary"
+        first = self._executor.submit(primary)
+        try:
+            return first.result(timeout=self.hedge_delay), "primary"
+        except concurrent.futures.TimeoutError:
+            pass
+
+        backup = make_backup()
+        if backup is None:
+            HEDGES_TOTAL.inc(outcome="skipped")
+            with self._lock:
+                self.hedges_skipped += 1
+            return first.result(), "primary"
+        HEDGES_TOTAL.inc(outcome="fired")
+        with self._lock:
+            self.hedges_fired += 1
+        second = self._executor.submit(backup)
+        pending = {first: "primary", second: "hedge"}
+        error = None
+        while pending:
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                name = pending.pop(future)
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                for loser in pending:
+                    if discard is not None:
+                        loser.add_done_callback(lambda f: f.exception() is None and discard(f.result()))
+                if name == "hedge":
+                    HEDGES_TOTAL.inc(outcome="won")
+                    with self._lock:
+                        self.hedges_won += 1
+                return future.result(), name
+        raise error
+
+    def stats(self):
+        with self._lock:
+            stats = {f"routed_{name}": count for name, count in self.routes.items()}
+            stats.update(hedges_fired=self.hedges_fired, hedges_won=self.hedges_won,
+                         hedges_skipped=self.hedges_skipped, hedge_delay=self.hedge_delay)
+            return stats
+
+
+def first_chunk(open_stream):
+    """Opens a stream and pulls its first chunk: (iterator, chunk or None)."""
+    iterator = iter(open_stream())
+    return iterator, next(iterator, None)
+
+
+def close_stream(opened):
+    close = getattr(opened[0], "close", None)
+    if close is not None:
+        close()
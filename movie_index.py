@@ -0,0 +1,149 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    return _TOKEN.findall((text or "").lower())
+
+
+def normalize_query(query):
+    """Lower-cased, punctuation-free, whitespace-collapsed query used as the cache key."""
+    return " ".join(tokenize(query))
+
+
+class MovieIndex:
+    """TTL/LRU cache of TMDB result lists plus an inverted index over the cached movies.
+
+    ``fetch(query)`` returns TMDB result dicts (id, title, overview, release_date,
+    vote_average, popularity) and is only called on a cache miss. Every cached movie is
+    indexed by the tokens of its title and overview, so filters such as a streaming platform
+    are answered by intersecting posting lists instead of re-querying or rescanning text.
+    A movie leaves the index once no cached query references it. Expired entries are
+    still served if TMDB can't be reached.
+    """
+
+    def __init__(self, fetch, ttl=6 * 3600, max_queries=512):
+        self._fetch = fetch
+        self.ttl = ttl
+        self.max_queries = max_queries
+        self._queries = OrderedDict()  # normalized query -> (movie ids, fetched_at)
+        self._movies = {}  # movie id -> result dict
+        self._refs = {}  # movie id -> number of cached queries listing it
+        self._postings = {}  # token -> set of movie ids
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.fetch_errors = 0
+        self.evictions = 0
+
+    def _index_movie(self, movie):
+        movie_id = movie["id"]
+        self._refs[movie_id] = self._refs.get(movie_id, 0) + 1
+        if movie_id in self._movies:
+            return
+        self._movies[movie_id] = movie
+        for token in set(tokenize(movie.get("title")) + tokenize(movie.get("overview"))):
+            self._postings.setdefault(token, set()).add(movie_id)
+
+    def _release_movie(self, movie_id):
+        self._refs[movie_id] -= 1
+        if self._refs[movie_id]:
+            return
+        del self._refs[movie_id]
+        movie = self._movies.pop(movie_id)
+        for token in set(tokenize(movie.get("title")) + tokenize(movie.get("overview"))):
+            ids = self._postings.get(token)
+            if ids is not None:
+                ids.discard(movie_id)
+                if not ids:
+                    del self._postings[token]
+
+    def _store(self, key, results):
+        ids = []
+        for movie in results:
+            if movie.get("id") is None or not movie.get("title"):
+                continue
+            self._index_movie(movie)
+            ids.append(movie["id"])
+        old = self._queries.pop(key, None)
+        if old is not None:
+            for movie_id in old[0]:
+                self._release_movie(movie_id)
+        self._queries[key] = (ids, time.monotonic())
+        while len(self._queries) > self.max_queries:
+            _, (evicted_ids, _) = self._queries.popitem(last=False)
+            for movie_id in evicted_ids:
+                self._release_movie(movie_id)
+            self.evictions += 1
+        return ids
+
+    def _cached_ids(self, key):
+        """Returns (ids, fresh) for a cached query, or (None, False)."""
+        entry = self._queries.get(key)
+        if entry is None:
+            return None, False
+        self._queries.move_to_end(key)
+        ids, fetched_at = entry
+        return ids, time.monotonic() - fetched_at < self.ttl
+
+    def matching(self, text):
+        """Ids of cached movies whose title/overview contain every token of ``text``."""
+        tokens = tokenize(text)
+        if not tokens:
+            return set()
+        with self._lock:
+            postings = [self._postings.get(token, set()) for token in tokens]
+            return set.intersection(*postings) if postings else set()
+
+    def search(self, query, platform=None, limit=4):
+        """Returns up to ``limit`` result dicts; cached queries are answered without TMDB.
+
+        With ``platform``, movies mentioning it come first, then the rest of the results.
+        """
+        key = normalize_query(query)
+        with self._lock:
+            ids, fresh = self._cached_ids(key)
+            if fresh:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if not fresh:
+            try:
+                results = self._fetch(query)
+                with self._lock:
+                    ids = self._store(key, results)
+            except Exception as e:
+                with self._lock:
+                    self.fetch_errors += 1
+                    if ids is not None:
+                        self.stale_hits += 1
+                if ids is None:
+                    raise
+                print(f"Warning: TMDB lookup failed, serving cached results for '{key}': {e}")
+
+        if platform:
+            on_platform = self.matching(platform)
+            ids = [i for i in ids if i in on_platform] + [i for i in ids if i not in on_platform]
+        with self._lock:
+            return [self._movies[i] for i in ids[:limit] if i in self._movies]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale_hits": self.stale_hits,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+                "fetch_errors": self.fetch_errors,
+                "evictions": self.evictions,
+                "queries_cached": len(self._queries),
+                "movies_indexed": len(self._movies),
+                "index_tokens": len(self._postings),
+            }
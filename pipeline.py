@@ -0,0 +1,45 @@
+import time
+from contextlib import contextmanager
+
+from metrics import REGISTRY, Counter, Histogram
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "naru_stage_duration_seconds", "Time spent in each stage of a conversational turn.", ("endpoint", "stage")))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "naru_request_duration_seconds", "End-to-end handler time.", ("endpoint",)))
+REQUESTS_TOTAL = REGISTRY.register(Counter(
+    "naru_requests_total", "Handled requests by endpoint and HTTP status.", ("endpoint", "status")))
+
+
+class TurnTrace:
+    """Times the stages of one request into the stage histograms."""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def record(self, name, seconds):
+        self.stages.append((name, seconds))
+        STAGE_SECONDS.observe(seconds, endpoint=self.endpoint, stage=name)
+
+    def finish(self, status):
+        total = time.perf_counter() - self.started
+        REQUEST_SECONDS.observe(total, endpoint=self.endpoint)
+        REQUESTS_TOTAL.inc(endpoint=self.endpoint, status=status)
+        return total
+
+    def server_timing(self, total=None):
+        """Formats the stage breakdown as a Server-Timing header value (durations in ms)."""
+        parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages]
+        if total is not None:
+            parts.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(parts)
@@ -0,0 +1,182 @@
+import json
+import math
+import threading
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Major cities as (name, state, latitude, longitude). Add more through PLACES_FILE rather than here.
+CITIES = (
+    ("Mumbai", "Maharashtra", 19.0760, 72.8777),
+    ("Pune", "Maharashtra", 18.5204, 73.8567),
+    ("Nagpur", "Maharashtra", 21.1458, 79.0882),
+    ("Nashik", "Maharashtra", 19.9975, 73.7898),
+    ("Aurangabad", "Maharashtra", 19.8762, 75.3433),
+    ("New Delhi", "Delhi", 28.6139, 77.2090),
+    ("Gurugram", "Haryana", 28.4595, 77.0266),
+    ("Faridabad", "Haryana", 28.4089, 77.3178),
+    ("Noida", "Uttar Pradesh", 28.5355, 77.3910),
+    ("Lucknow", "Uttar Pradesh", 26.8467, 80.9462),
+    ("Kanpur", "Uttar Pradesh", 26.4499, 80.3319),
+    ("Varanasi", "Uttar Pradesh", 25.3176, 82.9739),
+    ("Agra", "Uttar Pradesh", 27.1767, 78.0081),
+    ("Prayagraj", "Uttar Pradesh", 25.4358, 81.8463),
+    ("Meerut", "Uttar Pradesh", 28.9845, 77.7064),
+    ("Bengaluru", "Karnataka", 12.9716, 77.5946),
+    ("Mysuru", "Karnataka", 12.2958, 76.6394),
+    ("Mangaluru", "Karnataka", 12.9141, 74.8560),
+    ("Hubballi", "Karnataka", 15.3647, 75.1240),
+    ("Chennai", "Tamil Nadu", 13.0827, 80.2707),
+    ("Coimbatore", "Tamil Nadu", 11.0168, 76.9558),
+    ("Madurai", "Tamil Nadu", 9.9252, 78.1198),
+    ("Tiruchirappalli", "Tamil Nadu", 10.7905, 78.7047),
+    ("Hyderabad", "Telangana", 17.3850, 78.4867),
+    ("Warangal", "Telangana", 17.9689, 79.5941),
+    ("Visakhapatnam", "Andhra Pradesh", 17.6868, 83.2185),
+    ("Vijayawada", "Andhra Pradesh", 16.5062, 80.6480),
+    ("Guntur", "Andhra Pradesh", 16.3067, 80.4365),
+    ("Tirupati", "Andhra Pradesh", 13.6288, 79.4192),
+    ("Kolkata", "West Bengal", 22.5726, 88.3639),
+    ("Siliguri", "West Bengal", 26.7271, 88.3953),
+    ("Ahmedabad", "Gujarat", 23.0225, 72.5714),
+    ("Surat", "Gujarat", 21.1702, 72.8311),
+    ("Vadodara", "Gujarat", 22.3072, 73.1812),
+    ("Rajkot", "Gujarat", 22.3039, 70.8022),
+    ("Jaipur", "Rajasthan", 26.9124, 75.7873),
+    ("Jodhpur", "Rajasthan", 26.2389, 73.0243),
+    ("Udaipur", "Rajasthan", 24.5854, 73.7125),
+    ("Kota", "Rajasthan", 25.2138, 75.8648),
+    ("Bhopal", "Madhya Pradesh", 23.2599, 77.4126),
+    ("Indore", "Madhya Pradesh", 22.7196, 75.8577),
+    ("Gwalior", "Madhya Pradesh", 26.2183, 78.1828),
+    ("Jabalpur", "Madhya Pradesh", 23.1815, 79.9864),
+    ("Patna", "Bihar", 25.5941, 85.1376),
+    ("Gaya", "Bihar", 24.7914, 85.0002),
+    ("Ranchi", "Jharkhand", 23.3441, 85.3096),
+    ("Jamshedpur", "Jharkhand", 22.8046, 86.2029),
+    ("Bhubaneswar", "Odisha", 20.2961, 85.8245),
+    ("Cuttack", "Odisha", 20.4625, 85.8830),
+    ("Raipur", "Chhattisgarh", 21.2514, 81.6296),
+    ("Chandigarh", "Chandigarh", 30.7333, 76.7794),
+    ("Ludhiana", "Punjab", 30.9010, 75.8573),
+    ("Amritsar", "Punjab", 31.6340, 74.8723),
+    ("Dehradun", "Uttarakhand", 30.3165, 78.0322),
+    ("Shimla", "Himachal Pradesh", 31.1048, 77.1734),
+    ("Srinagar", "Jammu and Kashmir", 34.0837, 74.7973),
+    ("Jammu", "Jammu and Kashmir", 32.7266, 74.8570),
+    ("Leh", "Ladakh", 34.1526, 77.5771),
+    ("Guwahati", "Assam", 26.1445, 91.7362),
+    ("Shillong", "Meghalaya", 25.5788, 91.8933),
+    ("Imphal", "Manipur", 24.8170, 93.9368),
+    ("Aizawl", "Mizoram", 23.7271, 92.7176),
+    ("Kohima", "Nagaland", 25.6751, 94.1086),
+    ("Agartala", "Tripura", 23.8315, 91.2868),
+    ("Gangtok", "Sikkim", 27.3389, 88.6065),
+    ("Itanagar", "Arunachal Pradesh", 27.0844, 93.6053),
+    ("Panaji", "Goa", 15.4909, 73.8278),
+    ("Thiruvananthapuram", "Kerala", 8.5241, 76.9366),
+    ("Kochi", "Kerala", 9.9312, 76.2673),
+    ("Kozhikode", "Kerala", 11.2588, 75.7804),
+    ("Puducherry", "Puducherry", 11.9416, 79.8083),
+    ("Port Blair", "Andaman and Nicobar Islands", 11.6234, 92.7265),
+    ("Kavaratti", "Lakshadweep", 10.5669, 72.6420),
+    ("Silvassa", "Dadra and Nagar Haveli and Daman and Diu", 20.2766, 73.0083),
+    ("Daman", "Dadra and Nagar Haveli and Daman and Diu", 20.3974, 72.8328),
+)
+
+
+class Place:
+    def __init__(self, name, region, latitude, longitude, kind="city"):
+        self.name = name
+        self.region = region
+        self.latitude = float(latitude)
+        self.longitude = float(longitude)
+        self.kind = kind
+
+    @property
+    def display_name(self):
+        return f"{self.name}, {self.region}"
+
+    def __repr__(self):
+        return f"Place({self.display_name}, {self.latitude}, {self.longitude}, {self.kind})"
+
+
+def _unit_vector(latitude, longitude):
+    lat, lon = math.radians(latitude), math.radians(longitude)
+    return (math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat))
+
+
+def _chord_to_km(chord):
+    return 2 * math.asin(min(chord / 2, 1.0)) * EARTH_RADIUS_KM
+
+
+class PlaceIndex:
+    """Nearest known place for a coordinate, answered by a KD-tree built once at startup.
+
+    Places are stored as 3-D unit vectors, so straight-line (chord) distance orders them
+    exactly like great-circle distance and the antimeridian needs no special casing.
+    """
+
+    def __init__(self, places):
+        self.places = list(places)
+        self._points = [_unit_vector(p.latitude, p.longitude) for p in self.places]
+        self._root = self._build(list(range(len(self.places))), 0)
+        self._lock = threading.Lock()
+        self.lookups = 0
+
+    def _build(self, indices, depth):
+        """Node: (place index, split axis, left subtree, right subtree)."""
+        if not indices:
+            return None
+        axis = depth % 3
+        indices.sort(key=lambda i: self._points[i][axis])
+        middle = len(indices) // 2
+        return (indices[middle], axis,
+                self._build(indices[:middle], depth + 1), self._build(indices[middle + 1:], depth + 1))
+
+    def nearest(self, latitude, longitude):
+        """Returns (place, distance_km), or (None, None) when the index is empty."""
+        target = _unit_vector(latitude, longitude)
+        best, best_distance = None, float("inf") # Squared chord length
+        stack = [(self._root, 0.0)]
+        while stack:
+            node, bound = stack.pop()
+            if node is None or bound >= best_distance:
+                continue
+            index, axis, left, right = node
+            point = self._points[index]
+            distance = sum((a - b) ** 2 for a, b in zip(point, target))
+            if distance < best_distance:
+                best, best_distance = index, distance
+            offset = target[axis] - point[axis]
+            near, far = (left, right) if offset < 0 else (right, left)
+            stack.append((far, offset * offset)) # Only worth visiting if the split plane is closer than the best so far
+            stack.append((near, 0.0))
+        with self._lock:
+            self.lookups += 1
+        if best is None:
+            return None, None
+        return self.places[best], _chord_to_km(math.sqrt(best_distance))
+
+    def stats(self):
+        with self._lock:
+            return {"places": len(self.places), "lookups": self.lookups}
+
+
+def load_places(states, path=None):
+    """Built-in cities, one entry per state centre, plus any places listed in ``path``.
+
+    ``states`` maps lower-case state names to (lat, lon). ``path`` is a JSON list of
+    {"name", "region", "latitude", "longitude"} objects.
+    """
+    places = [Place(name, region, lat, lon) for name, region, lat, lon in CITIES]
+    places += [Place(state.title(), "India", lat, lon, kind="state") for state, (lat, lon) in states.items()]
+    if path:
+        try:
+            with open(path, encoding="utf-8") as f:
+                extra = json.load(f)
+            places += [Place(p["name"], p.get("region", ""), p["latitude"], p["longitude"], p.get("kind", "city"))
+                       for p in extra]
+            print(f"📍 Loaded {len(extra)} extra places from {path}")
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Warning: Could not load places from {path}: {e}")
+    return places
@@ -0,0 +1,155 @@
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime
+
+from metrics import REGISTRY, Counter
+
+RESPONSE_CACHE_LOOKUPS = REGISTRY.register(Counter(
+    "naru_response_cache_lookups_total",
+    "Response cache lookups: hit, filling (key still collecting variants), miss or expired.", ("outcome",)))
+
+
+def normalize_text(text):
+    """Case, punctuation and spacing folded away: "What's the weather?!" -> "whats the weather"."""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    return " ".join(re.sub(r"[^\w\s]", "", text).split())
+
+
+def _bucket(value, step):
+    """Numbers floored to ``step``; fallbacks such as "N/A" or "Unavailable" pass through as-is."""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return value
+    return int(value // step) * step
+
+
+class _Entry:
+    __slots__ = ("created", "replies", "samples", "served")
+
+    def __init__(self, created):
+        self.created = created
+        self.replies = [] # Distinct replies
+        self.samples = 0 # LLM replies seen, duplicates included
+        self.served = 0
+
+
+class ResponseCache:
+    """Exact-match cache of whole replies for opening turns ("hi", "hello naru", ...).
+
+    Keyed by the normalized user input, the location, the weather and time of day in coarse
+    buckets, and the (short) history before the turn. Each key first samples ``variants``
+    replies from the LLM, then serves the distinct ones in rotation, so a repeated opener
+    isn't answered word for word every time. Keys expire ``ttl`` seconds after their first reply
+    and the least recently used are evicted past ``max_entries``. Only the text is kept
+    here; its audio comes from the TTS cache, which already holds it from the first time.
+    """
+
+    def __init__(self, max_entries=1024, ttl=1800.0, variants=3, max_history_messages=0, max_words=12,
+                 time_bucket_minutes=60, enabled=True):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.variants = max(variants, 1)
+        self.max_history_messages = max_history_messages
+        self.max_words = max_words
+        self.time_bucket_minutes = max(time_bucket_minutes, 1)
+        self.enabled = enabled
+        self._entries = OrderedDict() # key -> _Entry, least recently used first
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.filling = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.skipped = 0
+
+    def make_key(self, user_text, location_context, history, now=None):
+        """The cache key for a turn, or None if it shouldn't be cached (long input or history)."""
+        if not self.enabled:
+            return None
+        text = normalize_text(user_text)
+        if not text or len(text.split()) > self.max_words or len(history) > self.max_history_messages:
+            with self._lock:
+                self.skipped += 1
+            return None
+        try:
+            location_name, temp, weather, rain_chance, temp_max, temp_min = location_context
+            now = now or datetime.now()
+            time_bucket = f"{now:%Y-%m-%d} {(now.hour * 60 + now.minute) // self.time_bucket_minutes}"
+            weather_bucket = [_bucket(temp, 2), weather, _bucket(rain_chance, 20), _bucket(temp_max, 2),
+                              _bucket(temp_min, 2)]
+            earlier = [[m.get("role"), normalize_text(m.get("content"))] for m in history]
+            raw = json.dumps([text, location_name, weather_bucket, time_bucket, earlier], ensure_ascii=False)
+        except (TypeError, ValueError, AttributeError) as e:
+            # Never worth failing the turn over: it just isn't cached
+            print(f"Warning: Could not build a response cache key: {e}")
+            with self._lock:
+                self.skipped += 1
+            return None
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """A cached reply once the key has all its variants, else None."""
+        if key is None:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry.created > self.ttl:
+                del self._entries[key]
+                entry = None
+                outcome = "expired"
+                self.expired += 1
+            elif entry is None:
+                outcome = "miss"
+                self.misses += 1
+            elif entry.samples < self.variants:
+                outcome = "filling"
+                self.filling += 1
+            else:
+                self._entries.move_to_end(key)
+                reply = entry.replies[entry.served % len(entry.replies)]
+                entry.served += 1
+                self.hits += 1
+                RESPONSE_CACHE_LOOKUPS.inc(outcome="hit")
+                return reply
+        RESPONSE_CACHE_LOOKUPS.inc(outcome=outcome)
+        return None
+
+    def put(self, key, reply):
+        """Records a fresh LLM reply for the key; duplicates count as a sample but are stored once."""
+        if key is None or not reply or not reply.strip():
+            return
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry(time.monotonic())
+            if entry.samples < self.variants:
+                entry.samples += 1
+                if reply not in entry.replies:
+                    entry.replies.append(reply)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.filling + self.misses + self.expired
+            return {
+                "entries": len(self._entries),
+                "complete_entries": sum(1 for e in self._entries.values() if e.samples >= self.variants),
+                "hits": self.hits,
+                "filling": self.filling,
+                "misses": self.misses,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "skipped": self.skipped,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "variants": self.variants,
+                "ttl_seconds": self.ttl,
+                "enabled": self.enabled,
+            }
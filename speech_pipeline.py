@@ -0,0 +1,125 @@
+import asyncio
+import re
+
+# A sentence ends at . ! ? or the Devanagari danda, optionally followed by closing quotes/brackets,
+# and must be followed by whitespace (so "3.5" or "Mr.X" mid-token is not split). Newlines also split.
+_SENTENCE_BOUNDARY = re.compile(r"[.!?।]+[\"')\]]*\s+|\n+")
+
+MIN_SENTENCE_CHARS = 12
+
+
+class SentenceSplitter:
+    """Incrementally cuts a token stream into sentences suitable for TTS.
+
+    Fragments shorter than ``min_chars`` are merged into the following sentence so
+    edge-tts is not asked to synthesize lone words like "Arre!".
+    """
+
+    def __init__(self, min_chars=MIN_SENTENCE_CHARS):
+        self.min_chars = min_chars
+        self._buffer = ""
+
+    def feed(self, text):
+        """Adds text and returns the sentences completed by it."""
+        self._buffer += text
+        sentences = []
+        start = 0
+        for match in _SENTENCE_BOUNDARY.finditer(self._buffer):
+            candidate = self._buffer[start:match.end()].strip()
+            if len(candidate) >= self.min_chars:
+                sentences.append(candidate)
+                start = match.end()
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def flush(self):
+        """Returns whatever is left once the token stream has ended."""
+        remainder, self._buffer = self._buffer.strip(), ""
+        return [remainder] if remainder else []
+
+
+def _close_quietly(generator):
+    try:
+        generator.close()
+    except ValueError:
+        pass # Running on another thread, which closes it itself
+
+
+async def _aiter_from_sync(iterable):
+    """Pulls a blocking iterator from a worker thread so the event loop stays free.
+
+    Closing (or cancelling) this closes the iterator too, so a generator holding an upstream
+    stream releases it. A generator can't be closed mid-``next()``, so if the worker thread
+    is still in one, the iterator is closed as soon as that call returns.
+    """
+    loop = asyncio.get_running_loop()
+    iterator = iter(iterable)
+    end = object()
+    pending = None
+    try:
+        while True:
+            # Shielded: cancelling the wait mustn't mark the call done while the thread still runs it
+            pending = loop.run_in_executor(None, next, iterator, end)
+            item = await asyncio.shield(pending)
+            if item is end:
+                return
+            yield item
+    finally:
+        if hasattr(iterator, "close"):
+            if pending is not None and not pending.done():
+                pending.add_done_callback(lambda _: loop.run_in_executor(None, _close_quietly, iterator))
+            else:
+                _close_quietly(iterator)
+
+
+async def pipelined_audio(sentences, synthesize, max_parallel=3):
+    """Synthesizes sentences concurrently and yields their audio chunks in sentence order.
+
+    ``sentences`` is a (sync or async) iterable of text and ``synthesize(text)`` an async
+    generator of audio byte chunks. At most ``max_parallel`` sentences are synthesized at
+    once. The head sentence is streamed live; later ones buffer their chunks in a list-backed
+    queue until their turn, so no audio is ever concatenated.
+    """
+    if not hasattr(sentences, "__aiter__"):
+        sentences = _aiter_from_sync(sentences)
+
+    semaphore = asyncio.Semaphore(max_parallel)
+    ordered_outputs = asyncio.Queue()
+    tasks = []
+
+    async def synthesize_into(text, output):
+        try:
+            async with semaphore:
+                async for data in synthesize(text):
+                    output.put_nowait(data)
+        except Exception as e:
+            print(f"❌ Error in TTS generation for sentence {text[:30]!r}: {e}")
+        finally:
+            output.put_nowait(None)
+
+    async def produce():
+        try:
+            async for sentence in sentences:
+                output = asyncio.Queue()
+                tasks.append(asyncio.ensure_future(synthesize_into(sentence, output)))
+                ordered_outputs.put_nowait(output)
+        finally:
+            ordered_outputs.put_nowait(None)
+
+    producer = asyncio.ensure_future(produce())
+    try:
+        while True:
+            output = await ordered_outputs.get()
+            if output is None:
+                break
+            while True:
+                data = await output.get()
+                if data is None:
+                    break
+                yield data
+        await producer # Surface errors from the sentence source
+    finally:
+        producer.cancel()
+        for task in tasks:
+            task.cancel()
+
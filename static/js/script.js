@@ -17,6 +17,7 @@ document.addEventListener('DOMContentLoaded', () => {
 
     let mediaRecorder;
     let audioChunks = [];
+    let voiceSocket = null; // Streaming voice connection for the current recording, if any
     let isMuted = localStorage.getItem('isMuted') === 'true'; // Mute state persistence
 
     // ****** START: STATE PERSISTENCE LOGIC ******
@@ -57,6 +58,28 @@ document.addEventListener('DOMContentLoaded', () => {
         console.error("State select dropdown not found!");
     }
 
+    // --- ADDED: Browser location, used for weather when no state is picked from the dropdown ---
+    let browserLocation = null;
+    if (navigator.geolocation) {
+        navigator.geolocation.getCurrentPosition(
+            (position) => {
+                // ~100 m precision is plenty for weather and the nearest city
+                browserLocation = {
+                    latitude: Number(position.coords.latitude.toFixed(3)),
+                    longitude: Number(position.coords.longitude.toFixed(3))
+                };
+                console.log(`Using browser location: ${browserLocation.latitude}, ${browserLocation.longitude}`);
+            },
+            (error) => console.log(`Browser location unavailable (${error.message}); using the state dropdown.`),
+            { maximumAge: 30 * 60 * 1000, timeout: 10000 }
+        );
+    }
+
+    function locationFields() {
+        // The dropdown wins once the user has picked a state
+        return browserLocation && stateSelect && stateSelect.value === 'Select State' ? browserLocation : {};
+    }
+
     // 3. Clear saved state is handled in the clearChatButton listener below
 
     // ****** END: STATE PERSISTENCE LOGIC ******
@@ -247,7 +270,8 @@ document.addEventListener('DOMContentLoaded', () => {
                      message: text,
                      input_mode: 'text',
                      voice_gender: voiceGenderSelect.value,
-                     selected_state: selectedState === 'Select State' ? null : selectedState
+                     selected_state: selectedState === 'Select State' ? null : selectedState,
+                     ...locationFields()
                  }),
              });
              await handleResponse(response); // handleResponse calls addMessage for assistant, which saves history
@@ -269,6 +293,14 @@ document.addEventListener('DOMContentLoaded', () => {
          const responseTextHeader = response.headers.get('X-Response-Text');
          let displayText = responseTextHeader ? responseTextHeader : '';
 
+         if (response.status === 409) { // Superseded by a newer request or a history clear: nothing to show
+              statusDiv.textContent = 'Ready';
+              sendButton.disabled = false;
+              userInput.disabled = false;
+              recordButton.disabled = false;
+              return;
+         }
+
          if (!response.ok) {
               statusDiv.textContent = `Error: ${response.status}`;
               let errorMsg = `Server error (${response.status})`;
@@ -389,6 +421,52 @@ document.addEventListener('DOMContentLoaded', () => {
          if (mediaRecorder && mediaRecorder.state === "recording") stopRecording();
          else startRecording();
      });
+     // --- ADDED: Streaming voice input over WebSocket ---
+     // Audio is sent in small chunks while recording so the server decodes as we speak and can
+     // end the utterance on trailing silence. Falls back to POST /voice_input if unavailable.
+     function openVoiceSocket(mimeType) {
+         return new Promise(resolve => {
+             if (!window.WebSocket) { resolve(null); return; }
+             let ws;
+             try {
+                 ws = new WebSocket(`${location.protocol === 'https:' ? 'wss' : 'ws'}://${location.host}/voice_stream`);
+             } catch (e) { resolve(null); return; }
+             ws.binaryType = 'blob';
+             const timer = setTimeout(() => { ws.close(); resolve(null); }, 2000);
+             ws.onopen = () => {
+                 clearTimeout(timer);
+                 const selectedState = stateSelect.value;
+                 ws.send(JSON.stringify({
+                     type: 'start',
+                     format: mimeType && mimeType.includes('ogg') ? 'ogg' : 'webm',
+                     voice_gender: voiceGenderSelect.value,
+                     selected_state: selectedState === 'Select State' ? null : selectedState,
+                     ...locationFields()
+                 }));
+                 resolve(ws);
+             };
+             ws.onerror = () => { clearTimeout(timer); resolve(null); };
+         });
+     }
+     function awaitVoiceReply(ws) {
+         return new Promise((resolve, reject) => {
+             let reply = null;
+             ws.onmessage = event => {
+                 if (event.data instanceof Blob) { // MP3 for the preceding reply message
+                     resolve({ reply, audioBlob: event.data }); ws.close(); return;
+                 }
+                 const message = JSON.parse(event.data);
+                 if (message.type === 'endpoint') stopRecording(); // Server heard the end of speech
+                 else if (message.type === 'transcript') statusDiv.textContent = `Heard: "${message.text}"`;
+                 else if (message.type === 'error') { reject(new Error(message.error)); ws.close(); }
+                 else if (message.type === 'reply') {
+                     reply = message;
+                     if (!message.audio) { resolve({ reply, audioBlob: null }); ws.close(); }
+                 }
+             };
+             ws.onclose = () => { if (!reply) reject(new Error('Voice connection closed')); };
+         });
+     }
      async function startRecording() {
           if (!navigator.mediaDevices || !navigator.mediaDevices.getUserMedia) {
               addMessage("Media Devices API not supported.", "assistant"); statusDiv.textContent = "Error: Mic not supported"; return;
@@ -402,11 +480,38 @@ document.addEventListener('DOMContentLoaded', () => {
                }
               mediaRecorder = new MediaRecorder(stream, options);
               audioChunks = [];
-              mediaRecorder.ondataavailable = event => { if (event.data.size > 0) audioChunks.push(event.data); };
+              voiceSocket = await openVoiceSocket(mediaRecorder.mimeType || options.mimeType);
+              const voiceReply = voiceSocket ? awaitVoiceReply(voiceSocket) : null;
+              mediaRecorder.ondataavailable = event => {
+                  if (event.data.size > 0) {
+                      audioChunks.push(event.data);
+                      if (voiceSocket && voiceSocket.readyState === WebSocket.OPEN) voiceSocket.send(event.data);
+                  }
+              };
               mediaRecorder.onstop = async () => {
                   recordButton.classList.remove('recording'); recordButton.innerHTML = '<i class="fa-solid fa-microphone"></i>';
                   recordButton.disabled = true; statusDiv.textContent = 'Processing voice...';
                   stream.getTracks().forEach(track => track.stop());
+                  if (voiceReply) {
+                      const ws = voiceSocket; voiceSocket = null;
+                      if (ws.readyState === WebSocket.OPEN) ws.send(JSON.stringify({ type: 'stop' }));
+                      try {
+                          const { reply, audioBlob } = await voiceReply;
+                          audioChunks = [];
+                          if (reply.status === 409) { statusDiv.textContent = 'Ready'; recordButton.disabled = false; return; } // Superseded
+                          addMessage(reply.text || `Server error (${reply.status})`, 'assistant'); // Adds and saves history
+                          if (audioBlob) {
+                              statusDiv.textContent = isMuted ? 'Audio muted' : 'Playing...';
+                              playAudio(new Blob([audioBlob], { type: 'audio/mpeg' }));
+                          } else {
+                              statusDiv.textContent = reply.status === 200 ? 'Ready' : `Error: ${reply.status}`;
+                          }
+                          recordButton.disabled = false;
+                          return;
+                      } catch (error) {
+                          console.warn('Streaming voice failed, uploading the recording instead:', error);
+                      }
+                  }
                   if (audioChunks.length === 0) { console.warn("No audio data recorded."); statusDiv.textContent = "No audio detected."; recordButton.disabled = false; return; }
                   const blobType = mediaRecorder.mimeType || 'audio/webm';
                   const audioBlob = new Blob(audioChunks, { type: blobType }); audioChunks = [];
@@ -416,6 +521,7 @@ document.addEventListener('DOMContentLoaded', () => {
                   formData.append('audio_data', audioBlob, filename);
                   formData.append('voice_gender', voiceGenderSelect.value);
                   formData.append('selected_state', selectedState === 'Select State' ? '' : selectedState); // Sends current state
+                  for (const [field, value] of Object.entries(locationFields())) formData.append(field, value);
                   try {
                       const response = await fetch('/voice_input', { method: 'POST', body: formData });
                       await handleResponse(response); // handleResponse adds message and saves history
@@ -431,7 +537,7 @@ document.addEventListener('DOMContentLoaded', () => {
                    recordButton.classList.remove('recording'); recordButton.innerHTML = '<i class="fa-solid fa-microphone"></i>'; recordButton.disabled = false;
                    stream.getTracks().forEach(track => track.stop());
               };
-              mediaRecorder.start();
+              mediaRecorder.start(voiceSocket ? 250 : undefined); // Small timeslices when streaming
               recordButton.classList.add('recording'); recordButton.innerHTML = '<i class="fa-solid fa-stop"></i>'; recordButton.disabled = false; statusDiv.textContent = 'Recording...';
           } catch (err) {
               console.error("Error accessing microphone:", err); statusDiv.textContent = 'Mic access error.';
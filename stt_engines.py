@@ -0,0 +1,323 @@
+import concurrent.futures
+import multiprocessing
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from metrics import REGISTRY, Histogram
+from transcoder import TARGET_SAMPLE_RATE, TARGET_SAMPLE_WIDTH
+
+STT_SECONDS = REGISTRY.register(Histogram(
+    "naru_stt_seconds", "Speech-to-text time per engine attempt.", ("engine", "outcome")))
+
+
+class STTEngineError(Exception):
+    """The engine failed, timed out or was saturated; the router should try the next one."""
+
+
+class STTEngine(ABC):
+    """Base class: bounds in-flight recognitions per engine and enforces a per-call timeout.
+
+    Subclasses implement ``_submit(pcm, sample_rate, sample_width)`` returning a
+    ``concurrent.futures.Future`` that resolves to the transcript, or None when the audio
+    held no intelligible speech. A slot stays taken until that future completes, even if the
+    caller gave up on it, so a stuck engine stops accepting work instead of piling it up.
+    """
+
+    name = "base"
+
+    def __init__(self, max_concurrency=4, queue_timeout=2.0, timeout=15.0):
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.counts = {"recognized": 0, "no_speech": 0, "errors": 0, "timeouts": 0, "rejected": 0}
+
+    def start(self):
+        """Loads models / spawns workers ahead of the first request (optional)."""
+
+    @abstractmethod
+    def _submit(self, pcm, sample_rate, sample_width):
+        """Starts recognizing 16-bit mono PCM; returns a Future of the transcript (None for no speech)."""
+
+    def _record(self, outcome, started=None):
+        with self._lock:
+            self.counts[outcome] += 1
+        if started is not None:
+            STT_SECONDS.observe(time.perf_counter() - started, engine=self.name, outcome=outcome)
+
+    def _release(self, _future=None):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def transcribe(self, pcm, sample_rate=TARGET_SAMPLE_RATE, sample_width=TARGET_SAMPLE_WIDTH):
+        """Returns the transcript or None (no speech); raises STTEngineError to request fallback."""
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self._record("rejected")
+            raise STTEngineError(f"{self.name} busy ({self.max_concurrency} in flight)")
+        with self._lock:
+            self.in_flight += 1
+        started = time.perf_counter()
+        try:
+            future = self._submit(pcm, sample_rate, sample_width)
+        except Exception as e:
+            self._release()
+            self._record("errors", started)
+            raise STTEngineError(f"{self.name}: {e}") from e
+        future.add_done_callback(self._release)
+
+        try:
+            text = future.result(self.timeout)
+        except concurrent.futures.TimeoutError:
+            self._record("timeouts", started)
+            raise STTEngineError(f"{self.name} timed out after {self.timeout}s")
+        except Exception as e:
+            self._record("errors", started)
+            raise STTEngineError(f"{self.name}: {e}") from e
+        self._record("recognized" if text else "no_speech", started)
+        return text
+
+    def shutdown(self):
+        pass
+
+    def reset_after_fork(self):
+        """Forgets slots, locks and pools inherited from the parent process."""
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts, in_flight=self.in_flight, max_concurrency=self.max_concurrency)
+
+
+class GoogleSTTEngine(STTEngine):
+    """speech_recognition's free Google Web Speech API, run on a small thread pool."""
+
+    name = "google"
+
+    def __init__(self, language="en-US", **kwargs):
+        super().__init__(**kwargs)
+        self._sr = None # speech_recognition, imported on start() or first use
+        self.language = language
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.max_concurrency, thread_name_prefix="stt-google")
+
+    def start(self):
+        if self._sr is None:
+            import speech_recognition as sr
+            self._sr = sr
+
+    def _recognize(self, pcm, sample_rate, sample_width):
+        self.start()
+        sr = self._sr
+        recognizer = sr.Recognizer()
+        recognizer.operation_timeout = self.timeout
+        try:
+            return recognizer.recognize_google(sr.AudioData(pcm, sample_rate, sample_width), language=self.language)
+        except sr.UnknownValueError:
+            return None
+        except sr.RequestError as e:
+            raise STTEngineError(f"Google Speech Recognition request failed: {e}") from e
+
+    def _submit(self, pcm, sample_rate, sample_width):
+        return self._executor.submit(self._recognize, pcm, sample_rate, sample_width)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+    def reset_after_fork(self):
+        super().reset_after_fork()
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.max_concurrency, thread_name_prefix="stt-google")
+
+
+# --- Local engine: faster-whisper in worker processes, one preloaded model per process ---
+_local_model = None
+
+
+def _load_local_model(model_size, compute_type, cpu_threads):
+    global _local_model
+    from faster_whisper import WhisperModel
+    _local_model = WhisperModel(model_size, device="cpu", compute_type=compute_type, cpu_threads=cpu_threads)
+
+
+def _local_ready():
+    return os.getpid()
+
+
+def _local_transcribe(pcm, language):
+    import numpy as np
+    audio = np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+    segments, _ = _local_model.transcribe(audio, language=language, beam_size=1)
+    text = " ".join(segment.text.strip() for segment in segments).strip()
+    return text or None
+
+
+class LocalSTTEngine(STTEngine):
+    """CPU-only Whisper (faster-whisper, int8) in a process pool.
+
+    Each worker loads the model once in its initializer, so requests only pay for inference,
+    and recognition never holds the GIL of the web process. Workers are spawned rather than
+    forked so they don't inherit the server's threads and sockets. ``max_concurrency``
+    defaults to ``workers`` so callers queue here (bounded by ``queue_timeout``) rather than
+    inside the pool.
+    """
+
+    name = "local"
+
+    def __init__(self, model_size="base.en", workers=2, compute_type="int8", cpu_threads=2, language="en", **kwargs):
+        kwargs.setdefault("max_concurrency", workers)
+        super().__init__(**kwargs)
+        self.model_size = model_size
+        self.workers = workers
+        self.compute_type = compute_type
+        self.cpu_threads = cpu_threads
+        self.language = language
+        self._executor = None
+        self._pool_lock = threading.Lock()
+
+    @staticmethod
+    def available():
+        import importlib.util
+        return importlib.util.find_spec("faster_whisper") is not None
+
+    def _pool(self):
+        with self._pool_lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_load_local_model,
+                    initargs=(self.model_size, self.compute_type, self.cpu_threads),
+                )
+            return self._executor
+
+    def start(self):
+        """Spawns every worker and waits for its model to load."""
+        started = time.perf_counter()
+        pool = self._pool()
+        pids = {f.result() for f in [pool.submit(_local_ready) for _ in range(self.workers)]}
+        print(f"🧠 Local STT ready: {len(pids)} worker(s), model '{self.model_size}' in {time.perf_counter() - started:.1f}s")
+
+    def _submit(self, pcm, sample_rate, sample_width):
+        if sample_rate != TARGET_SAMPLE_RATE or sample_width != TARGET_SAMPLE_WIDTH:
+            raise STTEngineError("local engine expects 16 kHz 16-bit PCM")
+        try:
+            return self._pool().submit(_local_transcribe, pcm, self.language)
+        except concurrent.futures.process.BrokenProcessPool:
+            # A worker died (e.g. OOM); start a fresh pool for the next request
+            with self._pool_lock:
+                self._executor = None
+            raise
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def reset_after_fork(self):
+        # The worker processes belong to the parent; this process spawns its own on demand
+        super().reset_after_fork()
+        self._pool_lock = threading.Lock()
+        self._executor = None
+
+
+class StubSTTEngine(STTEngine):
+    """Deterministic engine for tests and load runs: fixed text for any non-empty audio."""
+
+    name = "stub"
+
+    def __init__(self, text="hello naru", delay=0.0, **kwargs):
+        kwargs.setdefault("max_concurrency", 64)
+        super().__init__(**kwargs)
+        self.text = text
+        self.delay = delay
+
+    def _submit(self, pcm, sample_rate, sample_width):
+        if self.delay:
+            time.sleep(self.delay)
+        future = concurrent.futures.Future()
+        future.set_result(self.text if pcm else None)
+        return future
+
+
+class STTRouter:
+    """Tries engines in the configured order; falls through on errors, timeouts and saturation.
+
+    "No speech" from an engine is an answer, not a failure, so it is returned as-is.
+    """
+
+    def __init__(self, engines):
+        if not engines:
+            raise ValueError("STTRouter needs at least one engine")
+        self.engines = engines
+        self.fallbacks = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def start(self):
+        for engine in self.engines:
+            try:
+                engine.start()
+            except Exception as e:
+                print(f"Warning: Could not start STT engine '{engine.name}': {e}")
+
+    def transcribe(self, pcm, sample_rate=TARGET_SAMPLE_RATE, sample_width=TARGET_SAMPLE_WIDTH):
+        for index, engine in enumerate(self.engines):
+            try:
+                return engine.transcribe(pcm, sample_rate, sample_width)
+            except STTEngineError as e:
+                print(f"⚠️ STT engine '{engine.name}' failed: {e}")
+                if index + 1 < len(self.engines):
+                    with self._lock:
+                        self.fallbacks += 1
+        with self._lock:
+            self.failures += 1
+        return None
+
+    def shutdown(self):
+        for engine in self.engines:
+            engine.shutdown()
+
+    def reset_after_fork(self):
+        self._lock = threading.Lock()
+        for engine in self.engines:
+            engine.reset_after_fork()
+
+    def stats(self):
+        stats = {"fallbacks": self.fallbacks, "failures": self.failures}
+        for engine in self.engines:
+            for field, value in engine.stats().items():
+                stats[f"{engine.name}_{field}"] = value
+        return stats
+
+
+def create_stt_router(order="google", queue_timeout=2.0, timeout=15.0, google_concurrency=8,
+                      local_model="base.en", local_workers=2, stub_text="hello naru"):
+    """Builds the router from a comma-separated engine order, e.g. "local,google"."""
+    engines = []
+    for name in (n.strip().lower() for n in order.split(",")):
+        if not name:
+            continue
+        common = {"queue_timeout": queue_timeout, "timeout": timeout}
+        if name == "google":
+            engines.append(GoogleSTTEngine(max_concurrency=google_concurrency, **common))
+        elif name == "local":
+            if not LocalSTTEngine.available():
+                print("Warning: faster-whisper is not installed; skipping the local STT engine.")
+                continue
+            engines.append(LocalSTTEngine(model_size=local_model, workers=local_workers, **common))
+        elif name == "stub":
+            engines.append(StubSTTEngine(text=stub_text, **common))
+        else:
+            raise ValueError(f"Unknown STT engine: {name}")
+    if not engines:
+        print("Warning: No usable STT engine configured; falling back to Google.")
+        engines.append(GoogleSTTEngine(max_concurrency=google_concurrency, queue_timeout=queue_timeout, timeout=timeout))
+    return STTRouter(engines)
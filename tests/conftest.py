@@ -0,0 +1,72 @@
+import importlib
+import os
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# Offline and deterministic: no model downloads, no background prefetch, no real keys
+APP_ENV = {
+    "GROQ_API_KEY": "test", "TMDB_API_KEY": "", "FLASK_SECRET_KEY": "test",
+    "CONVERSATION_STORE": "memory", "STT_ENGINES": "stub", "STT_PREWARM": "0", "TTS_PREWARM": "0",
+    "WEATHER_PREFETCH": "0", "PRELOAD_MODULES": "", "RESPONSE_CACHE": "0",
+}
+
+
+class FakeStreamingClient:
+    """Stands in for the Groq client: streams ``chunks`` as completion deltas.
+
+    An Exception in ``chunks`` is raised at that point of the stream, and a threading.Event
+    holds the stream there until it is set. The n-th request
+    waits ``delays[n]`` seconds before its first chunk (a slow or fast model), and is
+    marked ``closed`` once its stream is closed or exhausted.
+    """
+
+    def __init__(self, chunks, delays=()):
+        self.chunks = list(chunks)
+        self.delays = list(delays)
+        self.requests = []
+        self.chat = SimpleNamespace(completions=self)
+
+    def create(self, model, messages, stream=False, **kwargs):
+        request = SimpleNamespace(model=model, messages=messages, stream=stream, closed=False, **kwargs)
+        delay = self.delays[len(self.requests)] if len(self.requests) < len(self.delays) else 0
+        self.requests.append(request)
+        assert stream, "only streamed completions are faked"
+        return self._stream(request, delay)
+
+    def _stream(self, request, delay):
+        try:
+            time.sleep(delay)
+            for chunk in self.chunks:
+                if isinstance(chunk, Exception):
+                    raise chunk
+                if isinstance(chunk, threading.Event):
+                    chunk.wait(5)
+                    continue
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=chunk))])
+        finally:
+            request.closed = True
+
+
+@pytest.fixture(scope="session")
+def naru():
+    """app.py imported once with the offline settings."""
+    os.environ.update(APP_ENV)
+    return importlib.import_module("app")
+
+
+@pytest.fixture
+def fake_llm(naru, monkeypatch):
+    """Installs a FakeStreamingClient; call it with the chunks to stream."""
+    monkeypatch.setattr(naru, "get_weather", lambda latitude, longitude: (29, "Clear", 10, 33, 24))
+
+    def install(chunks, delays=()):
+        client = FakeStreamingClient(chunks, delays)
+        monkeypatch.setattr(naru, "client", client)
+        return client
+    return install
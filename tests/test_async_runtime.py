@@ -0,0 +1,78 @@
+import concurrent.futures
+import threading
+
+import pytest
+
+from async_runtime import AsyncRuntime
+
+
+class Items:
+    """Async iterator over ``items`` whose aclose() can be made to fail."""
+
+    def __init__(self, items, close_error=None):
+        self.items = list(items)
+        self.close_error = close_error
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.items:
+            raise StopAsyncIteration
+        item = self.items.pop(0)
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    async def aclose(self):
+        self.closed = True
+        if self.close_error is not None:
+            raise self.close_error
+
+
+@pytest.fixture
+def runtime():
+    runtime = AsyncRuntime(name="test-runtime")
+    yield runtime
+    runtime.stop()
+
+
+def consume(runtime, make_async_gen):
+    """list(runtime.iterate(...)) on a daemon thread, failing instead of hanging."""
+    result = concurrent.futures.Future()
+
+    def run():
+        try:
+            result.set_result(list(runtime.iterate(make_async_gen)))
+        except Exception as e:
+            result.set_exception(e)
+
+    threading.Thread(target=run, daemon=True).start()
+    return result.result(5)
+
+
+def test_items_are_yielded_and_the_generator_closed(runtime):
+    source = Items([1, 2, 3])
+    assert consume(runtime, lambda: source) == [1, 2, 3]
+    assert source.closed
+
+
+def test_error_while_iterating_reaches_the_consumer(runtime):
+    source = Items([1, ValueError("tts failed")])
+    with pytest.raises(ValueError, match="tts failed"):
+        consume(runtime, lambda: source)
+    assert source.closed
+
+
+def test_failing_aclose_still_ends_the_iteration(runtime):
+    with pytest.raises(RuntimeError, match="close failed"):
+        consume(runtime, lambda: Items([1, 2], close_error=RuntimeError("close failed")))
+
+
+def test_failing_generator_factory_ends_the_iteration(runtime):
+    def make_async_gen():
+        raise RuntimeError("no generator")
+
+    with pytest.raises(RuntimeError, match="no generator"):
+        consume(runtime, make_async_gen)
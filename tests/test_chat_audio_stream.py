@@ -0,0 +1,94 @@
+import threading
+import time
+
+import pytest
+
+REPLY = ["Arre bhai, ", "kya scene hai aaj? ", "Chal ", "chai ", "peete ", "hai, ", "baaki ", "baad mein."]
+
+
+@pytest.fixture
+def speech(naru, monkeypatch):
+    """Fake TTS: every sentence becomes two chunks of bytes; records what was synthesized."""
+    sentences = []
+
+    async def stream_speech_chunks(text, gender="male"):
+        sentences.append(text)
+        yield f"<{text}|".encode()
+        yield b">"
+
+    monkeypatch.setattr(naru, "stream_speech_chunks", stream_speech_chunks)
+    return sentences
+
+
+@pytest.fixture
+def client(naru):
+    return naru.app.test_client()
+
+
+def session_history(naru, client):
+    with client.session_transaction() as session:
+        return naru.conversation_store.load(session["sid"])
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_whole_reply_is_spoken_and_committed(naru, fake_llm, speech, client):
+    fake = fake_llm(REPLY)
+    response = client.post("/chat/audio_stream", json={"message": "hello"})
+
+    assert response.status_code == 200
+    assert response.mimetype == "audio/mpeg"
+    assert response.get_data() == b"".join(f"<{sentence}|>".encode() for sentence in speech)
+    assert " ".join(speech) == "".join(REPLY).strip()
+    assert session_history(naru, client)[-1] == {"role": "assistant", "content": "".join(REPLY)}
+    assert fake.requests[0].closed
+    assert naru.llm_scheduler.stats()["in_flight"] == 0
+    assert naru.turn_registry.stats()["in_flight"] == 0
+
+
+def test_disconnect_cancels_the_turn_and_commits_nothing(naru, fake_llm, speech, client):
+    fake = fake_llm(REPLY)
+    cancelled = naru.turn_registry.stats().get("cancelled_client_disconnected", 0)
+    response = client.post("/chat/audio_stream", json={"message": "hello"}, buffered=False)
+    assert next(iter(response.response)).startswith(b"<")
+    response.close()
+
+    wait_until(lambda: fake.requests[0].closed) # The Groq stream is closed, not left to the GC...
+    wait_until(lambda: naru.llm_scheduler.stats()["in_flight"] == 0) # ...and its slot freed
+    assert session_history(naru, client) == []
+    assert naru.turn_registry.stats()["in_flight"] == 0
+    assert naru.turn_registry.stats()["cancelled_client_disconnected"] == cancelled + 1
+
+
+def test_slot_is_held_until_the_llm_stream_stops(naru, fake_llm, speech, client):
+    upstream = threading.Event()
+    fake = fake_llm([REPLY[0], REPLY[1], upstream] + REPLY[2:])
+    response = client.post("/chat/audio_stream", json={"message": "hello"}, buffered=False)
+    assert next(iter(response.response)).startswith(b"<")
+    response.close()
+
+    # Still blocked upstream mid-reply: the slot is in use until the stream is actually closed
+    time.sleep(0.1)
+    assert not fake.requests[0].closed
+    assert naru.llm_scheduler.stats()["in_flight"] == 1
+    upstream.set()
+    wait_until(lambda: fake.requests[0].closed)
+    wait_until(lambda: naru.llm_scheduler.stats()["in_flight"] == 0)
+    assert session_history(naru, client) == []
+
+
+def test_response_closed_before_audio_starts_frees_the_slot(naru, fake_llm, speech):
+    fake = fake_llm(REPLY)
+    with naru.app.test_request_context("/chat/audio_stream", method="POST", json={"message": "hello"}):
+        response = naru.chat_audio_stream_handler()
+        assert naru.llm_scheduler.stats()["in_flight"] == 1
+        response.close() # What the server does if the client is gone before the body is sent
+
+    assert fake.requests == []
+    assert naru.llm_scheduler.stats()["in_flight"] == 0
+    assert naru.turn_registry.stats()["in_flight"] == 0
@@ -0,0 +1,78 @@
+import json
+
+import pytest
+
+
+def parse_sse(body):
+    """SSE body -> [(event, data)], event None for plain data messages."""
+    events = []
+    for block in body.strip().split("\n\n"):
+        event, data = None, None
+        for line in block.splitlines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                data = json.loads(line[len("data: "):])
+        events.append((event, data))
+    return events
+
+
+@pytest.fixture
+def client(naru):
+    return naru.app.test_client()
+
+
+def session_history(naru, client):
+    with client.session_transaction() as session:
+        return naru.conversation_store.load(session["sid"])
+
+
+def assert_nothing_in_flight(naru):
+    assert naru.llm_scheduler.stats()["in_flight"] == 0
+    assert naru.turn_registry.stats()["in_flight"] == 0
+
+
+def test_tokens_are_relayed_without_markdown_and_history_is_committed(naru, fake_llm, client):
+    fake = fake_llm(["Arre ", "*bhai*", ", scene ", "set ", "hai!"])
+    response = client.post("/chat/stream", json={"message": "Kya scene hai?"})
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+    events = parse_sse(response.get_data(as_text=True))
+    assert [data["token"] for event, data in events if event is None] == ["Arre ", "bhai", ", scene ", "set ", "hai!"]
+    assert events[-1] == ("done", {"response_text": "Arre bhai, scene set hai!"})
+    assert fake.requests[0].messages[-1] == {"role": "user", "content": "Kya scene hai?"}
+    assert session_history(naru, client) == [
+        {"role": "user", "content": "Kya scene hai?"},
+        {"role": "assistant", "content": "Arre bhai, scene set hai!"},
+    ]
+    assert_nothing_in_flight(naru)
+
+
+def test_client_disconnect_commits_nothing(naru, fake_llm, client):
+    fake_llm(["Arre ", "bhai ", "sun ", "na!"])
+    response = client.post("/chat/stream", json={"message": "hello"}, buffered=False)
+    body = iter(response.response)
+    assert parse_sse(next(body).decode())[0][1] == {"token": "Arre "}
+    response.close() # What the server does when the client goes away
+
+    assert session_history(naru, client) == []
+    assert_nothing_in_flight(naru)
+
+
+def test_upstream_error_mid_stream_commits_nothing(naru, fake_llm, client):
+    fake_llm(["Arre ", RuntimeError("connection reset by Groq")])
+    response = client.post("/chat/stream", json={"message": "hello"})
+
+    events = parse_sse(response.get_data(as_text=True))
+    assert events[0] == (None, {"token": "Arre "})
+    assert events[-1] == ("error", {"error": naru.ERROR_REPLY})
+    assert session_history(naru, client) == []
+    assert_nothing_in_flight(naru)
+
+
+def test_empty_message_is_rejected(naru, fake_llm, client):
+    fake = fake_llm(["unused"])
+    response = client.post("/chat/stream", json={"message": ""})
+    assert response.status_code == 400
+    assert fake.requests == []
@@ -0,0 +1,84 @@
+import threading
+
+import pytest
+
+from context_builder import ContextBuilder
+from conversation_store import CachedConversationStore, MemoryConversationStore, SQLiteConversationStore
+
+
+def history(turns):
+    messages = []
+    for i in range(turns):
+        messages += [{"role": "user", "content": f"question {i}"}, {"role": "assistant", "content": f"answer {i}"}]
+    return messages
+
+
+class Summarizer:
+    """Records what it was asked to fold; optionally blocks until released."""
+
+    def __init__(self, block=False):
+        self.calls = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.done = threading.Event()
+        if not block:
+            self.release.set()
+
+    def __call__(self, previous, messages):
+        self.calls.append((previous, list(messages)))
+        self.started.set()
+        self.release.wait(5)
+        return f"summary of {len(messages)} messages"
+
+
+@pytest.fixture(params=["sqlite", "memory"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        return CachedConversationStore(SQLiteConversationStore(str(tmp_path / "conversations.db")))
+    return CachedConversationStore(MemoryConversationStore())
+
+
+def wait_for_fold():
+    for thread in threading.enumerate():
+        if thread.name == "context-summary":
+            thread.join(5)
+
+
+def test_window_fits_budget_and_starts_on_a_user_message(store):
+    builder = ContextBuilder(store, Summarizer(), budget=10 ** 6)
+    messages = builder.build("s1", "system", history(3), "hi")
+    assert [m["role"] for m in messages] == ["system"] + ["user", "assistant"] * 3 + ["user"]
+    assert messages[-1]["content"] == "hi"
+
+
+def test_messages_beyond_the_window_limit_are_folded_not_dropped(store):
+    summarize = Summarizer()
+    stored = history(10)
+    store.append("s1", stored)
+    builder = ContextBuilder(store, summarize, budget=10 ** 6, max_window_messages=6)
+    messages = builder.build("s1", "system", store.load("s1"), "hi")
+    assert messages[1:-1] == stored[-6:] # Everything fit the token budget; the count limit applied
+    wait_for_fold()
+    assert summarize.calls == [(None, stored[:-6])]
+    assert store.load_summary("s1")["content"] == "summary of 14 messages"
+
+
+def test_clear_while_summarizing_discards_the_summary(store):
+    summarize = Summarizer(block=True)
+    store.append("s1", history(10))
+    builder = ContextBuilder(store, summarize, budget=10 ** 6, max_window_messages=6)
+    builder.build("s1", "system", store.load("s1"), "hi")
+    assert summarize.started.wait(5)
+    store.clear("s1")
+    summarize.release.set()
+    wait_for_fold()
+    assert store.load_summary("s1") is None
+    assert builder.stats()["summaries_discarded"] == 1
+
+
+def test_summary_save_is_refused_after_a_clear(store):
+    epoch = store.history_epoch("s1")
+    store.clear("s1")
+    assert store.save_summary("s1", "anchor", "stale", epoch) is False
+    assert store.load_summary("s1") is None
+    assert store.save_summary("s1", "anchor", "fresh", store.history_epoch("s1")) is True
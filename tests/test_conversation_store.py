@@ -0,0 +1,17 @@
+import pytest
+
+from conversation_store import CachedConversationStore, ConversationStore, MemoryConversationStore
+
+
+class IncompleteStore(ConversationStore):
+    def load(self, session_id, limit=None):
+        return []
+
+
+def test_incomplete_backend_fails_when_created():
+    with pytest.raises(TypeError, match="abstract"):
+        IncompleteStore()
+
+
+def test_backends_implement_the_whole_interface():
+    CachedConversationStore(MemoryConversationStore())
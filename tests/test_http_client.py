@@ -0,0 +1,175 @@
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from http_client import CircuitBreaker, CircuitOpenError, OutboundClient
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class FakeSession:
+    """Stands in for requests.Session: each get() pops the next outcome (exception or response)."""
+
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def get(self, url, params=None, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def make_client(outcomes, **kwargs):
+    client = OutboundClient(retries=0, failure_threshold=1, reset_timeout=0.0, **kwargs)
+    host, _, breaker = client._host_state("http://upstream.test/x")
+    session = FakeSession(outcomes)
+    client._sessions[host] = session
+    return client, session, breaker
+
+
+def test_breaker_opens_after_threshold_and_probes_once():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.0)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "half-open"
+    assert breaker.allow() is True
+    assert breaker.allow() is False # Only one probe at a time
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow() is True
+
+
+def test_failed_probe_reopens_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60.0)
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.allow() is False
+
+
+@pytest.mark.parametrize("probe_error", [
+    requests.exceptions.ChunkedEncodingError("truncated"),
+    requests.exceptions.ContentDecodingError("bad gzip"),
+    requests.exceptions.TooManyRedirects("loop"),
+])
+def test_non_retryable_probe_failure_does_not_wedge_breaker(probe_error):
+    client, session, breaker = make_client([
+        requests.exceptions.ConnectionError("down"), probe_error, FakeResponse(200),
+    ])
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client.get("http://upstream.test/x")
+    with pytest.raises(type(probe_error)):
+        client.get("http://upstream.test/x") # Half-open probe
+    assert breaker._probing is False
+    assert client.get("http://upstream.test/x").status_code == 200 # Upstream recovered
+    assert breaker.state == "closed"
+
+
+def test_open_breaker_short_circuits_without_calling_upstream():
+    client, session, breaker = make_client([requests.exceptions.Timeout("slow")])
+    breaker.reset_timeout = 60.0
+    with pytest.raises(requests.exceptions.Timeout):
+        client.get("http://upstream.test/x")
+    with pytest.raises(CircuitOpenError):
+        client.get("http://upstream.test/x")
+    assert session.calls == 1
+
+
+def test_retries_server_errors_then_returns_last_response():
+    client, session, breaker = make_client([FakeResponse(503), FakeResponse(200)])
+    client.retries, client.backoff_base = 1, 0.0
+    breaker.failure_threshold = 5
+    assert client.get("http://upstream.test/x").status_code == 200
+    assert session.calls == 2
+    assert client.stats()["retries"] == 1
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers GET /<name> with the next status scripted for <name> (200 once the script runs out)."""
+
+    protocol_version = "HTTP/1.1" # Keep-alive, so connection reuse is observable
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.hits.append((self.path, self.client_address))
+            script = server.scripts.get(self.path.lstrip("/"), [])
+            status = script.pop(0) if script else 200
+        body = b'{"ok": true}'
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def upstream():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.lock = threading.Lock()
+    server.hits = []
+    server.scripts = {}
+    server.url = f"http://127.0.0.1:{server.server_port}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client():
+    client = OutboundClient(connect_timeout=1, read_timeout=2, retries=2, backoff_base=0.01, failure_threshold=3,
+                            reset_timeout=60.0)
+    yield client
+    client.close()
+
+
+def test_real_requests_reuse_one_connection_per_host(upstream, client):
+    for _ in range(3):
+        response = client.get(f"{upstream.url}/ok", params={"q": "x"})
+        assert response.status_code == 200
+        assert response.json() == {"ok": True}
+    assert [path for path, _ in upstream.hits] == ["/ok?q=x"] * 3
+    assert len({address for _, address in upstream.hits}) == 1 # One keep-alive connection
+    assert list(client.stats()["hosts"]) == [upstream.url]
+
+
+def test_real_5xx_is_retried_until_it_succeeds(upstream, client):
+    upstream.scripts["flaky"] = [503, 502]
+    assert client.get(f"{upstream.url}/flaky").status_code == 200
+    assert len(upstream.hits) == 3
+    assert client.stats()["retries"] == 2
+    assert client.stats()["hosts"][upstream.url] == {"state": "closed", "consecutive_failures": 0}
+
+
+def test_real_5xx_opens_the_breaker(upstream, client):
+    upstream.scripts["down"] = [500] * 3
+    assert client.get(f"{upstream.url}/down").status_code == 500 # Last attempt's response is returned
+    assert client.stats()["hosts"][upstream.url]["state"] == "open"
+    with pytest.raises(CircuitOpenError):
+        client.get(f"{upstream.url}/down")
+    assert len(upstream.hits) == 3 # The short-circuited call never reached the server
+
+
+def test_real_connection_errors_are_retried_then_raised(client):
+    with socket.socket() as unused:
+        unused.bind(("127.0.0.1", 0))
+        port = unused.getsockname()[1] # Nothing listens here once it is closed
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client.get(f"http://127.0.0.1:{port}/x")
+    assert client.stats()["requests_sent"] == 3
+    assert client.stats()["hosts"][f"http://127.0.0.1:{port}"]["state"] == "open"
@@ -0,0 +1,162 @@
+import threading
+import time
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from llm_scheduler import LLMOverloadedError, LLMScheduler, _parse_duration, per_worker_quota, retry_after_from
+
+
+class RateLimited(Exception):
+    """Shaped like groq.RateLimitError: a status code and the response headers."""
+
+    status_code = 429
+
+    def __init__(self, headers):
+        super().__init__("429 Too Many Requests")
+        self.response = SimpleNamespace(headers=headers)
+
+
+@pytest.mark.parametrize("per_minute, workers, share", [(30, 4, 7), (6000, 3, 2000), (30, 40, 1), (1, 2, 1), (0, 8, 0)])
+def test_per_worker_quota(per_minute, workers, share):
+    assert per_worker_quota(per_minute, workers) == share
+
+
+def test_more_workers_than_quota_still_limits_each_worker():
+    scheduler = LLMScheduler(requests_per_minute=per_worker_quota(30, 40), tokens_per_minute=0)
+    scheduler.release(scheduler.acquire(timeout=0))
+    with pytest.raises(LLMOverloadedError):
+        scheduler.acquire(timeout=0) # The bucket holds one request a minute, not unlimited
+
+
+def test_full_queue_is_rejected_without_waiting():
+    scheduler = LLMScheduler(requests_per_minute=0, tokens_per_minute=0, max_concurrency=1, max_queue=0)
+    ticket = scheduler.acquire()
+    started = time.monotonic()
+    with pytest.raises(LLMOverloadedError, match="queue full") as excinfo:
+        scheduler.acquire(timeout=5)
+    assert time.monotonic() - started < 1
+    assert excinfo.value.retry_after >= 1
+    assert scheduler.stats()["rejected_queue_full"] == 1
+    scheduler.release(ticket)
+
+
+def test_full_queue_reaches_the_client_as_503_with_retry_after(naru, fake_llm, monkeypatch):
+    fake = fake_llm(["unused"])
+    scheduler = LLMScheduler(requests_per_minute=0, tokens_per_minute=0, max_concurrency=1, max_queue=0)
+    monkeypatch.setattr(naru, "llm_scheduler", scheduler)
+    ticket = scheduler.acquire()
+
+    response = naru.app.test_client().post("/chat/stream", json={"message": "hi"})
+    assert response.status_code == 503
+    assert response.get_json() == {"error": naru.BUSY_REPLY}
+    assert int(response.headers["Retry-After"]) >= 1
+    assert fake.requests == []
+    assert naru.turn_registry.stats()["in_flight"] == 0
+    scheduler.release(ticket)
+
+
+def test_admission_timeout_removes_the_waiter():
+    scheduler = LLMScheduler(requests_per_minute=0, tokens_per_minute=0, max_concurrency=1)
+    ticket = scheduler.acquire()
+    with pytest.raises(LLMOverloadedError, match="timed out"):
+        scheduler.acquire(timeout=0.05)
+    assert scheduler.stats()["rejected_timeout"] == 1
+    assert scheduler.stats()["queue_depth"] == 0
+
+    # A waiter left behind at the head of the queue would block everyone after it
+    scheduler.release(ticket)
+    scheduler.release(scheduler.acquire(timeout=0))
+
+
+def test_timed_out_waiter_does_not_block_the_ones_behind_it():
+    scheduler = LLMScheduler(requests_per_minute=0, tokens_per_minute=0, max_concurrency=1)
+    ticket = scheduler.acquire()
+    outcomes = {}
+
+    def waiter(name, timeout):
+        try:
+            scheduler.release(scheduler.acquire(timeout=timeout))
+            outcomes[name] = "admitted"
+        except LLMOverloadedError:
+            outcomes[name] = "timed_out"
+
+    impatient = threading.Thread(target=waiter, args=("impatient", 0.1))
+    impatient.start()
+    time.sleep(0.02)
+    patient = threading.Thread(target=waiter, args=("patient", 5))
+    patient.start() # Queued behind the impatient waiter
+    impatient.join()
+    scheduler.release(ticket)
+    patient.join(5)
+    assert outcomes == {"impatient": "timed_out", "patient": "admitted"}
+    assert scheduler.stats()["queue_depth"] == 0
+
+
+@pytest.mark.parametrize("value, seconds", [
+    ("1.5", 1.5), ("7.66s", 7.66), ("2m59.56s", 179.56), ("250ms", 0.25), ("1h", 3600), ("-3", 0.0),
+    ("", None), (None, None), ("soon", None),
+])
+def test_parse_duration(value, seconds):
+    if seconds is None:
+        assert _parse_duration(value) is None
+    else:
+        assert _parse_duration(value) == pytest.approx(seconds)
+
+
+def test_parse_duration_http_date():
+    later = datetime.now(timezone.utc) + timedelta(seconds=30)
+    assert 25 < _parse_duration(format_datetime(later, usegmt=True)) <= 30
+
+
+def test_retry_after_from_headers():
+    assert retry_after_from(RateLimited({"retry-after": "3"})) == 3
+    assert retry_after_from(RateLimited({"x-ratelimit-reset-tokens": "2m59.56s"})) == pytest.approx(179.56)
+    assert retry_after_from(RateLimited({})) is None
+    assert retry_after_from(ValueError("no response")) is None
+
+
+def test_rate_limit_pauses_every_caller():
+    scheduler = LLMScheduler(requests_per_minute=0, tokens_per_minute=0, max_retry_wait=1, retryable=(RateLimited,))
+
+    def rate_limited():
+        raise RateLimited({"x-ratelimit-reset-requests": "2m59.56s"})
+
+    with pytest.raises(LLMOverloadedError, match="rate limit") as excinfo:
+        scheduler.call(rate_limited)
+    assert excinfo.value.retry_after == pytest.approx(179.56)
+    assert scheduler.stats()["rate_limited"] == 1
+    assert scheduler.stats()["paused_for_seconds"] == pytest.approx(179.6, abs=0.2)
+    assert scheduler.stats()["in_flight"] == 0
+    with pytest.raises(LLMOverloadedError, match="timed out") as excinfo:
+        scheduler.acquire(timeout=0) # Admissions wait for the quota window to reset
+    assert excinfo.value.retry_after >= 179
+
+
+def test_rate_limit_is_retried_when_the_wait_is_short():
+    scheduler = LLMScheduler(requests_per_minute=0, tokens_per_minute=0, max_retry_wait=1, retryable=(RateLimited,))
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RateLimited({"retry-after": "0.05"})
+        return "ok"
+
+    assert scheduler.call(flaky) == "ok"
+    assert len(attempts) == 2
+    assert scheduler.stats()["retries"] == 1
+
+
+def test_unused_tokens_are_refunded():
+    scheduler = LLMScheduler(requests_per_minute=0, tokens_per_minute=600)
+    result = SimpleNamespace(usage=SimpleNamespace(total_tokens=100))
+    assert scheduler.call(lambda: result, estimated_tokens=500) is result
+
+    # 500 were reserved but only 100 used, so 400 more fit right away
+    scheduler.release(scheduler.acquire(estimated_tokens=400, timeout=0))
+    with pytest.raises(LLMOverloadedError):
+        scheduler.acquire(estimated_tokens=400, timeout=0)
+
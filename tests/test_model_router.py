@@ -0,0 +1,108 @@
+import concurrent.futures
+import time
+
+import pytest
+
+from llm_scheduler import LLMScheduler
+from model_router import ModelRouter
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+@pytest.fixture
+def router():
+    return ModelRouter("small", "large", small_max_tokens=100, large_max_tokens=400, long_input_words=10)
+
+
+@pytest.mark.parametrize("user_text, name, reason", [
+    ("hi bhai", "small", "casual"),
+    ("kya scene hai aaj", "small", "casual"),
+    ("explain in detail how rockets work", "large", "detail_request"),
+    ("quantum physics detail mein samjhao", "large", "detail_request"),
+    ("one two three four five six seven eight nine ten eleven", "large", "long_input"),
+])
+def test_route(router, user_text, name, reason):
+    route = router.route(user_text)
+    assert (route.name, route.reason) == (name, reason)
+    assert (route.model, route.max_tokens) == (("small", 100) if name == "small" else ("large", 400))
+
+
+def test_routing_disabled_always_uses_large_model():
+    router = ModelRouter("small", "large", enabled=False)
+    assert router.route("hi").model == "large"
+
+
+@pytest.fixture
+def hedging(naru, monkeypatch):
+    """A hedging router (0.1s delay) and a fresh scheduler with ``max_concurrency`` slots."""
+    def install(max_concurrency=2):
+        router = ModelRouter("small", "large", hedge_delay=0.1)
+        scheduler = LLMScheduler(requests_per_minute=0, tokens_per_minute=0, max_concurrency=max_concurrency)
+        monkeypatch.setattr(naru, "model_router", router)
+        monkeypatch.setattr(naru, "llm_scheduler", scheduler)
+        return router, scheduler
+    return install
+
+
+def open_reply(naru, user_text, scheduler, timeout=5):
+    """Runs open_reply_stream with its own admitted ticket, failing rather than hanging."""
+    route = naru.model_router.route(user_text)
+    ticket = scheduler.acquire()
+    with concurrent.futures.ThreadPoolExecutor(1) as executor:
+        return executor.submit(naru.open_reply_stream, MESSAGES, route, ticket).result(timeout)
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def reply_text(stream):
+    return "".join(chunk.choices[0].delta.content for chunk in stream)
+
+
+def test_fast_primary_is_not_hedged(naru, fake_llm, hedging):
+    router, scheduler = hedging()
+    fake = fake_llm(["Arre ", "bhai!"])
+    assert reply_text(open_reply(naru, "hi", scheduler)) == "Arre bhai!"
+    assert [request.model for request in fake.requests] == ["small"]
+    assert router.stats()["hedges_fired"] == 0
+    assert scheduler.stats()["in_flight"] == 0
+
+
+def test_hedge_wins_and_loser_is_closed(naru, fake_llm, hedging):
+    router, scheduler = hedging()
+    fake = fake_llm(["Arre ", "bhai!"], delays=[0.5, 0])
+    stream = open_reply(naru, "hi", scheduler)
+    assert router.stats()["hedges_fired"] == 1
+    assert router.stats()["hedges_won"] == 1
+    assert scheduler.stats()["in_flight"] == 2 # The slow primary still holds its slot...
+
+    primary, hedge = fake.requests
+    wait_until(lambda: primary.closed) # ...until its first chunk arrives and it is discarded
+    wait_until(lambda: scheduler.stats()["in_flight"] == 1)
+    assert reply_text(stream) == "Arre bhai!"
+    assert hedge.closed
+    assert scheduler.stats()["in_flight"] == 0
+
+
+def test_hedge_skipped_without_a_free_slot(naru, fake_llm, hedging):
+    router, scheduler = hedging(max_concurrency=1)
+    fake = fake_llm(["Arre ", "bhai!"], delays=[0.3])
+    assert reply_text(open_reply(naru, "hi", scheduler)) == "Arre bhai!"
+    assert len(fake.requests) == 1
+    assert router.stats()["hedges_skipped"] == 1
+    assert router.stats()["hedges_fired"] == 0
+    assert scheduler.stats()["in_flight"] == 0
+
+
+def test_both_attempts_failing_raises(naru, fake_llm, hedging):
+    router, scheduler = hedging()
+    fake = fake_llm([RuntimeError("upstream down")], delays=[0.3, 0])
+    with pytest.raises(RuntimeError, match="upstream down"):
+        open_reply(naru, "hi", scheduler)
+    assert len(fake.requests) == 2
+    assert router.stats()["hedges_fired"] == 1
+    assert scheduler.stats()["in_flight"] == 0
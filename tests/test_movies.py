@@ -0,0 +1,18 @@
+import pytest
+
+
+@pytest.mark.parametrize("user_text, parsed", [
+    ("suggest some horror movies", ("genre:27", None)),
+    ("koi achhi film batao netflix pe", ("popular", "netflix")),
+    ("what should I watch on prime", ("popular", "prime")),
+    ("send me a picture of a cat", None),
+    ("what did the prime minister say", None),
+])
+def test_parse_movie_request(naru, user_text, parsed):
+    assert naru.parse_movie_request(user_text) == parsed
+
+
+def test_no_movie_context_for_non_movie_messages(naru, monkeypatch):
+    monkeypatch.setattr(naru, "TMDB_API_KEY", "test")
+    monkeypatch.setattr(naru.movie_index, "search", lambda *args: pytest.fail("TMDB was queried"))
+    assert naru.get_movie_context("send me a picture of a cat") is None
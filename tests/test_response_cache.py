@@ -0,0 +1,59 @@
+from datetime import datetime
+
+from response_cache import ResponseCache, normalize_text
+
+NOW = datetime(2026, 10, 17, 10, 5)
+LOCATION = ("Pune, Maharashtra", 29.4, "Clear", 10, 33.1, 24.8)
+
+
+def test_normalize_text_folds_case_punctuation_and_spacing():
+    assert normalize_text("  What's the   WEATHER?! ") == "whats the weather"
+    assert normalize_text("Hello, Naru!!") == normalize_text("hello naru")
+
+
+def test_key_is_shared_within_weather_and_time_buckets():
+    cache = ResponseCache()
+    key = cache.make_key("Hi!", LOCATION, [], now=NOW)
+    close_weather = ("Pune, Maharashtra", 28.1, "Clear", 0, 32.5, 24.0)
+    assert key is not None
+    assert cache.make_key("hi", close_weather, [], now=datetime(2026, 10, 17, 10, 55)) == key
+    assert cache.make_key("hi", LOCATION, [], now=datetime(2026, 10, 17, 11, 5)) != key
+    assert cache.make_key("hi", ("Mumbai, Maharashtra",) + LOCATION[1:], [], now=NOW) != key
+
+
+def test_key_with_fallback_weather_does_not_raise():
+    cache = ResponseCache()
+    for fallback in ("Unavailable", "Error", "N/A"):
+        location = ("Pune, Maharashtra", fallback, fallback, fallback, fallback, fallback)
+        key = cache.make_key("hi", location, [], now=NOW)
+        assert key is not None
+        assert key == cache.make_key("hi", location, [], now=NOW)
+    assert cache.make_key("hi", ("Pune, Maharashtra", None, None, None, None, None), [], now=NOW) is not None
+
+
+def test_unusable_context_means_no_caching():
+    cache = ResponseCache()
+    assert cache.make_key("hi", ("Pune, Maharashtra",), [], now=NOW) is None
+    assert cache.make_key("hi", LOCATION, [{"role": "user", "content": "earlier"}], now=NOW) is None
+    assert cache.make_key("word " * 20, LOCATION, [], now=NOW) is None
+    assert ResponseCache(enabled=False).make_key("hi", LOCATION, [], now=NOW) is None
+
+
+def test_serves_only_after_sampling_all_variants_then_rotates():
+    cache = ResponseCache(variants=2)
+    key = cache.make_key("hi", LOCATION, [], now=NOW)
+    assert cache.get(key) is None
+    cache.put(key, "Arre bhai!")
+    assert cache.get(key) is None
+    cache.put(key, "Kya scene hai?")
+    assert [cache.get(key) for _ in range(3)] == ["Arre bhai!", "Kya scene hai?", "Arre bhai!"]
+
+
+def test_ttl_and_lru_eviction():
+    cache = ResponseCache(variants=1, ttl=0.0, max_entries=2)
+    cache.put("a", "reply")
+    assert cache.get("a") is None # Expired immediately
+    for key in ("a", "b", "c"):
+        cache.put(key, "reply")
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["evictions"] == 1
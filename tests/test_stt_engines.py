@@ -0,0 +1,27 @@
+import pytest
+
+from stt_engines import STTEngine, STTEngineError, STTRouter, StubSTTEngine
+
+
+class IncompleteEngine(STTEngine):
+    name = "incomplete"
+
+
+def test_engine_without_submit_fails_when_created():
+    with pytest.raises(TypeError, match="abstract"):
+        IncompleteEngine()
+
+
+def test_router_falls_back_to_the_next_engine():
+    class FailingEngine(STTEngine):
+        name = "failing"
+
+        def _submit(self, pcm, sample_rate, sample_width):
+            raise RuntimeError("offline")
+
+    failing = FailingEngine()
+    router = STTRouter([failing, StubSTTEngine(text="kya haal hai")])
+    assert router.transcribe(b"\0\0" * 160, 16000, 2) == "kya haal hai"
+    assert failing.stats()["errors"] == 1
+    with pytest.raises(STTEngineError):
+        failing.transcribe(b"\0\0")
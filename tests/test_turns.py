@@ -0,0 +1,91 @@
+import concurrent.futures
+
+import pytest
+
+from conversation_store import CachedConversationStore, MemoryConversationStore, SQLiteConversationStore
+from turns import TurnCancelled, TurnRegistry
+
+TURN = [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "Arre bhai!"}]
+
+
+def save(store, turn):
+    return lambda: store.append(turn.session_id, TURN, turn.generation)
+
+
+def test_newer_turn_cancels_the_one_in_flight():
+    registry = TurnRegistry()
+    first = registry.begin("s1", "chat")
+    second = registry.begin("s1", "chat")
+    assert first.cancelled and first.reason == "superseded"
+    assert not second.cancelled
+    with pytest.raises(TurnCancelled):
+        first.enter("llm")
+    assert not registry.begin("s2", "chat").cancelled # Other sessions are untouched
+
+
+def test_cancel_fires_callbacks_and_blocks_commit():
+    registry = TurnRegistry()
+    turn = registry.begin("s1", "chat")
+    future = concurrent.futures.Future()
+    turn.on_cancel(future.cancel)
+    writes = []
+    assert registry.cancel("s1", "history_cleared") is True
+    assert future.cancelled()
+    with pytest.raises(TurnCancelled):
+        turn.commit(lambda: writes.append(1))
+    assert writes == []
+    registry.finish(turn)
+    registry.finish(turn) # Idempotent
+    stats = registry.stats()
+    assert stats["cancelled_history_cleared"] == 1
+    assert stats["history_writes_skipped"] == 1
+    assert stats["in_flight"] == 0
+
+
+def test_committed_turn_can_no_longer_be_cancelled():
+    registry = TurnRegistry()
+    turn = registry.begin("s1", "chat")
+    turn.commit(lambda: None)
+    assert registry.cancel("s1", "history_cleared") is False
+
+
+@pytest.fixture(params=["sqlite", "memory"])
+def two_workers(request, tmp_path):
+    """Two registries over one shared store, as two worker processes would see it."""
+    if request.param == "sqlite":
+        path = str(tmp_path / "conversations.db")
+        stores = [CachedConversationStore(SQLiteConversationStore(path)) for _ in range(2)]
+    else:
+        shared = CachedConversationStore(MemoryConversationStore())
+        stores = [shared, shared]
+    return [(store, TurnRegistry(store)) for store in stores]
+
+
+def test_turn_on_another_worker_invalidates_the_old_one(two_workers):
+    (store_a, registry_a), (store_b, registry_b) = two_workers
+    old = registry_a.begin("s1", "chat")
+    new = registry_b.begin("s1", "chat")
+    assert not old.cancelled # Not reachable from the other worker's registry ...
+    with pytest.raises(TurnCancelled):
+        old.enter("tts") # ... but noticed at the next stage boundary
+    assert old.reason == "superseded_elsewhere"
+    new.commit(save(store_b, new))
+    assert store_a.load("s1") == TURN
+
+
+def test_stale_turn_never_commits_after_clear_on_another_worker(two_workers):
+    (store_a, registry_a), (store_b, registry_b) = two_workers
+    turn = registry_a.begin("s1", "chat")
+    turn.enter("tts")
+    store_b.clear("s1")
+    with pytest.raises(TurnCancelled):
+        turn.commit(save(store_a, turn)) # Already past its last checkpoint: the store refuses it
+    assert store_a.load("s1") == []
+    assert store_b.load("s1") == []
+
+
+def test_append_without_generation_is_unchanged(two_workers):
+    (store_a, _), _ = two_workers
+    store_a.clear("s1")
+    store_a.append("s1", TURN)
+    assert store_a.load("s1") == TURN
@@ -0,0 +1,72 @@
+import json
+import subprocess
+import sys
+from collections import deque
+
+import pytest
+
+import voice_stream
+
+
+class FakeWebSocket:
+    """Replays ``incoming`` to the handler (None = receive timed out) and records what it sends."""
+
+    def __init__(self, incoming):
+        self.incoming = deque(incoming)
+        self.sent = []
+
+    def receive(self, timeout=None):
+        return self.incoming.popleft() if self.incoming else None
+
+    def send(self, message):
+        self.sent.append(json.loads(message) if isinstance(message, str) else message)
+
+
+def run_handler(naru, incoming):
+    ws = FakeWebSocket(incoming)
+    with naru.app.test_request_context("/voice_stream"):
+        naru.voice_stream_handler(ws)
+    return ws.sent
+
+
+@pytest.mark.parametrize("sample_rate", ["fast", "16k", -1, 10 ** 9, [16000]])
+def test_bad_sample_rate_gets_an_error(naru, fake_llm, sample_rate):
+    sent = run_handler(naru, [json.dumps({"type": "start", "format": "pcm", "sample_rate": sample_rate})])
+    assert sent[-1]["type"] == "error"
+    assert "sample rate" in sent[-1]["error"]
+    assert naru.turn_registry.stats()["in_flight"] == 0
+
+
+@pytest.mark.parametrize("message", ["not json", "[]", '"start"', "1", "null", None])
+def test_start_message_that_isnt_a_json_object_gets_an_error(naru, fake_llm, message):
+    sent = run_handler(naru, [message])
+    assert sent == [{"type": "error", "error": "Expected a start message"}]
+    assert naru.turn_registry.stats()["in_flight"] == 0
+
+
+@pytest.mark.parametrize("message", ["not json", "[]", '"stop"', "1"])
+def test_control_message_that_isnt_a_json_object_gets_an_error(naru, fake_llm, message):
+    start = json.dumps({"type": "start", "format": "pcm", "sample_rate": 16000})
+    sent = run_handler(naru, [start, b"\0\0" * 160, message])
+    assert sent == [{"type": "error", "error": "Expected a JSON object"}]
+    assert naru.turn_registry.stats()["in_flight"] == 0
+
+
+def test_idle_stream_is_told_it_timed_out(naru, fake_llm, monkeypatch):
+    monkeypatch.setattr(naru, "VOICE_STREAM_IDLE_TIMEOUT", 0.1)
+    sent = run_handler(naru, [json.dumps({"type": "start", "format": "pcm", "sample_rate": 16000})])
+    assert sent == [{"type": "error", "error": "No audio received; the voice stream timed out."}]
+    assert naru.turn_registry.stats()["in_flight"] == 0
+
+
+def test_aborted_ffmpeg_decoder_is_reaped(monkeypatch):
+    popen = subprocess.Popen
+
+    def fake_ffmpeg(command, **kwargs):
+        # Something that, like ffmpeg waiting for input, never exits on its own
+        return popen([sys.executable, "-c", "import time; time.sleep(60)"], **kwargs)
+
+    monkeypatch.setattr(voice_stream.subprocess, "Popen", fake_ffmpeg)
+    decoder = voice_stream._FFmpegStreamDecoder(lambda pcm: None)
+    decoder.abort()
+    assert decoder.process.returncode is not None
@@ -0,0 +1,94 @@
+import threading
+import time
+
+from weather_cache import WeatherCache
+
+WEATHER = (29, "Clear", 10, 33, 24)
+
+
+class SlowFetch:
+    """fetch_one that takes a while, counting how often it is called."""
+
+    def __init__(self, result=WEATHER, delay=0.1):
+        self.result = result
+        self.delay = delay
+        self.calls = 0
+
+    def __call__(self, latitude, longitude):
+        self.calls += 1
+        time.sleep(self.delay)
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+def get_concurrently(cache, callers=8):
+    results = []
+
+    def get():
+        try:
+            results.append(cache.get(17.6868, 83.2185))
+        except Exception as e:
+            results.append(e)
+
+    threads = [threading.Thread(target=get) for _ in range(callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return results
+
+
+def test_concurrent_misses_fetch_once():
+    fetch = SlowFetch()
+    cache = WeatherCache(fetch)
+    assert get_concurrently(cache) == [WEATHER] * 8
+    assert fetch.calls == 1
+    assert cache.stats()["coalesced_misses"] == 7
+    assert cache.get(17.6868, 83.2185) == WEATHER # Cached now
+    assert fetch.calls == 1
+
+
+def test_failed_fetch_is_shared_but_not_cached():
+    fetch = SlowFetch(result=("Unavailable", "N/A", "N/A", "N/A", "N/A"))
+    cache = WeatherCache(fetch)
+    assert get_concurrently(cache) == [fetch.result] * 8
+    assert fetch.calls == 1
+    cache.get(17.6868, 83.2185)
+    assert fetch.calls == 2 # The next request tries again
+
+
+def test_fetch_error_reaches_every_waiter():
+    fetch = SlowFetch(result=RuntimeError("open-meteo down"))
+    cache = WeatherCache(fetch)
+    results = get_concurrently(cache, callers=4)
+    assert fetch.calls == 1
+    assert all(isinstance(result, RuntimeError) for result in results)
+    fetch.result = WEATHER
+    assert cache.get(17.6868, 83.2185) == WEATHER
+
+
+def test_different_cells_fetch_independently():
+    fetch = SlowFetch(delay=0)
+    cache = WeatherCache(fetch, cell_degrees=0.01)
+    cache.get(17.68, 83.21)
+    cache.get(17.681, 83.211) # Same cell
+    cache.get(28.61, 77.21)
+    assert fetch.calls == 2
+
+
+def test_prefetch_covers_state_centres_by_default(naru, monkeypatch):
+    requested = []
+    monkeypatch.setattr(naru, "fetch_weather_bulk", lambda coordinates: requested.append(coordinates) or [])
+    naru.start_weather_prefetch().stop()
+
+    places = [(naru.DEFAULT_LATITUDE, naru.DEFAULT_LONGITUDE)]
+    places += [(p.latitude, p.longitude) for p in naru.place_index.places if p.kind == "state"]
+    assert requested == [list(dict.fromkeys(naru.weather_cache.key(lat, lon) for lat, lon in places))]
+    assert naru.WEATHER_PREFETCH_INTERVAL > naru.WEATHER_CACHE_TTL # Not every TTL // 2 any more
+
+
+def test_prefetch_place_sets(naru):
+    assert len(naru.weather_prefetch_places("all")) == len(naru.place_index.places)
+    assert naru.weather_prefetch_places("default") == []
+    assert naru.weather_prefetch_places("bogus") == naru.weather_prefetch_places("states")
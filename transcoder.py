@@ -0,0 +1,185 @@
+import audioop
+import concurrent.futures
+import importlib.util
+import io
+import shutil
+import subprocess
+import threading
+import time
+import wave
+
+from metrics import REGISTRY, Histogram
+
+# PyAV (in-process decoding, no ffmpeg process per clip) is imported on the first compressed clip
+HAVE_PYAV = importlib.util.find_spec("av") is not None
+
+# What speech_recognition's recognizers expect: 16 kHz, mono, 16-bit little-endian PCM
+TARGET_SAMPLE_RATE = 16000
+TARGET_SAMPLE_WIDTH = 2
+
+PCM_CONTENT_TYPES = ("audio/l16", "audio/pcm", "audio/x-raw")
+
+DECODE_SECONDS = REGISTRY.register(Histogram(
+    "naru_audio_decode_seconds", "Time to turn an uploaded clip into 16 kHz mono PCM.", ("path",)))
+
+
+class TranscodeError(Exception):
+    """Raised when an uploaded clip cannot be decoded."""
+
+
+class DecodedAudio:
+    """16-bit mono PCM ready for ``sr.AudioData(pcm, sample_rate, sample_width)``."""
+
+    def __init__(self, pcm, sample_rate, path, decode_seconds):
+        self.pcm = pcm
+        self.sample_rate = sample_rate
+        self.sample_width = TARGET_SAMPLE_WIDTH
+        self.path = path
+        self.decode_seconds = decode_seconds
+
+    @property
+    def duration_seconds(self):
+        return len(self.pcm) / (self.sample_rate * self.sample_width)
+
+
+def sniff_format(data, content_type=None):
+    """Returns 'wav', 'pcm', 'webm', 'ogg' or None from magic bytes / declared content type."""
+    if data[:4] == b"RIFF" and data[8:12] == b"WAVE":
+        return "wav"
+    if content_type and content_type.split(";")[0].strip().lower() in PCM_CONTENT_TYPES:
+        return "pcm"
+    if data[:4] == b"\x1a\x45\xdf\xa3":
+        return "webm"
+    if data[:4] == b"OggS":
+        return "ogg"
+    return None
+
+
+def _pcm_rate(content_type):
+    for param in (content_type or "").split(";")[1:]:
+        key, _, value = param.partition("=")
+        if key.strip().lower() == "rate" and value.strip().isdigit():
+            return int(value.strip())
+    return TARGET_SAMPLE_RATE
+
+
+def normalize_pcm(frames, sample_rate, sample_width, channels):
+    """Converts raw PCM to 16-bit mono at the target rate (no-op when it already is)."""
+    if sample_width != TARGET_SAMPLE_WIDTH:
+        frames = audioop.lin2lin(frames, sample_width, TARGET_SAMPLE_WIDTH)
+    if channels == 2:
+        frames = audioop.tomono(frames, TARGET_SAMPLE_WIDTH, 0.5, 0.5)
+    elif channels > 2:
+        raise TranscodeError(f"Unsupported channel count: {channels}")
+    if sample_rate != TARGET_SAMPLE_RATE:
+        frames, _ = audioop.ratecv(frames, TARGET_SAMPLE_WIDTH, 1, sample_rate, TARGET_SAMPLE_RATE, None)
+    return frames
+
+
+def decode_wav(data):
+    try:
+        with wave.open(io.BytesIO(data), "rb") as wav:
+            frames = wav.readframes(wav.getnframes())
+            return normalize_pcm(frames, wav.getframerate(), wav.getsampwidth(), wav.getnchannels())
+    except (wave.Error, EOFError) as e:
+        raise TranscodeError(f"Invalid WAV data: {e}") from e
+
+
+def ffmpeg_available():
+    return shutil.which("ffmpeg") is not None
+
+
+class TranscoderPool:
+    """Bounded pool of long-lived decoder workers for compressed uploads (WebM/Opus, Ogg).
+
+    WAV and raw PCM skip the pool entirely. Compressed clips are decoded in-process with
+    PyAV when it is installed; otherwise each worker pipes the clip through ffmpeg straight
+    to 16 kHz mono s16le on stdout (no pydub, temp files or WAV round trip).
+    """
+
+    def __init__(self, workers=2, timeout=15.0):
+        self.workers = workers
+        self.timeout = timeout
+        self.backend = "pyav" if HAVE_PYAV else "ffmpeg"
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="transcoder")
+            return self._executor
+
+    def decode(self, data, content_type=None):
+        """Returns DecodedAudio for the clip, raising TranscodeError on failure."""
+        if not data:
+            raise TranscodeError("Empty audio upload")
+        started = time.perf_counter()
+        audio_format = sniff_format(data, content_type)
+        if audio_format == "wav":
+            pcm, path = decode_wav(data), "wav"
+        elif audio_format == "pcm":
+            pcm, path = normalize_pcm(data, _pcm_rate(content_type), TARGET_SAMPLE_WIDTH, 1), "pcm"
+        else:
+            future = self._pool().submit(self._decode_compressed, data)
+            try:
+                pcm = future.result(self.timeout)
+            except concurrent.futures.TimeoutError:
+                future.cancel()
+                raise TranscodeError(f"Decoding timed out after {self.timeout}s")
+            path = self.backend
+        decode_seconds = time.perf_counter() - started
+        DECODE_SECONDS.observe(decode_seconds, path=path)
+        decoded = DecodedAudio(pcm, TARGET_SAMPLE_RATE, path, decode_seconds)
+        print(f"🎛️ Decoded {len(data)} bytes ({path}) to {decoded.duration_seconds:.2f}s PCM in {decode_seconds * 1000:.1f} ms")
+        return decoded
+
+    def _decode_compressed(self, data):
+        if self.backend == "pyav":
+            return self._decode_with_pyav(data)
+        return self._decode_with_ffmpeg(data)
+
+    @staticmethod
+    def _decode_with_pyav(data):
+        import av
+        try:
+            with av.open(io.BytesIO(data)) as container:
+                resampler = av.AudioResampler(format="s16", layout="mono", rate=TARGET_SAMPLE_RATE)
+                chunks = []
+                for frame in container.decode(audio=0):
+                    for out in resampler.resample(frame):
+                        chunks.append(bytes(out.planes[0])[:out.samples * TARGET_SAMPLE_WIDTH])
+                for out in resampler.resample(None): # Flush
+                    chunks.append(bytes(out.planes[0])[:out.samples * TARGET_SAMPLE_WIDTH])
+                return b"".join(chunks)
+        except Exception as e:
+            raise TranscodeError(f"PyAV could not decode audio: {e}") from e
+
+    def _decode_with_ffmpeg(self, data):
+        command = [
+            "ffmpeg", "-hide_banner", "-loglevel", "error",
+            "-i", "pipe:0",
+            "-f", "s16le", "-acodec", "pcm_s16le", "-ac", "1", "-ar", str(TARGET_SAMPLE_RATE),
+            "pipe:1",
+        ]
+        try:
+            result = subprocess.run(command, input=data, capture_output=True, timeout=self.timeout)
+        except FileNotFoundError as e:
+            raise TranscodeError("Couldn't find ffmpeg. Make sure ffmpeg is installed and in your system's PATH.") from e
+        except subprocess.TimeoutExpired as e:
+            raise TranscodeError(f"ffmpeg timed out after {self.timeout}s") from e
+        if result.returncode != 0:
+            raise TranscodeError(f"ffmpeg failed: {result.stderr.decode('utf-8', 'replace').strip()}")
+        return result.stdout
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+    def reset_after_fork(self):
+        """The parent's pool threads don't exist in a forked child; start a fresh pool on demand."""
+        self._lock = threading.Lock()
+        self._executor = None
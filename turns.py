@@ -0,0 +1,211 @@
+import concurrent.futures
+import threading
+import time
+
+from conversation_store import StaleTurnError
+from metrics import REGISTRY, Counter
+
+TURNS_TOTAL = REGISTRY.register(Counter(
+    "naru_turns_total", "Turns by endpoint and outcome (finished, cancelled).", ("kind", "outcome")))
+TURNS_CANCELLED = REGISTRY.register(Counter(
+    "naru_turns_cancelled_total", "Cancelled turns by reason and the stage they were stopped in.", ("reason", "stage")))
+CANCEL_SAVED = REGISTRY.register(Counter(
+    "naru_turn_cancel_saved_total",
+    "Work skipped because its turn was cancelled: LLM tokens not generated, TTS characters not "
+    "synthesized, history writes not made.", ("unit",)))
+CANCELLED_SECONDS = REGISTRY.register(Counter(
+    "naru_turn_cancelled_seconds_total", "Wall time cancelled turns had run before they were stopped."))
+
+# Stages in order; the compute saved by a cancellation depends on how far the turn got
+STAGES = ("stt", "context", "llm", "tts", "history_save", "respond")
+
+
+class TurnCancelled(Exception):
+    """Raised inside a turn once a newer turn or a history clear has cancelled it."""
+
+    def __init__(self, reason):
+        super().__init__(f"Turn cancelled ({reason})")
+        self.reason = reason
+
+
+class Turn:
+    """One in-flight request of a session: the LLM and TTS work it runs can be cancelled.
+
+    The thread running the turn calls ``enter(stage)`` / ``check()`` at its checkpoints,
+    and registers ``on_cancel`` callbacks (e.g. cancelling a TTS future) for work it is
+    blocked on. History goes through ``commit()``, which refuses once the turn is cancelled.
+
+    ``generation`` is the session's turn generation in the shared store. A newer turn or a
+    clear handled by another worker can't reach this object, so ``enter()`` also compares
+    it with the store's, and the store itself refuses a stale history write.
+    """
+
+    def __init__(self, session_id, kind, generation=None, current_generation=None):
+        self.session_id = session_id
+        self.kind = kind
+        self.generation = generation
+        self._current_generation = current_generation
+        self.started = time.monotonic()
+        self.stage = STAGES[0]
+        self.reason = None
+        self.committed = False
+        self.finished = False
+        self.llm_budget = 0 # max_tokens of the admitted completion
+        self.llm_tokens = 0 # Tokens received before the stream ended or was closed
+        self.reply_chars = 0 # Reply text handed to TTS
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self.reason is not None
+
+    def check(self):
+        if self.reason is not None:
+            raise TurnCancelled(self.reason)
+
+    def enter(self, stage):
+        """Checkpoint between stages: raises if cancelled, else records the stage."""
+        self.check()
+        if self._current_generation is not None and self._current_generation() != self.generation:
+            self.cancel("superseded_elsewhere") # By a turn or clear on another worker
+            self.check()
+        self.stage = stage
+
+    def on_cancel(self, callback):
+        """Runs ``callback()`` on cancellation (immediately if already cancelled)."""
+        with self._lock:
+            if self.reason is None:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def cancel(self, reason):
+        """Marks the turn cancelled and fires its callbacks; False if it already was."""
+        with self._lock:
+            if self.reason is not None or self.committed:
+                return False
+            self.reason = reason
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Error while cancelling turn: {e}")
+        return True
+
+    def wait(self, future):
+        """Blocks on a concurrent future, cancelling it if the turn is cancelled first."""
+        self.on_cancel(future.cancel)
+        try:
+            return future.result()
+        except concurrent.futures.CancelledError:
+            self.check()
+            raise
+
+    def commit(self, write):
+        """Runs ``write()`` (the history save) unless the turn was cancelled; then it can't be.
+
+        ``write`` should pass ``generation`` to the store, which raises StaleTurnError if
+        another worker started a newer turn or cleared the history in the meantime.
+        """
+        with self._lock:
+            self.check()
+            try:
+                write()
+            except StaleTurnError:
+                self.reason = "superseded_elsewhere"
+                raise TurnCancelled(self.reason)
+            self.committed = True
+
+
+class TurnRegistry:
+    """The in-flight turn of every session; beginning a new turn cancels the one it supersedes.
+
+    Turns running in this process are cancelled directly. With a shared ``store`` each turn
+    also takes a new generation from it, which invalidates turns running on other workers.
+    """
+
+    def __init__(self, store=None):
+        self.store = store
+        self._turns = {}
+        self._lock = threading.Lock()
+        self.started = 0
+        self.finished = 0
+        self.cancelled = {}
+        self.llm_tokens_saved = 0
+        self.tts_chars_saved = 0
+        self.history_writes_skipped = 0
+        self.cancelled_seconds = 0.0
+
+    def reset_after_fork(self):
+        """Forgets the turns (and lock) inherited from the parent process."""
+        self._lock = threading.Lock()
+        self._turns = {}
+
+    def begin(self, session_id, kind):
+        if self.store is not None:
+            turn = Turn(session_id, kind, self.store.begin_turn(session_id),
+                        lambda: self.store.turn_generation(session_id))
+        else:
+            turn = Turn(session_id, kind)
+        with self._lock:
+            previous = self._turns.get(session_id)
+            self._turns[session_id] = turn
+            self.started += 1
+        if previous is not None and previous.cancel("superseded"):
+            print(f"⏹️ Cancelled a {previous.kind} turn in stage {previous.stage}: superseded by a new {kind} turn")
+        return turn
+
+    def cancel(self, session_id, reason):
+        """Cancels the session's in-flight turn, if any; returns True if one was running."""
+        with self._lock:
+            turn = self._turns.get(session_id)
+        return turn is not None and self.cancel_turn(turn, reason)
+
+    def cancel_turn(self, turn, reason):
+        """Cancels this turn (not whichever turn the session is running now); False if it can't be."""
+        if turn.cancel(reason):
+            print(f"⏹️ Cancelled a {turn.kind} turn in stage {turn.stage}: {reason}")
+            return True
+        return False
+
+    def finish(self, turn):
+        """Unregisters a turn and records what its cancellation (if any) saved; idempotent."""
+        with self._lock:
+            if turn.finished:
+                return
+            turn.finished = True
+            if self._turns.get(turn.session_id) is turn:
+                del self._turns[turn.session_id]
+        if not turn.cancelled or turn.committed:
+            TURNS_TOTAL.inc(kind=turn.kind, outcome="finished")
+            with self._lock:
+                self.finished += 1
+            return
+
+        stage_index = STAGES.index(turn.stage)
+        llm_tokens = max(turn.llm_budget - turn.llm_tokens, 0) if stage_index <= STAGES.index("llm") else 0
+        tts_chars = turn.reply_chars if turn.stage == "tts" else 0
+        seconds = time.monotonic() - turn.started
+        TURNS_TOTAL.inc(kind=turn.kind, outcome="cancelled")
+        TURNS_CANCELLED.inc(reason=turn.reason, stage=turn.stage)
+        CANCEL_SAVED.inc(llm_tokens, unit="llm_tokens")
+        CANCEL_SAVED.inc(tts_chars, unit="tts_chars")
+        CANCEL_SAVED.inc(1, unit="history_writes")
+        CANCELLED_SECONDS.inc(seconds)
+        with self._lock:
+            self.cancelled[turn.reason] = self.cancelled.get(turn.reason, 0) + 1
+            self.llm_tokens_saved += llm_tokens
+            self.tts_chars_saved += tts_chars
+            self.history_writes_skipped += 1
+            self.cancelled_seconds += seconds
+
+    def stats(self):
+        with self._lock:
+            stats = {f"cancelled_{reason}": count for reason, count in self.cancelled.items()}
+            stats.update(in_flight=len(self._turns), started=self.started, finished=self.finished,
+                         llm_tokens_saved=self.llm_tokens_saved, tts_chars_saved=self.tts_chars_saved,
+                         history_writes_skipped=self.history_writes_skipped,
+                         cancelled_seconds=round(self.cancelled_seconds, 3))
+            return stats
@@ -0,0 +1,351 @@
+import audioop
+import math
+import os
+import subprocess
+import threading
+
+from metrics import REGISTRY, Counter
+from transcoder import TARGET_SAMPLE_RATE, TARGET_SAMPLE_WIDTH, TranscodeError
+
+FRAME_MS = 30
+
+VAD_CLIPS = REGISTRY.register(Counter(
+    "naru_vad_clips_total", "Clips checked for speech before STT, by outcome.", ("outcome",)))
+VAD_BYTES_REMOVED = REGISTRY.register(Counter(
+    "naru_vad_bytes_removed_total", "PCM bytes of silence cut before STT."))
+VAD_SECONDS_REMOVED = REGISTRY.register(Counter(
+    "naru_vad_seconds_removed_total", "Seconds of silence cut before STT."))
+
+
+class PCMRingBuffer:
+    """Fixed-capacity byte ring holding the most recent PCM of an utterance."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity - capacity % TARGET_SAMPLE_WIDTH # Whole samples only
+        self._data = bytearray(self.capacity)
+        self._write = 0
+        self.total_written = 0
+
+    def write(self, chunk):
+        self.total_written += len(chunk)
+        if len(chunk) >= self.capacity:
+            chunk = chunk[-self.capacity:]
+            self._data[:] = chunk
+            self._write = 0
+            return
+        first = min(len(chunk), self.capacity - self._write)
+        self._data[self._write:self._write + first] = chunk[:first]
+        rest = len(chunk) - first
+        if rest:
+            self._data[:rest] = chunk[first:]
+        self._write = (self._write + len(chunk)) % self.capacity
+
+    def __len__(self):
+        return min(self.total_written, self.capacity)
+
+    @property
+    def overflowed(self):
+        return self.total_written > self.capacity
+
+    def getvalue(self):
+        if not self.overflowed:
+            return bytes(self._data[:self.total_written])
+        return bytes(self._data[self._write:]) + bytes(self._data[:self._write])
+
+
+class EnergyEndpointer:
+    """Detects end of speech from frame RMS energy with an adaptive noise floor.
+
+    Speech starts after ``speech_ms`` of loud frames and ends after ``silence_ms`` of
+    quiet frames following it.
+    """
+
+    def __init__(self, sample_rate=TARGET_SAMPLE_RATE, min_threshold=300, noise_ratio=3.0,
+                 speech_ms=150, silence_ms=800):
+        self.frame_bytes = sample_rate * FRAME_MS // 1000 * TARGET_SAMPLE_WIDTH
+        self.min_threshold = min_threshold
+        self.noise_ratio = noise_ratio
+        self.speech_frames_needed = max(speech_ms // FRAME_MS, 1)
+        self.silence_frames_needed = max(silence_ms // FRAME_MS, 1)
+        self.noise_floor = None
+        self.in_speech = False
+        self.speech_seen = False
+        self.ended = False
+        self._loud_run = 0
+        self._quiet_run = 0
+        self._pending = b""
+
+    @property
+    def threshold(self):
+        if self.noise_floor is None:
+            return self.min_threshold
+        return max(self.min_threshold, self.noise_floor * self.noise_ratio)
+
+    def feed(self, pcm):
+        """Processes PCM; returns True once the end of speech has been detected."""
+        data = self._pending + pcm
+        usable = len(data) - len(data) % self.frame_bytes
+        self._pending = data[usable:]
+        for offset in range(0, usable, self.frame_bytes):
+            if self.ended:
+                break
+            rms = audioop.rms(data[offset:offset + self.frame_bytes], TARGET_SAMPLE_WIDTH)
+            if rms >= self.threshold:
+                self._loud_run += 1
+                self._quiet_run = 0
+                if self._loud_run >= self.speech_frames_needed:
+                    self.in_speech = self.speech_seen = True
+            else:
+                self._loud_run = 0
+                self._quiet_run += 1
+                # Track background noise only outside speech
+                if not self.in_speech:
+                    self.noise_floor = rms if self.noise_floor is None else 0.95 * self.noise_floor + 0.05 * rms
+                elif self._quiet_run >= self.silence_frames_needed:
+                    self.in_speech = False
+                    self.ended = True
+        return self.ended
+
+
+class TrimResult:
+    """Speech-only PCM for a clip; ``pcm`` is empty when no speech was found."""
+
+    def __init__(self, pcm, original_bytes, sample_rate, segments):
+        self.pcm = pcm
+        self.original_bytes = original_bytes
+        self.sample_rate = sample_rate
+        self.segments = segments # Number of speech stretches kept
+
+    @property
+    def has_speech(self):
+        return bool(self.pcm)
+
+    @property
+    def bytes_removed(self):
+        return self.original_bytes - len(self.pcm)
+
+    @property
+    def seconds_removed(self):
+        return self.bytes_removed / (self.sample_rate * TARGET_SAMPLE_WIDTH)
+
+
+class SilenceTrimmer:
+    """Cuts leading/trailing silence and long pauses out of a 16-bit mono clip before STT.
+
+    Frames are classed as speech by RMS energy against a threshold taken from the clip
+    itself: ``noise_ratio`` times its quietest frames, capped at half its loudest frame so
+    a clip without pauses still counts as speech, and never below ``min_threshold``. Runs
+    shorter than ``min_speech_ms`` are treated as clicks. Speech runs less than
+    ``max_pause_ms`` apart are merged, each keeps ``pad_ms`` of context on both sides, and
+    everything else is dropped. A clip with no speech run comes back empty.
+    """
+
+    def __init__(self, min_threshold=300, noise_ratio=3.0, min_speech_ms=90, pad_ms=200, max_pause_ms=500,
+                 enabled=True):
+        self.min_threshold = min_threshold
+        self.noise_ratio = noise_ratio
+        self.min_speech_frames = max(math.ceil(min_speech_ms / FRAME_MS), 1)
+        self.pad_frames = pad_ms // FRAME_MS
+        self.max_pause_frames = max_pause_ms // FRAME_MS
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.clips = 0
+        self.no_speech = 0
+        self.bytes_in = 0
+        self.bytes_removed = 0
+        self.seconds_removed = 0.0
+
+    def _speech_runs(self, levels):
+        threshold = max(self.min_threshold,
+                        min(sorted(levels)[len(levels) // 10] * self.noise_ratio, max(levels) / 2))
+        runs, start = [], None
+        for index, level in enumerate(levels):
+            if level >= threshold:
+                start = index if start is None else start
+            elif start is not None:
+                runs.append((start, index))
+                start = None
+        if start is not None:
+            runs.append((start, len(levels)))
+        return [(s, e) for s, e in runs if e - s >= self.min_speech_frames]
+
+    def trim(self, pcm, sample_rate=TARGET_SAMPLE_RATE):
+        """Returns a TrimResult with only the speech (plus padding) left in."""
+        if not self.enabled:
+            return TrimResult(pcm, len(pcm), sample_rate, 1 if pcm else 0)
+        frame_bytes = sample_rate * FRAME_MS // 1000 * TARGET_SAMPLE_WIDTH
+        frames = len(pcm) // frame_bytes
+        levels = [audioop.rms(pcm[i * frame_bytes:(i + 1) * frame_bytes], TARGET_SAMPLE_WIDTH) for i in range(frames)]
+        runs = self._speech_runs(levels) if levels else []
+
+        merged = []
+        for start, end in runs:
+            if merged and start - merged[-1][1] <= self.max_pause_frames:
+                merged[-1] = (merged[-1][0], end)
+            else:
+                merged.append((start, end))
+        segments = []
+        for start, end in merged:
+            start, end = max(start - self.pad_frames, 0), min(end + self.pad_frames, frames)
+            if segments and start <= segments[-1][1]: # Padding made neighbours overlap
+                segments[-1] = (segments[-1][0], end)
+            else:
+                segments.append((start, end))
+        spans = [(s * frame_bytes, len(pcm) if e == frames else e * frame_bytes) for s, e in segments]
+        result = TrimResult(b"".join(pcm[a:b] for a, b in spans), len(pcm), sample_rate, len(segments))
+
+        VAD_CLIPS.inc(outcome="speech" if result.has_speech else "no_speech")
+        VAD_BYTES_REMOVED.inc(result.bytes_removed)
+        VAD_SECONDS_REMOVED.inc(result.seconds_removed)
+        with self._lock:
+            self.clips += 1
+            self.no_speech += 0 if result.has_speech else 1
+            self.bytes_in += len(pcm)
+            self.bytes_removed += result.bytes_removed
+            self.seconds_removed += result.seconds_removed
+        kept = len(result.pcm) / (sample_rate * TARGET_SAMPLE_WIDTH)
+        print(f"✂️ Trimmed {kept + result.seconds_removed:.2f}s clip to {kept:.2f}s of speech in {result.segments} "
+              f"segment(s): removed {result.bytes_removed} bytes ({result.seconds_removed:.2f}s)")
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {
+                "clips": self.clips,
+                "no_speech": self.no_speech,
+                "bytes_removed": self.bytes_removed,
+                "seconds_removed": round(self.seconds_removed, 2),
+                "removed_ratio": round(self.bytes_removed / self.bytes_in, 3) if self.bytes_in else 0.0,
+            }
+
+
+class _FFmpegStreamDecoder:
+    """One ffmpeg process per stream: container chunks in on stdin, s16le PCM out as it decodes."""
+
+    def __init__(self, on_pcm):
+        self.on_pcm = on_pcm
+        command = [
+            "ffmpeg", "-hide_banner", "-loglevel", "error",
+            # Start decoding as soon as the WebM header is in, instead of probing megabytes first
+            "-probesize", "8192", "-analyzeduration", "0",
+            "-i", "pipe:0",
+            "-f", "s16le", "-acodec", "pcm_s16le", "-ac", "1", "-ar", str(TARGET_SAMPLE_RATE),
+            "pipe:1",
+        ]
+        try:
+            self.process = subprocess.Popen(
+                command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        except FileNotFoundError as e:
+            raise TranscodeError("Couldn't find ffmpeg. Make sure ffmpeg is installed and in your system's PATH.") from e
+        self._reader = threading.Thread(target=self._read_output, name="voice-stream-decoder", daemon=True)
+        self._reader.start()
+
+    def _read_output(self):
+        remainder = b""
+        fd = self.process.stdout.fileno()
+        while True:
+            chunk = os.read(fd, 8192)
+            if not chunk:
+                break
+            chunk = remainder + chunk
+            usable = len(chunk) - len(chunk) % TARGET_SAMPLE_WIDTH
+            remainder = chunk[usable:]
+            if usable:
+                self.on_pcm(chunk[:usable])
+
+    def feed(self, data):
+        try:
+            self.process.stdin.write(data)
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            raise TranscodeError(f"ffmpeg stopped accepting audio: {e}") from e
+
+    def finish(self, timeout):
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        self._reader.join(timeout)
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.abort()
+
+    def abort(self):
+        """Kills ffmpeg and reaps it, so aborted streams don't leave zombie processes."""
+        self.process.kill()
+        self.process.wait()
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+
+
+class _PCMStreamDecoder:
+    """Raw 16-bit mono PCM from the client, resampled incrementally if needed."""
+
+    def __init__(self, on_pcm, sample_rate):
+        self.on_pcm = on_pcm
+        self.sample_rate = sample_rate
+        self._state = None
+        self._remainder = b""
+
+    def feed(self, data):
+        data = self._remainder + data
+        usable = len(data) - len(data) % TARGET_SAMPLE_WIDTH
+        self._remainder = data[usable:]
+        frames = data[:usable]
+        if self.sample_rate != TARGET_SAMPLE_RATE:
+            frames, self._state = audioop.ratecv(
+                frames, TARGET_SAMPLE_WIDTH, 1, self.sample_rate, TARGET_SAMPLE_RATE, self._state)
+        if frames:
+            self.on_pcm(frames)
+
+    def finish(self, timeout):
+        pass
+
+    def abort(self):
+        pass
+
+
+class VoiceStream:
+    """Incrementally decodes one utterance into a ring buffer and watches for end of speech.
+
+    ``input_format`` is 'webm'/'ogg' (decoded by a streaming ffmpeg) or 'pcm' (16-bit mono at
+    ``sample_rate``). ``speech_ended`` is set as soon as the endpointer hears trailing silence,
+    by which point everything received so far has already been decoded.
+    """
+
+    def __init__(self, input_format="webm", sample_rate=TARGET_SAMPLE_RATE, max_seconds=60, endpointer=None):
+        self.buffer = PCMRingBuffer(TARGET_SAMPLE_RATE * TARGET_SAMPLE_WIDTH * max_seconds)
+        self.endpointer = endpointer or EnergyEndpointer()
+        self.speech_ended = threading.Event()
+        self.bytes_received = 0
+        self._lock = threading.Lock()
+        if input_format == "pcm":
+            self._decoder = _PCMStreamDecoder(self._on_pcm, sample_rate)
+        else:
+            self._decoder = _FFmpegStreamDecoder(self._on_pcm)
+
+    def _on_pcm(self, pcm):
+        with self._lock:
+            self.buffer.write(pcm)
+            if self.endpointer.feed(pcm) or self.buffer.overflowed:
+                self.speech_ended.set()
+
+    def feed(self, chunk):
+        self.bytes_received += len(chunk)
+        self._decoder.feed(chunk)
+
+    def finish(self, timeout=5.0):
+        """Flushes the decoder and returns the utterance PCM (16 kHz mono s16le)."""
+        self._decoder.finish(timeout)
+        with self._lock:
+            return self.buffer.getvalue()
+
+    def abort(self):
+        self._decoder.abort()
+
+    @property
+    def speech_detected(self):
+        return self.endpointer.speech_seen
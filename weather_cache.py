@@ -0,0 +1,183 @@
+import threading
+import time
+
+# Values returned by the fetchers when Open-Meteo could not be reached; never cached.
+FAILURE_MARKERS = ("Unavailable", "Error")
+
+
+def _coord_key(latitude, longitude, cell_degrees=0.0001):
+    """Snaps coordinates to the nearest point of a ``cell_degrees`` grid so nearby locations share one cache slot."""
+    return (round(round(float(latitude) / cell_degrees) * cell_degrees, 6),
+            round(round(float(longitude) / cell_degrees) * cell_degrees, 6))
+
+
+class _PendingFetch:
+    """A synchronous fetch other callers for the same key wait on instead of fetching too."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class WeatherCache:
+    """TTL cache for weather tuples with stale-while-revalidate.
+
+    Fresh entries (younger than ``ttl``) are served directly. Entries younger than
+    ``ttl + stale_ttl`` are still served, but trigger a background refresh of that
+    location. Anything older (or missing) is fetched synchronously, once: concurrent
+    callers for the same location wait for that fetch's result. Coordinates are
+    quantized to a ``cell_degrees`` grid and weather is fetched for the grid point, so
+    every user inside one cell shares a single entry.
+    """
+
+    def __init__(self, fetch_one, ttl=600, stale_ttl=1800, cell_degrees=0.0001):
+        self._fetch_one = fetch_one
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.cell_degrees = cell_degrees
+        self._entries = {}  # (lat, lon) -> (weather_tuple, fetched_at)
+        self._refreshing = set()
+        self._fetching = {}  # (lat, lon) -> _PendingFetch
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.refreshes = 0
+        self.fetch_errors = 0
+
+    def key(self, latitude, longitude):
+        """The grid point whose cache entry serves these coordinates."""
+        return _coord_key(latitude, longitude, self.cell_degrees)
+
+    def get(self, latitude, longitude):
+        """Returns the weather tuple for the coordinates, fetching only when needed."""
+        key = self.key(latitude, longitude)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, fetched_at = entry
+                age = now - fetched_at
+                if age < self.ttl:
+                    self.hits += 1
+                    return value
+                if age < self.ttl + self.stale_ttl:
+                    self.stale_hits += 1
+                    start_refresh = key not in self._refreshing
+                    if start_refresh:
+                        self._refreshing.add(key)
+                else:
+                    entry = None
+            if entry is None:
+                self.misses += 1
+                pending = self._fetching.get(key)
+                if pending is None:
+                    fetch = self._fetching[key] = _PendingFetch()
+                else:
+                    self.coalesced += 1
+
+        if entry is not None:
+            if start_refresh:
+                threading.Thread(target=self._refresh, args=(key,), daemon=True).start()
+            return value
+
+        if pending is not None:
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.value
+        try:
+            fetch.value = self._fetch_one(*key)
+            self.put(key[0], key[1], fetch.value)
+        except Exception as e:
+            fetch.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._fetching[key]
+            fetch.done.set()
+        return fetch.value
+
+    def _refresh(self, key):
+        try:
+            value = self._fetch_one(*key)
+            self.put(key[0], key[1], value)
+            with self._lock:
+                self.refreshes += 1
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def put(self, latitude, longitude, value):
+        """Stores a weather tuple unless it is one of the failure fallbacks."""
+        if value is None or value[0] in FAILURE_MARKERS:
+            with self._lock:
+                self.fetch_errors += 1
+            return False
+        with self._lock:
+            self._entries[self.key(latitude, longitude)] = (value, time.monotonic())
+        return True
+
+    def put_many(self, items):
+        """Stores ``((lat, lon), weather_tuple)`` pairs; returns how many were cached."""
+        return sum(1 for (lat, lon), value in items if self.put(lat, lon, value))
+
+    def stats(self):
+        """Returns hit/miss counters and entry ages in seconds."""
+        now = time.monotonic()
+        with self._lock:
+            ages = [now - fetched_at for _, fetched_at in self._entries.values()]
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "coalesced_misses": self.coalesced,
+                "hit_ratio": round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0.0,
+                "background_refreshes": self.refreshes,
+                "fetch_errors": self.fetch_errors,
+                "oldest_age_seconds": round(max(ages), 1) if ages else None,
+                "newest_age_seconds": round(min(ages), 1) if ages else None,
+                "ttl_seconds": self.ttl,
+                "stale_ttl_seconds": self.stale_ttl,
+                "cell_degrees": self.cell_degrees,
+            }
+
+
+class WeatherRefresher(threading.Thread):
+    """Daemon thread that re-fetches every known location in one bulk call."""
+
+    def __init__(self, cache, fetch_many, coordinates, interval):
+        super().__init__(name="weather-refresher", daemon=True)
+        self.cache = cache
+        self.fetch_many = fetch_many
+        self.coordinates = list(dict.fromkeys(coordinates))
+        self.interval = interval
+        self.last_run_seconds = None
+        self.last_stored = None
+        self._stop_event = threading.Event()
+
+    def refresh_once(self):
+        started = time.perf_counter()
+        results = self.fetch_many(self.coordinates)
+        stored = self.cache.put_many(zip(self.coordinates, results))
+        self.last_stored = stored
+        self.last_run_seconds = time.perf_counter() - started
+        print(f"🌦️ Weather prefetch stored {stored}/{len(self.coordinates)} locations in {self.last_run_seconds:.2f}s")
+        return stored
+
+    def run(self):
+        if self.last_run_seconds is not None: # refresh_once() already ran before start()
+            self._stop_event.wait(self.interval)
+        while not self._stop_event.is_set():
+            try:
+                self.refresh_once()
+            except Exception as e:
+                print(f"Error during weather prefetch: {e}")
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()